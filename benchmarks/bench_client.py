@@ -0,0 +1,62 @@
+"""
+Compara peticiones/s entre un httpx.AsyncClient por llamada (comportamiento
+anterior) y el ValhallaClient compartido con pool de conexiones.
+
+Uso:
+    PYTHONPATH=src python benchmarks/bench_client.py --requests 2000 --concurrency 32
+"""
+
+import argparse
+import asyncio
+import os
+import time
+
+import httpx
+
+from stub_server import StubServer
+
+PAYLOAD = {
+    "locations": [{"lat": 36.7213, "lon": -4.4214}, {"lat": 36.7300, "lon": -4.4100}],
+    "costing": "auto",
+    "units": "kilometers",
+}
+
+
+async def per_call_client(url: str) -> None:
+    async with httpx.AsyncClient() as client:
+        res = await client.post(f"{url}/route", json=PAYLOAD, timeout=15)
+        res.raise_for_status()
+        res.json()
+
+
+async def run(label: str, call, total: int, concurrency: int) -> None:
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with sem:
+            await call()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(total)))
+    elapsed = time.perf_counter() - start
+    print(f"{label:<16} {total / elapsed:10.1f} req/s  ({elapsed:.2f}s)")
+
+
+async def main(total: int, concurrency: int, latency: float) -> None:
+    with StubServer(latency=latency) as url:
+        os.environ["VALHALLA_URL"] = url
+        from valhalla.client import ValhallaClient
+        from valhalla.settings import Settings
+
+        await run("per-call client", lambda: per_call_client(url), total, concurrency)
+        async with ValhallaClient(Settings()) as client:
+            await run("pooled client", lambda: client.post("/route", PAYLOAD), total, concurrency)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.0)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.concurrency, args.latency))
@@ -0,0 +1,154 @@
+"""
+Retardo del bucle de eventos y latencia de cola con carga mixta, con y sin
+sacar las etapas de CPU del bucle (``CPU_EXECUTOR``).
+
+Cada modo corre en un proceso nuevo contra el stub (en otro proceso). Durante
+``--duration`` segundos:
+
+- unas tareas pesadas llaman a ``filter_by_location_polygon`` con muchos puntos
+  y a ``get_route`` con muchas paradas (respuesta JSON grande);
+- unas tareas ligeras piden rutas de dos puntos y miden su latencia;
+- un ticker duerme 1 ms en bucle y mide cuánto se retrasa en despertar.
+
+Uso:
+    PYTHONPATH=src python benchmarks/bench_offload.py
+    PYTHONPATH=src python benchmarks/bench_offload.py --executors inline process --points 500000
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+from bench_suite import _serve_stub
+
+TICK = 0.001
+
+
+async def _drive(args: argparse.Namespace) -> dict:
+    import numpy as np
+
+    from valhalla.coordinates import CoordinateArray
+    from valhalla.entities import Coordinate
+    from valhalla.stats import LatencyHistogram
+    from valhalla.valhalla import filter_by_location_polygon, get_route
+
+    rng = random.Random(args.seed)
+    np_rng = np.random.default_rng(args.seed)
+
+    def point() -> Coordinate:
+        return Coordinate(lat=36.70 + rng.random() * 0.1, lng=-4.45 + rng.random() * 0.1)
+
+    points = CoordinateArray(
+        lat=36.70 + np_rng.random(args.points) * 0.3,
+        lng=-4.45 + np_rng.random(args.points) * 0.3,
+    )
+    long_route = [point() for _ in range(args.route_stops)]
+
+    lag = LatencyHistogram()
+    light = LatencyHistogram()
+    heavy_calls = 0
+    deadline = time.perf_counter() + args.duration
+
+    async def ticker() -> None:
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            await asyncio.sleep(TICK)
+            lag.observe(max(time.perf_counter() - start - TICK, 0.0))
+
+    async def heavy(i: int) -> None:
+        nonlocal heavy_calls
+        while time.perf_counter() < deadline:
+            if i % 2:
+                await filter_by_location_polygon(point(), 10, points)
+            else:
+                await get_route(long_route)
+            heavy_calls += 1
+
+    async def light_calls() -> None:
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            await get_route([point(), point()], projection='summary')
+            light.observe(time.perf_counter() - start)
+
+    # Calentamiento: conexiones y procesos del pool
+    await asyncio.gather(get_route(long_route), filter_by_location_polygon(point(), 10, points))
+    deadline = time.perf_counter() + args.duration
+    await asyncio.gather(
+        ticker(),
+        *(heavy(i) for i in range(args.heavy)),
+        *(light_calls() for _ in range(args.light)),
+    )
+    return {
+        "executor": os.environ["CPU_EXECUTOR"],
+        "lag_p50": lag.percentile(50),
+        "lag_p99": lag.percentile(99),
+        "lag_max": lag.max,
+        "light_p50": light.percentile(50),
+        "light_p99": light.percentile(99),
+        "light_calls": light.count,
+        "heavy_calls": heavy_calls,
+    }
+
+
+def _run_mode(queue, executor: str, args: argparse.Namespace) -> None:
+    os.environ["CPU_EXECUTOR"] = executor
+    from valhalla.offload import get_cpu_executor
+
+    try:
+        queue.put(asyncio.run(_drive(args)))
+    finally:
+        get_cpu_executor().shutdown()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Event-loop lag with and without CPU offloading")
+    parser.add_argument("--executors", nargs="+", default=["inline", "thread", "process"])
+    parser.add_argument("--duration", type=float, default=5.0, help="Seconds per mode")
+    parser.add_argument("--points", type=int, default=200_000, help="Points per isochrone filter")
+    parser.add_argument("--route-stops", type=int, default=300, help="Stops of the long route")
+    parser.add_argument("--heavy", type=int, default=4, help="Concurrent heavy callers")
+    parser.add_argument("--light", type=int, default=16, help="Concurrent light callers")
+    parser.add_argument("--latency", type=float, default=0.002, help="Stub seconds per request")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", help="Write the results as JSON")
+    args = parser.parse_args()
+
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    stub = ctx.Process(target=_serve_stub, args=(queue, args.latency, 0.0, None, args.seed), daemon=True)
+    stub.start()
+    os.environ["VALHALLA_URL"] = queue.get(timeout=30)
+    os.environ["ROUTE_CACHE_ENABLED"] = "false"
+    os.environ["ISOCHRONE_CACHE_ENABLED"] = "false"
+
+    results = []
+    try:
+        for executor in args.executors:
+            # Proceso no daemon (no vale Pool): el modo 'process' necesita crear hijos
+            worker = ctx.Process(target=_run_mode, args=(queue, executor, args))
+            worker.start()
+            result = queue.get()
+            worker.join()
+            results.append(result)
+            print(
+                f"{executor:<8} loop lag p50 {result['lag_p50'] * 1000:6.1f} ms "
+                f"p99 {result['lag_p99'] * 1000:6.1f} ms max {result['lag_max'] * 1000:6.1f} ms | "
+                f"light p50 {result['light_p50'] * 1000:6.1f} ms p99 {result['light_p99'] * 1000:6.1f} ms "
+                f"({result['light_calls']} calls) | heavy {result['heavy_calls']} calls",
+                file=sys.stderr,
+            )
+    finally:
+        stub.terminate()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Tiempo de parseo y pico de memoria de un Trip grande con cada proyección.
+
+Uso:
+    PYTHONPATH=../src python bench_parsing.py --legs 200 --maneuvers 60
+"""
+
+import argparse
+import json
+import os
+import time
+import tracemalloc
+
+os.environ.setdefault("VALHALLA_URL", "http://localhost:8002")
+
+from stub_server import route_response  # noqa: E402
+from valhalla.entities import Trip  # noqa: E402
+from valhalla.parsing import parse_trip  # noqa: E402
+
+
+def build_fixture(legs: int, maneuvers: int) -> bytes:
+    locations = [{"lat": 36.7 + i * 0.001, "lon": -4.4 + i * 0.001} for i in range(legs + 1)]
+    data = route_response({"locations": locations})
+    for leg in data["trip"]["legs"]:
+        template = leg["maneuvers"][0]
+        leg["maneuvers"] = [
+            {
+                **template,
+                "instruction": f"Turn right onto Calle {i}.",
+                "verbal_pre_transition_instruction": f"Turn right onto Calle {i}.",
+                "verbal_post_transition_instruction": "Continue for 200 meters.",
+                "street_names": [f"Calle {i}", "Avenida"],
+                "bearing_before": 90.0,
+                "bearing_after": 180.0,
+                "sign": {"exit_toward_elements": [{"text": "Centro", "consecutive_count": 1}]},
+            }
+            for i in range(maneuvers)
+        ]
+    return json.dumps(data).encode()
+
+
+def measure(label: str, fn, repeat: int) -> None:
+    fn()  # calentamiento
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    elapsed = (time.perf_counter() - start) / repeat
+    tracemalloc.start()
+    result = fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    print(f"{label:<22} {elapsed * 1000:9.2f} ms  peak {peak / 1024 / 1024:8.2f} MiB")
+
+
+def main(legs: int, maneuvers: int, repeat: int) -> None:
+    raw = build_fixture(legs, maneuvers)
+    print(f"fixture: {legs} legs x {maneuvers} maneuvers, {len(raw) / 1024 / 1024:.1f} MiB")
+    measure("dict + Trip(**)", lambda: Trip(**json.loads(raw)["trip"]), repeat)
+    measure("full", lambda: parse_trip(raw, "full"), repeat)
+    measure("lazy", lambda: parse_trip(raw, "lazy"), repeat)
+    measure("lazy + maneuvers", lambda: parse_trip(raw, "lazy").legs[0].maneuvers, repeat)
+    measure("shapes", lambda: parse_trip(raw, "shapes"), repeat)
+    measure("summary", lambda: parse_trip(raw, "summary"), repeat)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--legs", type=int, default=200)
+    parser.add_argument("--maneuvers", type=int, default=60)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    main(args.legs, args.maneuvers, args.repeat)
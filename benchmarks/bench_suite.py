@@ -0,0 +1,264 @@
+"""
+Batería de benchmarks reproducible contra el stub de Valhalla.
+
+Lanza ``get_optimal_route`` y ``filter_by_location_polygon`` con varios niveles de
+concurrencia y tamaños de payload, y guarda en JSON el throughput, las latencias
+p50/p95/p99 y el pico de RSS de cada escenario. El stub corre en otro proceso y
+cada escenario en un proceso nuevo, para que ni el stub ni los escenarios
+anteriores cuenten en el RSS. Las cachés se desactivan salvo con ``--cache``.
+
+Uso:
+    PYTHONPATH=src python benchmarks/bench_suite.py run -o base.json --latency 0.002
+    PYTHONPATH=src python benchmarks/bench_suite.py run -o new.json --latency 0.002
+    PYTHONPATH=src python benchmarks/bench_suite.py compare base.json new.json --threshold 0.1
+
+``compare`` termina con código 1 si algún escenario empeora más del umbral.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import time
+from dataclasses import asdict, dataclass
+
+from stub_server import StubServer
+
+DEFAULT_CONCURRENCY = [1, 16, 64]
+# Tamaño: número de paradas de la ruta o de puntos a filtrar
+DEFAULT_SIZES = {
+    "optimal_route": [5, 25],
+    "filter_polygon": [100, 5000],
+}
+WARMUP_CALLS = 5
+
+
+@dataclass
+class Scenario:
+    function: str
+    size: int
+    concurrency: int
+    calls: int
+    seed: int
+
+    @property
+    def name(self) -> str:
+        return f"{self.function}/size={self.size}/c={self.concurrency}"
+
+
+def _serve_stub(queue, latency: float, error_rate: float, fixtures: str | None, seed: int) -> None:
+    server = StubServer(latency=latency, error_rate=error_rate, fixtures=fixtures, seed=seed)
+    queue.put(server.url)
+    server.server.serve_forever()
+
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux da KiB y macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+async def _drive(scenario: Scenario) -> dict:
+    from valhalla.entities import Coordinate
+    from valhalla.stats import LatencyHistogram
+    from valhalla.valhalla import filter_by_location_polygon, get_optimal_route
+
+    rng = random.Random(scenario.seed)
+
+    def point() -> Coordinate:
+        return Coordinate(lat=36.70 + rng.random() * 0.1, lng=-4.45 + rng.random() * 0.1)
+
+    if scenario.function == "optimal_route":
+        def make_call():
+            locations = [point() for _ in range(scenario.size)]
+            return lambda: get_optimal_route(locations)
+    else:
+        def make_call():
+            center, points = point(), [point() for _ in range(scenario.size)]
+            return lambda: filter_by_location_polygon(center, 10, points)
+
+    calls = [make_call() for _ in range(scenario.calls + WARMUP_CALLS)]
+    for call in calls[:WARMUP_CALLS]:
+        await call()
+
+    latency = LatencyHistogram()
+    errors = 0
+    sem = asyncio.Semaphore(scenario.concurrency)
+
+    async def one(call) -> None:
+        nonlocal errors
+        async with sem:
+            start = time.perf_counter()
+            try:
+                # filter_by_location_polygon devuelve [] si falla: no se puede contar
+                if await call() is None:
+                    errors += 1
+            except Exception:
+                errors += 1
+            latency.observe(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(call) for call in calls[WARMUP_CALLS:]))
+    elapsed = time.perf_counter() - start
+    return {
+        "name": scenario.name,
+        **asdict(scenario),
+        "errors": errors,
+        "elapsed": elapsed,
+        "throughput": scenario.calls / elapsed,
+        "p50": latency.percentile(50),
+        "p95": latency.percentile(95),
+        "p99": latency.percentile(99),
+        "max": latency.max,
+    }
+
+
+def _run_scenario(scenario: Scenario) -> dict:
+    # Con --error-rate los fallos se registran en cada llamada
+    logging.disable(logging.CRITICAL)
+    result = asyncio.run(_drive(scenario))
+    result["peak_rss_mb"] = _peak_rss_mb()
+    return result
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args: argparse.Namespace) -> None:
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    stub = ctx.Process(
+        target=_serve_stub,
+        args=(queue, args.latency, args.error_rate, args.fixtures, args.seed),
+        daemon=True,
+    )
+    stub.start()
+    url = queue.get(timeout=30)
+
+    # Los procesos de los escenarios heredan el entorno
+    os.environ["VALHALLA_URL"] = url
+    if not args.cache:
+        os.environ["ROUTE_CACHE_ENABLED"] = "false"
+        os.environ["ISOCHRONE_CACHE_ENABLED"] = "false"
+
+    functions = args.functions or list(DEFAULT_SIZES)
+    scenarios = [
+        Scenario(function, size, concurrency, args.calls, args.seed)
+        for function in functions
+        for size in (args.sizes or DEFAULT_SIZES[function])
+        for concurrency in args.concurrency
+    ]
+    results = []
+    try:
+        for scenario in scenarios:
+            with ctx.Pool(1) as pool:
+                result = pool.apply(_run_scenario, (scenario,))
+            results.append(result)
+            print(
+                f"{result['name']:<36} {result['throughput']:9.1f} calls/s "
+                f"p50 {result['p50'] * 1000:7.1f} ms p95 {result['p95'] * 1000:7.1f} ms "
+                f"p99 {result['p99'] * 1000:7.1f} ms rss {result['peak_rss_mb']:6.1f} MiB "
+                f"errors {result['errors']}",
+                file=sys.stderr,
+            )
+    finally:
+        stub.terminate()
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "latency": args.latency,
+            "error_rate": args.error_rate,
+            "fixtures": args.fixtures,
+            "cache": args.cache,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {len(results)} scenarios to {args.output}", file=sys.stderr)
+
+
+# Métrica -> True si más alto es mejor
+COMPARED_METRICS = {"throughput": True, "p50": False, "p95": False, "p99": False, "peak_rss_mb": False}
+
+
+def compare(args: argparse.Namespace) -> int:
+    with open(args.base) as f:
+        base = {r["name"]: r for r in json.load(f)["results"]}
+    with open(args.new) as f:
+        new = {r["name"]: r for r in json.load(f)["results"]}
+
+    regressions = []
+    print(f"{'scenario':<36} {'metric':<12} {'base':>10} {'new':>10} {'change':>8}")
+    for name in sorted(base.keys() & new.keys()):
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            old, cur = base[name][metric], new[name][metric]
+            change = (cur - old) / old if old else 0.0
+            worse = -change if higher_is_better else change
+            # Diferencias de latencia por debajo del ruido no cuentan
+            if metric in ("p50", "p95", "p99") and abs(cur - old) < args.min_latency_ms / 1000:
+                worse = 0.0
+            flag = "REGRESSION" if worse > args.threshold else ""
+            if flag:
+                regressions.append((name, metric))
+            print(f"{name:<36} {metric:<12} {old:10.4g} {cur:10.4g} {change:+8.1%} {flag}")
+    for name in sorted(base.keys() ^ new.keys()):
+        print(f"{name:<36} only in {'base' if name in base else 'new'}")
+
+    print(f"\n{len(regressions)} regressions over {args.threshold:.0%}")
+    return 1 if regressions else 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Valhalla benchmark suite")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = sub.add_parser("run", help="Run the scenarios and write a JSON report")
+    run_parser.add_argument("-o", "--output", default="bench_results.json")
+    run_parser.add_argument("--calls", type=int, default=200, help="Calls per scenario")
+    run_parser.add_argument("--concurrency", type=int, nargs="+", default=DEFAULT_CONCURRENCY)
+    run_parser.add_argument("--sizes", type=int, nargs="+", help="Override payload sizes")
+    run_parser.add_argument("--functions", nargs="+", choices=list(DEFAULT_SIZES))
+    run_parser.add_argument("--latency", type=float, default=0.002, help="Stub seconds per request")
+    run_parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of stub 503s")
+    run_parser.add_argument("--fixtures", help="Directory with recorded responses")
+    run_parser.add_argument("--cache", action="store_true", help="Keep the route/isochrone caches")
+    run_parser.add_argument("--seed", type=int, default=0)
+
+    compare_parser = sub.add_parser("compare", help="Flag regressions between two reports")
+    compare_parser.add_argument("base")
+    compare_parser.add_argument("new")
+    compare_parser.add_argument(
+        "--threshold", type=float, default=0.10, help="Relative change flagged as regression"
+    )
+    compare_parser.add_argument(
+        "--min-latency-ms", type=float, default=0.5, help="Ignore smaller latency differences"
+    )
+
+    args = parser.parse_args()
+    if args.command == "run":
+        run(args)
+    else:
+        sys.exit(compare(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Prueba de carga del servicio HTTP (valhalla.api) contra el stub de Valhalla.
+
+Arranca el stub y la API en el mismo proceso y lanza peticiones mezcladas de
+ruta, ruta optimizada, isócrona y matriz con la concurrencia indicada.
+
+Uso:
+    PYTHONPATH=../src python load_test.py --requests 2000 --concurrency 64 --max-in-flight 32
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import time
+from collections import Counter
+
+import httpx
+
+from stub_server import StubServer
+
+REQUESTS = ["/route", "/optimized-route", "/isochrone-filter", "/matrix"]
+
+
+def _point(rng: random.Random) -> dict:
+    return {"lat": 36.70 + rng.random() * 0.1, "lng": -4.45 + rng.random() * 0.1}
+
+
+def make_body(path: str, rng: random.Random) -> dict:
+    if path in ("/route", "/optimized-route"):
+        return {"locations": [_point(rng) for _ in range(rng.randint(2, 6))]}
+    if path == "/isochrone-filter":
+        return {"center": _point(rng), "minutes": 10, "points": [_point(rng) for _ in range(200)]}
+    return {"locations": [_point(rng) for _ in range(10)]}
+
+
+async def run_load(api_url: str, total: int, concurrency: int, seed: int) -> None:
+    from valhalla.stats import LatencyHistogram
+
+    rng = random.Random(seed)
+    statuses: Counter[int] = Counter()
+    latency = LatencyHistogram()
+    sem = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=api_url, limits=limits, timeout=30) as client:
+
+        async def one() -> None:
+            path = rng.choice(REQUESTS)
+            body = make_body(path, rng)
+            async with sem:
+                start = time.perf_counter()
+                res = await client.post(path, json=body)
+                latency.observe(time.perf_counter() - start)
+            statuses[res.status_code] += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(total)))
+        elapsed = time.perf_counter() - start
+        metrics = (await client.get("/metrics")).text
+
+    print(f"requests: {total} in {elapsed:.2f}s -> {total / elapsed:.1f} req/s")
+    print(f"status codes: {dict(sorted(statuses.items()))}")
+    s = latency.summary()
+    print(
+        f"latency p50: {s['p50'] * 1000:.1f} ms p95: {s['p95'] * 1000:.1f} ms "
+        f"p99: {s['p99'] * 1000:.1f} ms max: {s['max'] * 1000:.1f} ms"
+    )
+    for line in metrics.splitlines():
+        if line.startswith(("valhalla_api_rejected", "valhalla_cache_events")):
+            print(line)
+
+
+async def main(args: argparse.Namespace) -> None:
+    with StubServer(latency=args.latency) as valhalla_url:
+        os.environ["VALHALLA_URL"] = valhalla_url
+        import uvicorn
+
+        from valhalla.api import create_app
+
+        config = uvicorn.Config(
+            create_app(max_in_flight=args.max_in_flight),
+            host="127.0.0.1",
+            port=args.port,
+            log_level="warning",
+        )
+        server = uvicorn.Server(config)
+        serve = asyncio.create_task(server.serve())
+        while not server.started:
+            await asyncio.sleep(0.05)
+        try:
+            await run_load(f"http://127.0.0.1:{args.port}", args.requests, args.concurrency, args.seed)
+        finally:
+            server.should_exit = True
+            await serve
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--max-in-flight", type=int, default=32)
+    parser.add_argument("--latency", type=float, default=0.005, help="Stub seconds per request")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--seed", type=int, default=0)
+    main_args = parser.parse_args()
+    asyncio.run(main(main_args))
@@ -0,0 +1,71 @@
+"""
+Graba respuestas de un Valhalla real para servirlas desde el stub.
+
+Escribe un fichero ``<endpoint>.jsonl`` por endpoint con una respuesta por línea,
+que ``StubServer(fixtures=...)`` reparte entre las peticiones que recibe.
+
+Uso:
+    python benchmarks/record_fixtures.py --url http://localhost:8002 --out benchmarks/fixtures \\
+        --center 36.72,-4.42 --count 20
+"""
+
+import argparse
+import json
+import os
+import random
+
+import httpx
+
+
+def _point(rng: random.Random, lat: float, lon: float, spread: float) -> dict:
+    return {"lat": lat + (rng.random() - 0.5) * spread, "lon": lon + (rng.random() - 0.5) * spread}
+
+
+def payloads(path: str, rng: random.Random, lat: float, lon: float, spread: float) -> dict:
+    if path == "/isochrone":
+        return {
+            "locations": [_point(rng, lat, lon, spread)],
+            "costing": "auto",
+            "contours": [{"time": t} for t in (5, 10, 15, 20)],
+            "polygons": True,
+        }
+    if path == "/sources_to_targets":
+        points = [_point(rng, lat, lon, spread) for _ in range(10)]
+        return {"sources": points, "targets": points, "costing": "auto"}
+    return {
+        "locations": [_point(rng, lat, lon, spread) for _ in range(rng.randint(3, 10))],
+        "costing": "auto",
+        "units": "kilometers",
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Record Valhalla responses as stub fixtures")
+    parser.add_argument("--url", required=True, help="Real Valhalla URL")
+    parser.add_argument("--out", default="benchmarks/fixtures")
+    parser.add_argument("--center", default="36.72,-4.42", help="lat,lon of the area")
+    parser.add_argument("--spread", type=float, default=0.1, help="Degrees around the center")
+    parser.add_argument("--count", type=int, default=20, help="Responses per endpoint")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    lat, lon = map(float, args.center.split(","))
+    rng = random.Random(args.seed)
+    os.makedirs(args.out, exist_ok=True)
+    with httpx.Client(base_url=args.url, timeout=60) as client:
+        for path in ("/isochrone", "/route", "/optimized_route", "/sources_to_targets"):
+            recorded = 0
+            with open(os.path.join(args.out, f"{path.strip('/')}.jsonl"), "w") as f:
+                for _ in range(args.count):
+                    res = client.post(path, json=payloads(path, rng, lat, lon, args.spread))
+                    if res.status_code != 200:
+                        continue
+                    # Una respuesta por línea, sin espacios
+                    f.write(json.dumps(res.json(), separators=(",", ":")))
+                    f.write("\n")
+                    recorded += 1
+            print(f"{path}: {recorded} responses")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,303 @@
+"""
+Servidor HTTP mínimo que imita a Valhalla para benchmarks locales.
+
+Responde a /isochrone, /route, /optimized_route, /trace_route y /sources_to_targets con respuestas sintéticas
+construidas a partir del payload, sin necesidad de tener tiles descargados, o con respuestas
+grabadas de un Valhalla real (ver record_fixtures.py).
+"""
+
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import polyline
+
+
+def isochrone_response(payload: dict) -> dict:
+    loc = payload["locations"][0]
+    features = []
+    for contour in payload.get("contours", []):
+        # Cuadrado alrededor del centro, ~1 km por minuto
+        d = contour["time"] / 111.0
+        ring = [
+            [loc["lon"] - d, loc["lat"] - d],
+            [loc["lon"] + d, loc["lat"] - d],
+            [loc["lon"] + d, loc["lat"] + d],
+            [loc["lon"] - d, loc["lat"] + d],
+            [loc["lon"] - d, loc["lat"] - d],
+        ]
+        features.append(
+            {
+                "type": "Feature",
+                "properties": {"contour": contour["time"], "metric": "time"},
+                "geometry": {"type": "Polygon", "coordinates": [ring]},
+            }
+        )
+    return {"type": "FeatureCollection", "features": features}
+
+
+def _summary(points: list[dict], length: float) -> dict:
+    lats = [p["lat"] for p in points]
+    lons = [p["lon"] for p in points]
+    return {
+        "has_time_restrictions": False,
+        "has_toll": False,
+        "has_highway": False,
+        "has_ferry": False,
+        "min_lat": min(lats),
+        "min_lon": min(lons),
+        "max_lat": max(lats),
+        "max_lon": max(lons),
+        "time": length * 60,
+        "length": length,
+        "cost": length * 60,
+    }
+
+
+def route_response(payload: dict) -> dict:
+    locations = payload["locations"]
+    legs = []
+    total = 0.0
+    for a, b in zip(locations, locations[1:]):
+        length = _distance_km(a, b)
+        total += length
+        shape = polyline.encode(
+            [(a["lat"], a["lon"]), (b["lat"], b["lon"])], precision=6
+        )
+        maneuver = {
+            "type": 1,
+            "instruction": "Drive.",
+            "time": length * 60,
+            "length": length,
+            "cost": length * 60,
+            "begin_shape_index": 0,
+            "end_shape_index": 1,
+            "travel_mode": "drive",
+            "travel_type": "car",
+        }
+        legs.append({"maneuvers": [maneuver], "summary": _summary([a, b], length), "shape": shape})
+    return {
+        "trip": {
+            "locations": [
+                {"type": "break", "lat": loc["lat"], "lon": loc["lon"], "original_index": i}
+                for i, loc in enumerate(locations)
+            ],
+            "legs": legs,
+            "summary": _summary(locations, total),
+            "status_message": "Found route between points",
+            "status": 0,
+            "units": payload.get("units", "kilometers"),
+            "language": "en-US",
+        }
+    }
+
+
+def trace_route_response(payload: dict) -> dict:
+    # Sin red que ajustar: cada pierna sigue los puntos entre dos "break"
+    points = payload["shape"]
+    breaks = [0] + [i for i, p in enumerate(points[1:-1], 1) if p.get("type") == "break"]
+    breaks.append(len(points) - 1)
+    legs = []
+    total = 0.0
+    for start, end in zip(breaks, breaks[1:]):
+        leg_points = points[start:end + 1]
+        length = sum(_distance_km(a, b) for a, b in zip(leg_points, leg_points[1:]))
+        total += length
+        shape = polyline.encode([(p["lat"], p["lon"]) for p in leg_points], precision=6)
+        maneuvers = [
+            {
+                "type": 1,
+                "instruction": "Drive.",
+                "time": length * 60,
+                "length": length,
+                "cost": length * 60,
+                "begin_shape_index": 0,
+                "end_shape_index": len(leg_points) - 1,
+                "travel_mode": "drive",
+                "travel_type": "car",
+            },
+            {
+                "type": 4,
+                "instruction": "You have arrived at your destination.",
+                "time": 0.0,
+                "length": 0.0,
+                "cost": 0.0,
+                "begin_shape_index": len(leg_points) - 1,
+                "end_shape_index": len(leg_points) - 1,
+                "travel_mode": "drive",
+                "travel_type": "car",
+            },
+        ]
+        legs.append({"maneuvers": maneuvers, "summary": _summary(leg_points, length), "shape": shape})
+    return {
+        "trip": {
+            "locations": [
+                {"type": "break", "lat": points[i]["lat"], "lon": points[i]["lon"], "original_index": i}
+                for i in breaks
+            ],
+            "legs": legs,
+            "summary": _summary(points, total),
+            "status_message": "Found route between points",
+            "status": 0,
+            "units": payload.get("units", "kilometers"),
+            "language": "en-US",
+        }
+    }
+
+
+def _distance_km(a: dict, b: dict) -> float:
+    return abs(a["lat"] - b["lat"]) * 111 + abs(a["lon"] - b["lon"]) * 90
+
+
+def matrix_response(payload: dict) -> dict:
+    rows = []
+    for i, s in enumerate(payload["sources"]):
+        row = []
+        for j, t in enumerate(payload["targets"]):
+            length = _distance_km(s, t)
+            row.append({"from_index": i, "to_index": j, "time": length * 60, "distance": length})
+        rows.append(row)
+    return {"sources_to_targets": rows, "units": payload.get("units", "kilometers")}
+
+
+HANDLERS = {
+    "/isochrone": isochrone_response,
+    "/route": route_response,
+    "/optimized_route": route_response,
+    "/trace_route": trace_route_response,
+    "/sources_to_targets": matrix_response,
+}
+
+
+def load_fixtures(directory: str) -> dict[str, list[bytes]]:
+    """
+    Recorded responses by path: ``route.jsonl`` holds the /route responses, one
+    per line, and so on. Paths without a file keep the synthetic responses.
+    """
+    fixtures = {}
+    for path in HANDLERS:
+        file = os.path.join(directory, f"{path.strip('/')}.jsonl")
+        if os.path.exists(file):
+            with open(file, "rb") as f:
+                fixtures[path] = [line.rstrip(b"\n") for line in f if line.strip()]
+    return fixtures
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Cabeceras y cuerpo van en writes separados: sin esto Nagle + ACK retardado suman ~40 ms
+    disable_nagle_algorithm = True
+    latency: float = 0.0
+    error_rate: float = 0.0
+    fixtures: dict[str, list[bytes]] = {}
+    rng: random.Random = random.Random(0)
+    lock = threading.Lock()
+
+    def do_POST(self):
+        handler = HANDLERS.get(self.path)
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        if handler is None:
+            self._send(404, {"error": "unknown path"})
+            return
+        with self.lock:
+            fail = self.error_rate and self.rng.random() < self.error_rate
+            recorded = self.fixtures.get(self.path)
+            raw = recorded[self.rng.randrange(len(recorded))] if recorded else None
+        if self.latency:
+            time.sleep(self.latency)
+        if fail:
+            self._send(503, {"error": "injected failure"})
+        elif raw is not None:
+            self._send_raw(200, raw)
+        else:
+            self._send(200, handler(payload))
+
+    def _send(self, status: int, body: dict) -> None:
+        self._send_raw(status, json.dumps(body).encode())
+
+    def _send_raw(self, status: int, raw: bytes) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def log_message(self, *args):
+        pass
+
+
+class StubServer:
+    """
+    Valhalla stub running on a background thread.
+
+    Usage:
+        with StubServer(latency=0.002, error_rate=0.01) as url:
+            ...
+
+    ``error_rate`` is the fraction of requests answered with a 503; failures are
+    drawn from a generator seeded with ``seed`` so runs are reproducible.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.0,
+        error_rate: float = 0.0,
+        fixtures: str | None = None,
+        seed: int = 0,
+    ):
+        handler = type(
+            "Handler",
+            (StubHandler,),
+            {
+                "latency": latency,
+                "error_rate": error_rate,
+                "fixtures": load_fixtures(fixtures) if fixtures else {},
+                "rng": random.Random(seed),
+                "lock": threading.Lock(),
+            },
+        )
+        self.server = ThreadingHTTPServer((host, port), handler)
+        self.server.daemon_threads = True
+        # Los clientes cortan conexiones a propósito (hedging, timeouts)
+        self.server.handle_error = lambda request, client_address: None
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self) -> str:
+        self.thread.start()
+        return self.url
+
+    def __exit__(self, *exc_info) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Valhalla stub server")
+    parser.add_argument("--port", type=int, default=8002)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds per request")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of 503s")
+    parser.add_argument("--fixtures", help="Directory with recorded responses")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    server = StubServer(
+        port=args.port,
+        latency=args.latency,
+        error_rate=args.error_rate,
+        fixtures=args.fixtures,
+        seed=args.seed,
+    )
+    print(f"Serving Valhalla stub on {server.url}")
+    server.server.serve_forever()
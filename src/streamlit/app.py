@@ -1,10 +1,142 @@
 import streamlit as st
 import folium
+from folium.plugins import FastMarkerCluster
 from streamlit_folium import st_folium
 import asyncio
-import polyline
+import io
+import threading
+import numpy as np
+from valhalla.client import ValhallaClient, set_default_client
+from valhalla.coordinates import CoordinateArray
 from valhalla.entities import Coordinate
-from valhalla.valhalla import get_optimal_route, filter_by_location_polygon
+from valhalla.incremental import IncrementalRoute
+from valhalla.reachability import reachable_indices
+from valhalla.shapes import decode_polyline
+from valhalla.valhalla import get_optimal_route, settings
+
+# Centro inicial del mapa (Málaga)
+MAP_CENTER = [36.7213, -4.4214]
+# A partir de aquí los puntos se agrupan en clusters en lugar de dibujarse uno a uno
+CLUSTER_THRESHOLD = 500
+LEG_COLORS = [
+    'blue', 'red', 'green', 'purple', 'orange', 'darkred', 'lightred',
+    'beige', 'darkblue', 'darkgreen', 'cadetblue', 'darkpurple', 'pink'
+]
+# Marcador de cada punto dentro del cluster: fila [lat, lng, color, tooltip, popup]
+POINT_CALLBACK = """
+function (row) {
+    var marker = L.circleMarker(new L.LatLng(row[0], row[1]), {
+        radius: 8, color: row[2], fillColor: row[2], fillOpacity: 0.7, weight: 2
+    });
+    marker.bindTooltip(row[3]);
+    marker.bindPopup(row[4]);
+    return marker;
+}
+"""
+
+
+@st.cache_resource
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    # Un único bucle en segundo plano para todos los reruns: el cliente HTTP,
+    # sus conexiones y las cachés de rutas e isócronas se reutilizan
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name="valhalla-loop", daemon=True).start()
+    return loop
+
+
+def run(coro):
+    # Ejecuta la corrutina en el bucle compartido y espera su resultado
+    return asyncio.run_coroutine_threadsafe(coro, get_event_loop()).result()
+
+
+@st.cache_resource
+def get_client(url: str) -> ValhallaClient:
+    return ValhallaClient(settings.model_copy(update={"valhalla_url": url}))
+
+
+def use_client(url: str) -> None:
+    # set_default_client tiene que ejecutarse dentro del bucle que usa el cliente
+    get_event_loop().call_soon_threadsafe(set_default_client, get_client(url))
+
+
+@st.cache_data(max_entries=32)
+def route_layer_data(legs: tuple[tuple[int, str, float, float], ...]) -> dict:
+    # GeoJSON de las piernas (índice, shape, km, segundos), decodificadas una vez por ruta
+    features = []
+    for i, shape, length, time in legs:
+        coords = decode_polyline(shape)
+        features.append({
+            "type": "Feature",
+            "geometry": {"type": "LineString", "coordinates": coords[:, ::-1].tolist()},
+            "properties": {
+                "color": LEG_COLORS[i % len(LEG_COLORS)],
+                "tooltip": f"Pierna {i + 1}",
+                "popup": (
+                    f"Pierna {i + 1}<br>"
+                    f"Distancia: {length:.2f} km<br>"
+                    f"Tiempo: {time/60:.1f} min"
+                ),
+            },
+        })
+    return {"type": "FeatureCollection", "features": features}
+
+
+@st.cache_data(max_entries=32)
+def points_layer_data(points: np.ndarray, reachable: np.ndarray | None) -> list[list]:
+    # Una fila [lat, lng, color, tooltip, popup] por punto; el estado sale de
+    # una máscara por índice en lugar de comparar cada punto con los filtrados
+    if reachable is None:
+        styles = [('blue', "Punto a verificar", "⏱️ Pendiente de cálculo")] * len(points)
+    else:
+        inside = np.zeros(len(points), dtype=bool)
+        inside[reachable] = True
+        styles = [
+            ('green', "Alcanzable", "✅ Dentro del alcance") if is_inside
+            else ('red', "No alcanzable", "❌ Fuera del alcance")
+            for is_inside in inside.tolist()
+        ]
+    return [[lat, lng, *style] for (lat, lng), style in zip(points.tolist(), styles)]
+
+
+@st.cache_data(max_entries=8)
+def load_points(data: bytes) -> list[dict]:
+    table = np.genfromtxt(io.BytesIO(data), delimiter=",", usecols=(0, 1), ndmin=2)
+    # La cabecera y las filas no numéricas quedan como NaN
+    table = table[~np.isnan(table).any(axis=1)]
+    return [{'lat': lat, 'lng': lng} for lat, lng in table.tolist()]
+
+
+def location_array(locations: list[dict]) -> np.ndarray:
+    coords = np.array([(loc['lat'], loc['lng']) for loc in locations], dtype=np.float64)
+    return coords.reshape(-1, 2)
+
+
+def add_points(layer: folium.FeatureGroup, rows: list[list]) -> None:
+    if len(rows) > CLUSTER_THRESHOLD:
+        FastMarkerCluster(rows, callback=POINT_CALLBACK).add_to(layer)
+        return
+    # Pocos puntos: una sola capa GeoJSON de círculos, pintada en canvas
+    folium.GeoJson(
+        {
+            "type": "FeatureCollection",
+            "features": [
+                {
+                    "type": "Feature",
+                    "geometry": {"type": "Point", "coordinates": [lng, lat]},
+                    "properties": {"color": color, "tooltip": tooltip, "popup": popup},
+                }
+                for lat, lng, color, tooltip, popup in rows
+            ],
+        },
+        marker=folium.CircleMarker(radius=8, fill=True, fill_opacity=0.7, weight=2),
+        style_function=lambda feature: {
+            "color": feature["properties"]["color"],
+            "fillColor": feature["properties"]["color"],
+        },
+        tooltip=folium.GeoJsonTooltip(fields=["tooltip"], labels=False),
+        popup=folium.GeoJsonPopup(fields=["popup"], labels=False),
+    ).add_to(layer)
+
 
 # Configuración de la página
 st.set_page_config(
@@ -23,16 +155,21 @@ if 'polygon_center' not in st.session_state:
     st.session_state.polygon_center = None
 if 'route_result' not in st.session_state:
     st.session_state.route_result = None
-if 'filtered_coords' not in st.session_state:
-    st.session_state.filtered_coords = []
+if 'route_plan' not in st.session_state:
+    st.session_state.route_plan = None
+if 'reachable' not in st.session_state:
+    # Índices de los puntos alcanzables; None mientras no se ha filtrado
+    st.session_state.reachable = None
 if 'current_mode' not in st.session_state:
     st.session_state.current_mode = "Ruta Óptima"
-if 'has_filtered' not in st.session_state:
-    st.session_state.has_filtered = False
 if 'route_costing_label' not in st.session_state:
     st.session_state.route_costing_label = "🚗 Auto"
 if 'polygon_costing_label' not in st.session_state:
     st.session_state.polygon_costing_label = "🚗 Auto"
+if 'last_click' not in st.session_state:
+    st.session_state.last_click = None
+if 'loaded_file' not in st.session_state:
+    st.session_state.loaded_file = None
 
 # Opciones de tipo de transporte (común para todo)
 costing_options = {
@@ -45,13 +182,15 @@ costing_options = {
 with st.sidebar:
     st.header("⚙️ Configuración")
     
-    # Configuración de Valhalla (si lo usas vía Settings, esto es solo visual)
+    # Configuración de Valhalla: un cliente por URL, compartido entre reruns
     st.subheader("Valhalla API")
     valhalla_url = st.text_input(
         "URL de Valhalla",
-        value="http://localhost:8002",
+        value=settings.valhalla_url,
         help="URL del servidor Valhalla"
     )
+    if valhalla_url.strip():
+        use_client(valhalla_url.strip())
     
     st.divider()
     
@@ -69,8 +208,8 @@ with st.sidebar:
         st.session_state.locations = []
         st.session_state.polygon_center = None
         st.session_state.route_result = None
-        st.session_state.filtered_coords = []
-        st.session_state.has_filtered = False
+        st.session_state.route_plan = None
+        st.session_state.reachable = None
         st.rerun()
     
     st.divider()
@@ -90,6 +229,16 @@ with st.sidebar:
         route_costing = costing_options[route_costing_label]
         st.session_state.route_costing_label = route_costing_label
         
+        incremental = st.checkbox(
+            "Reoptimización incremental",
+            value=True,
+            help="Al añadir o quitar puntos, inserta o elimina la parada y pide solo las piernas afectadas"
+        )
+        plan = st.session_state.route_plan
+        # El plan solo sirve con el mismo tipo de transporte
+        if plan is not None and (not incremental or plan.costing != route_costing):
+            st.session_state.route_plan = plan = None
+        
         # Mostrar ubicaciones actuales
         if st.session_state.locations:
             st.write(f"**Ubicaciones ({len(st.session_state.locations)}):**")
@@ -100,12 +249,18 @@ with st.sidebar:
                 with col2:
                     if st.button("🗑️", key=f"del_{i}"):
                         st.session_state.locations.pop(i)
-                        st.session_state.route_result = None
+                        if plan is not None and st.session_state.route_result is not None:
+                            st.session_state.route_result = run(plan.remove(i))
+                        else:
+                            st.session_state.route_result = None
+                        if st.session_state.route_result is None:
+                            st.session_state.route_plan = None
                         st.rerun()
         
         if st.button("🗑️ Limpiar todo", use_container_width=True):
             st.session_state.locations = []
             st.session_state.route_result = None
+            st.session_state.route_plan = None
             st.rerun()
         
         if st.button(
@@ -120,7 +275,12 @@ with st.sidebar:
                         Coordinate(lat=loc['lat'], lng=loc['lng'])
                         for loc in st.session_state.locations
                     ]
-                    result = asyncio.run(get_optimal_route(coords, costing=route_costing))
+                    if incremental:
+                        plan = run(IncrementalRoute.create(coords, costing=route_costing))
+                        st.session_state.route_plan = plan
+                        result = plan.trip if plan else None
+                    else:
+                        result = run(get_optimal_route(coords, costing=route_costing))
                     st.session_state.route_result = result
                     if result:
                         st.success("✅ Ruta calculada exitosamente")
@@ -153,7 +313,19 @@ with st.sidebar:
         )
         
         st.markdown("**1.** Haz clic en el mapa para establecer el centro")
-        st.markdown("**2.** Haz clic para agregar puntos a verificar")
+        st.markdown("**2.** Haz clic para agregar puntos a verificar, o cárgalos desde un CSV")
+        
+        uploaded = st.file_uploader(
+            "Cargar puntos (CSV)",
+            type=["csv"],
+            help="Una fila por punto con columnas lat,lng"
+        )
+        # El uploader conserva el fichero entre reruns: se añade una sola vez
+        if uploaded is not None and uploaded.file_id != st.session_state.loaded_file:
+            st.session_state.loaded_file = uploaded.file_id
+            st.session_state.locations = st.session_state.locations + load_points(uploaded.getvalue())
+            st.session_state.reachable = None
+            st.rerun()
         
         if st.session_state.polygon_center:
             st.success(
@@ -163,8 +335,7 @@ with st.sidebar:
             
             if st.button("🔄 Cambiar centro"):
                 st.session_state.polygon_center = None
-                st.session_state.filtered_coords = []
-                st.session_state.has_filtered = False
+                st.session_state.reachable = None
                 st.rerun()
         
         if st.button(
@@ -176,16 +347,14 @@ with st.sidebar:
             with st.spinner(f"Filtrando coordenadas ({polygon_costing_label})..."):
                 try:
                     center = Coordinate(**st.session_state.polygon_center)
-                    coords = [
-                        Coordinate(lat=loc['lat'], lng=loc['lng'])
-                        for loc in st.session_state.locations
-                    ]
-                    filtered = asyncio.run(
-                        filter_by_location_polygon(center, minutes, coords, costing)
+                    points = location_array(st.session_state.locations)
+                    reachable = run(
+                        reachable_indices(
+                            center, minutes, CoordinateArray(points[:, 0], points[:, 1]), costing
+                        )
                     )
-                    st.session_state.filtered_coords = filtered
-                    st.session_state.has_filtered = True
-                    st.success(f"✅ {len(filtered)}/{len(coords)} puntos alcanzables")
+                    st.session_state.reachable = reachable
+                    st.success(f"✅ {len(reachable)}/{len(points)} puntos alcanzables")
                     st.rerun()
                 except Exception as e:
                     st.error(f"Error al filtrar: {e}")
@@ -193,20 +362,22 @@ with st.sidebar:
         if st.button("🗑️ Reiniciar", use_container_width=True):
             st.session_state.polygon_center = None
             st.session_state.locations = []
-            st.session_state.filtered_coords = []
-            st.session_state.has_filtered = False
+            st.session_state.reachable = None
             st.rerun()
 
 # Área principal - Mapa
 col1, col2 = st.columns([2, 1])
 
 with col1:
-    # Crear mapa centrado en Málaga
+    # Mapa base siempre igual: el componente no se vuelve a montar y solo se
+    # sustituye la capa con los marcadores y las piernas
     m = folium.Map(
-        location=[36.7213, -4.4214],  # Málaga
+        location=MAP_CENTER,
         zoom_start=12,
-        tiles="OpenStreetMap"
+        tiles="OpenStreetMap",
+        prefer_canvas=True
     )
+    layer = folium.FeatureGroup(name="Resultados")
     
     # Agregar marcadores según el modo
     if mode == "Ruta Óptima":
@@ -217,35 +388,26 @@ with col1:
                 popup=f"Punto {i+1}",
                 icon=folium.Icon(color='blue', icon='info-sign', prefix='glyphicon'),
                 tooltip=f"Ubicación {i+1}"
-            ).add_to(m)
+            ).add_to(layer)
         
         # Si hay resultado de ruta, dibujar las piernas (legs)
         if st.session_state.route_result:
             trip = st.session_state.route_result
-            colors = [
-                'blue', 'red', 'green', 'purple', 'orange', 'darkred', 'lightred',
-                'beige', 'darkblue', 'darkgreen', 'cadetblue', 'darkpurple', 'pink'
-            ]
-            
-            for leg_idx, leg in enumerate(trip.legs):
-                if leg.shape:
-                    try:
-                        # Valhalla usa Polyline6
-                        coords = polyline.decode(leg.shape, precision=6, geojson=False)
-                        folium.PolyLine(
-                            locations=coords,
-                            color=colors[leg_idx % len(colors)],
-                            weight=4,
-                            opacity=0.8,
-                            popup=(
-                                f"Pierna {leg_idx + 1}<br>"
-                                f"Distancia: {leg.summary.length:.2f} km<br>"
-                                f"Tiempo: {leg.summary.time/60:.1f} min"
-                            ),
-                            tooltip=f"Pierna {leg_idx + 1}",
-                        ).add_to(m)
-                    except Exception as e:
-                        st.warning(f"Error decodificando shape de pierna {leg_idx + 1}: {e}")
+            legs = tuple(
+                (leg_idx, leg.shape, leg.summary.length, leg.summary.time)
+                for leg_idx, leg in enumerate(trip.legs)
+                if leg.shape
+            )
+            folium.GeoJson(
+                route_layer_data(legs),
+                style_function=lambda feature: {
+                    "color": feature["properties"]["color"],
+                    "weight": 4,
+                    "opacity": 0.8,
+                },
+                tooltip=folium.GeoJsonTooltip(fields=["tooltip"], labels=False),
+                popup=folium.GeoJsonPopup(fields=["popup"], labels=False),
+            ).add_to(layer)
     
     else:  # Filtro por Polígono
         # Marcador del centro
@@ -258,56 +420,46 @@ with col1:
                 popup="Centro de isócrona",
                 icon=folium.Icon(color='red', icon='star'),
                 tooltip="Centro"
-            ).add_to(m)
+            ).add_to(layer)
         
-        # Puntos a verificar
-        for loc in st.session_state.locations:
-            if st.session_state.has_filtered:
-                # Ya hemos filtrado → verde/rojo según alcanzable
-                is_filtered = any(
-                    abs(fc.lat - loc['lat']) < 0.000001 and
-                    abs(fc.lng - loc['lng']) < 0.000001
-                    for fc in st.session_state.filtered_coords
-                )
-                color = 'green' if is_filtered else 'red'
-                popup = "✅ Dentro del alcance" if is_filtered else "❌ Fuera del alcance"
-                tooltip = "Alcanzable" if is_filtered else "No alcanzable"
-            else:
-                # Todavía NO se ha filtrado → estado neutro
-                color = 'blue'
-                popup = "⏱️ Pendiente de cálculo"
-                tooltip = "Punto a verificar"
-
-            folium.CircleMarker(
-                location=[loc['lat'], loc['lng']],
-                radius=8,
-                color=color,
-                fill=True,
-                fillColor=color,
-                fillOpacity=0.7,
-                weight=2,
-                popup=popup,
-                tooltip=tooltip,
-            ).add_to(m)
+        # Puntos a verificar: verde/rojo según alcanzable, azul si no se ha filtrado
+        if st.session_state.locations:
+            add_points(
+                layer,
+                points_layer_data(
+                    location_array(st.session_state.locations), st.session_state.reachable
+                ),
+            )
     
-    # Mostrar el mapa y capturar clics
+    # Mostrar el mapa y capturar clics; mover o hacer zoom no provoca un rerun
     map_data = st_folium(
         m,
         width=700,
         height=500,
-        key="map"
+        key="map",
+        feature_group_to_add=layer,
+        returned_objects=["last_clicked"]
     )
     
-    # Procesar clics en el mapa
-    if map_data and map_data.get('last_clicked'):
-        lat = map_data['last_clicked']['lat']
-        lng = map_data['last_clicked']['lng']
+    # Procesar clics en el mapa (el último clic se sigue devolviendo en cada rerun)
+    click = map_data.get('last_clicked') if map_data else None
+    if click and click != st.session_state.last_click:
+        st.session_state.last_click = click
+        lat = click['lat']
+        lng = click['lng']
         
         if mode == "Ruta Óptima":
             new_loc = {'lat': lat, 'lng': lng}
             if new_loc not in st.session_state.locations:
                 st.session_state.locations.append(new_loc)
-                st.session_state.route_result = None  # Reset route when adding new point
+                plan = st.session_state.route_plan
+                if plan is not None and st.session_state.route_result is not None:
+                    # Inserción en la ruta actual en lugar de reoptimizar todo
+                    st.session_state.route_result = run(plan.add(Coordinate(lat=lat, lng=lng)))
+                else:
+                    st.session_state.route_result = None  # Reset route when adding new point
+                if st.session_state.route_result is None:
+                    st.session_state.route_plan = None
                 st.rerun()
         else:
             # Si no hay centro, establecerlo
@@ -316,12 +468,9 @@ with col1:
                 st.rerun()
             else:
                 # Si ya hay centro, agregar como punto a verificar
-                new_loc = {'lat': lat, 'lng': lng}
-                if new_loc not in st.session_state.locations:
-                    st.session_state.locations.append(new_loc)
-                    st.session_state.filtered_coords = []  # Reset filter
-                    st.session_state.has_filtered = False
-                    st.rerun()
+                st.session_state.locations.append({'lat': lat, 'lng': lng})
+                st.session_state.reachable = None  # Reset filter
+                st.rerun()
 
 with col2:
     st.subheader("📊 Información")
@@ -359,8 +508,8 @@ with col2:
         st.metric("Tiempo", f"{minutes} min")
         st.metric("Puntos totales", len(st.session_state.locations))
         
-        if st.session_state.filtered_coords:
-            alcanzables = len(st.session_state.filtered_coords)
+        if st.session_state.reachable is not None:
+            alcanzables = len(st.session_state.reachable)
             total = len(st.session_state.locations)
             st.metric("Puntos alcanzables", f"{alcanzables}/{total}")
             
@@ -384,7 +533,7 @@ st.divider()
 st.markdown("""
 ### 📝 Instrucciones
 1. **Ruta Óptima**: Haz clic en el mapa para agregar puntos de ruta, luego calcula la ruta óptima. Las piernas se dibujan con diferentes colores.
-2. **Filtro por Polígono**: Establece un centro primero, luego agrega puntos. Los puntos verdes están dentro del tiempo especificado, los rojos fuera.
+2. **Filtro por Polígono**: Establece un centro primero, luego agrega puntos (clic o CSV con columnas lat,lng). Los puntos verdes están dentro del tiempo especificado, los rojos fuera. Con muchos puntos se agrupan en clusters.
 
 💡 **Tip**: Al cambiar de modo, los puntos se reinician automáticamente.
 """)
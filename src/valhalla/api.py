@@ -0,0 +1,286 @@
+"""
+HTTP API over the valhalla module.
+
+Run with:
+    uvicorn valhalla.api:app --host 0.0.0.0 --port 8000
+
+All requests share one pooled Valhalla client and the isochrone/route caches.
+Once ``API_MAX_IN_FLIGHT`` requests are being processed, new ones get a 429
+instead of queueing behind them.
+"""
+
+import time
+from contextlib import asynccontextmanager
+from logging import getLogger
+from typing import Literal
+
+import httpx
+import numpy as np
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import JSONResponse, PlainTextResponse
+from pydantic import BaseModel, Field
+from starlette.routing import Match
+
+from valhalla.batching import get_pair_cost
+from valhalla.cache import get_isochrone_cache, get_route_cache
+from valhalla.client import ValhallaClient, set_default_client
+from valhalla.entities import Coordinate, Trip
+from valhalla.instrumentation import (
+    bind_request_id,
+    get_instrumentation,
+    install_request_id_logging,
+)
+from valhalla.matrix import MatrixBuilder
+from valhalla.offload import get_cpu_executor
+from valhalla.parsing import ParsedTrip, TripProjection
+from valhalla.reachability import reachable_indices
+from valhalla.stats import LatencyHistogram, prometheus_histogram
+from valhalla.valhalla import get_optimal_route, get_route, settings
+
+logger = getLogger(__name__)
+
+Costing = Literal['auto', 'pedestrian', 'bicycle']
+
+# Rutas que no cuentan para el límite de peticiones en curso
+UNLIMITED_PATHS = {"/metrics", "/health"}
+
+
+class RouteRequest(BaseModel):
+    locations: list[Coordinate] = Field(..., min_length=2)
+    costing: Costing = 'auto'
+    projection: TripProjection = 'full'
+
+
+class IsochroneFilterRequest(BaseModel):
+    center: Coordinate
+    minutes: int = Field(..., gt=0)
+    points: list[Coordinate]
+    costing: Costing = 'auto'
+
+
+class IsochroneFilterResponse(BaseModel):
+    reachable: list[int]
+
+
+class TravelTimeRequest(BaseModel):
+    origin: Coordinate
+    destination: Coordinate
+    costing: Costing = 'auto'
+    geometry: bool = False
+
+
+class TravelTimeResponse(BaseModel):
+    # null si no hay conexión
+    time: float | None
+    distance: float | None
+    trip: Trip | None = None
+
+
+class MatrixRequest(BaseModel):
+    locations: list[Coordinate] = Field(
+        ..., min_length=1, max_length=settings.api_matrix_max_locations
+    )
+    costing: Costing = 'auto'
+    metrics: list[Literal['time', 'distance']] = ['time']
+
+
+class MatrixResponse(BaseModel):
+    # null donde no hay conexión
+    time: list[list[float | None]] | None = None
+    distance: list[list[float | None]] | None = None
+
+
+class ApiMetrics:
+    """
+    Request counters and latency histograms exposed on /metrics.
+    """
+
+    def __init__(self) -> None:
+        self.in_flight = 0
+        self.rejected = 0
+        self.requests: dict[tuple[str, int], int] = {}
+        self.latency: dict[str, LatencyHistogram] = {}
+
+    def record(self, path: str, status: int, seconds: float) -> None:
+        self.requests[(path, status)] = self.requests.get((path, status), 0) + 1
+        self.latency.setdefault(path, LatencyHistogram()).observe(seconds)
+
+    def render(self) -> str:
+        lines = [
+            "# TYPE valhalla_api_in_flight gauge",
+            f"valhalla_api_in_flight {self.in_flight}",
+            "# TYPE valhalla_api_rejected_total counter",
+            f"valhalla_api_rejected_total {self.rejected}",
+            "# TYPE valhalla_api_requests_total counter",
+        ]
+        for (path, status), count in sorted(self.requests.items()):
+            lines.append(f'valhalla_api_requests_total{{path="{path}",status="{status}"}} {count}')
+        lines.append("# TYPE valhalla_api_request_duration_seconds histogram")
+        for path, histogram in sorted(self.latency.items()):
+            lines.extend(
+                prometheus_histogram(
+                    "valhalla_api_request_duration_seconds", histogram, {"path": path}
+                )
+            )
+
+        isochrone_cache = get_isochrone_cache(settings)
+        route_cache = get_route_cache(settings)
+        caches = {
+            "isochrone": isochrone_cache.stats if isochrone_cache else None,
+            "route": route_cache.trips.stats if route_cache else None,
+            "optimized_failures": route_cache.optimized_failures.stats if route_cache else None,
+        }
+        lines.append("# TYPE valhalla_cache_events_total counter")
+        for cache, stats in caches.items():
+            if stats is None:
+                continue
+            for event, value in vars(stats).items():
+                lines.append(
+                    f'valhalla_cache_events_total{{cache="{cache}",event="{event}"}} {value}'
+                )
+        instrumentation = get_instrumentation(settings)
+        if instrumentation.enabled:
+            lines.append(instrumentation.render_prometheus().rstrip("\n"))
+        return "\n".join(lines) + "\n"
+
+
+def _trip_response(trip: ParsedTrip) -> Response:
+    # Cada proyección se serializa con su propio modelo
+    return Response(trip.model_dump_json(), media_type="application/json")
+
+
+def _route_label(app: FastAPI, request: Request) -> str:
+    # Plantilla de la ruta y no la URL, para no crear una serie por cada path distinto
+    for route in app.router.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return route.path
+    return "other"
+
+
+def _matrix_to_json(matrix: np.ndarray) -> list[list[float | None]]:
+    return [[v if np.isfinite(v) else None for v in row] for row in matrix.tolist()]
+
+
+def create_app(max_in_flight: int | None = None) -> FastAPI:
+    """
+    Build the ASGI application.
+
+    Args:
+        max_in_flight (int | None, optional): Requests processed at once before
+            answering 429. Defaults to API_MAX_IN_FLIGHT.
+
+    Returns:
+        FastAPI: The application.
+    """
+    max_in_flight = max_in_flight or settings.api_max_in_flight
+    metrics = ApiMetrics()
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        install_request_id_logging()
+        client = ValhallaClient(settings)
+        set_default_client(client)
+        try:
+            yield
+        finally:
+            await client.aclose()
+            set_default_client(None)
+            get_cpu_executor(settings).shutdown(wait=False)
+
+    app = FastAPI(title="Valhalla routes", lifespan=lifespan)
+    app.state.metrics = metrics
+
+    @app.middleware("http")
+    async def backpressure(request: Request, call_next):
+        path = _route_label(app, request)
+        if path in UNLIMITED_PATHS:
+            return await call_next(request)
+        if metrics.in_flight >= max_in_flight:
+            metrics.rejected += 1
+            metrics.record(path, 429, 0.0)
+            return JSONResponse(
+                {"detail": "Too many requests in flight"},
+                status_code=429,
+                headers={"Retry-After": "1"},
+            )
+        metrics.in_flight += 1
+        start = time.perf_counter()
+        status = 500
+        try:
+            with bind_request_id(request.headers.get("x-request-id")) as request_id:
+                response = await call_next(request)
+            status = response.status_code
+            response.headers["X-Request-ID"] = request_id
+            return response
+        finally:
+            metrics.in_flight -= 1
+            metrics.record(path, status, time.perf_counter() - start)
+
+    @app.get("/health")
+    async def health() -> dict:
+        return {"status": "ok"}
+
+    @app.get("/metrics", response_class=PlainTextResponse)
+    async def get_metrics() -> Response:
+        return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+    @app.post("/route", response_model=None)
+    async def route(body: RouteRequest) -> Response:
+        try:
+            trip = await get_route(body.locations, body.costing, body.projection)
+        except httpx.HTTPStatusError as e:
+            raise HTTPException(status_code=502, detail=e.response.text)
+        except httpx.HTTPError as e:
+            raise HTTPException(status_code=502, detail=str(e))
+        except ValueError as e:
+            # p. ej. una respuesta de Valhalla que no se puede leer como Trip
+            raise HTTPException(status_code=422, detail=str(e))
+        if trip is None:
+            raise HTTPException(status_code=404, detail="No route found")
+        return _trip_response(trip)
+
+    @app.post("/optimized-route", response_model=None)
+    async def optimized_route(body: RouteRequest) -> Response:
+        trip = await get_optimal_route(body.locations, body.costing, body.projection)
+        if trip is None:
+            raise HTTPException(status_code=502, detail="Valhalla could not compute the route")
+        return _trip_response(trip)
+
+    @app.post("/isochrone-filter")
+    async def isochrone_filter(body: IsochroneFilterRequest) -> IsochroneFilterResponse:
+        try:
+            indices = await reachable_indices(body.center, body.minutes, body.points, body.costing)
+        except httpx.HTTPError as e:
+            raise HTTPException(status_code=502, detail=str(e))
+        except ValueError as e:
+            # p. ej. Valhalla no devolvió el contorno pedido
+            raise HTTPException(status_code=422, detail=str(e))
+        return IsochroneFilterResponse(reachable=indices.tolist())
+
+    @app.post("/travel-time")
+    async def travel_time(body: TravelTimeRequest) -> TravelTimeResponse:
+        # Las consultas concurrentes comparten una sola llamada a /sources_to_targets
+        try:
+            cost = await get_pair_cost(body.origin, body.destination, body.costing, body.geometry)
+        except httpx.HTTPError as e:
+            raise HTTPException(status_code=502, detail=str(e))
+        except ValueError as e:
+            # Como en /route, con geometry=True
+            raise HTTPException(status_code=422, detail=str(e))
+        return TravelTimeResponse(time=cost.time, distance=cost.distance, trip=cost.trip)
+
+    @app.post("/matrix")
+    async def matrix(body: MatrixRequest) -> MatrixResponse:
+        try:
+            matrices = await MatrixBuilder(
+                body.locations, body.costing, metrics=tuple(body.metrics)
+            ).build()
+        except httpx.HTTPError as e:
+            raise HTTPException(status_code=502, detail=str(e))
+        return MatrixResponse(**{k: _matrix_to_json(v) for k, v in matrices.items()})
+
+    return app
+
+
+app = create_app()
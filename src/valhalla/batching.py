@@ -0,0 +1,196 @@
+import asyncio
+from dataclasses import dataclass
+from logging import getLogger
+from typing import Literal
+
+import numpy as np
+
+from valhalla.entities import Coordinate, Trip
+from valhalla.instrumentation import get_instrumentation
+from valhalla.matrix import _parse_matrix
+from valhalla.settings import Settings
+from valhalla.valhalla import _post_valhalla, get_route, settings
+
+logger = getLogger(__name__)
+
+Costing = Literal['auto', 'pedestrian', 'bicycle']
+
+
+@dataclass
+class PairCost:
+    """
+    Travel cost from one location to another.
+
+    Attributes:
+        time (float | None): Seconds, None if unreachable.
+        distance (float | None): Kilometers, None if unreachable.
+        trip (Trip | None): Full route, only when requested with ``geometry=True``.
+    """
+
+    time: float | None
+    distance: float | None
+    trip: Trip | None = None
+
+
+@dataclass
+class _PendingPair:
+    origin: Coordinate
+    destination: Coordinate
+    future: asyncio.Future
+
+
+class PairBatcher:
+    """
+    Merge concurrent point-to-point cost lookups into /sources_to_targets calls.
+
+    Pairs submitted within ``max_delay`` seconds of the first pending one are
+    grouped by costing and sent together, once the window closes or as soon as
+    ``max_batch`` pairs are waiting. Each call asks for the distinct origins as
+    sources and the distinct destinations as targets, and every caller gets its
+    own cell. Only callers that need the geometry go to /route.
+
+    Usage:
+        batcher = get_pair_batcher()
+        costs = await asyncio.gather(*(batcher.cost(a, b) for a, b in pairs))
+    """
+
+    def __init__(self, max_delay: float = 0.005, max_batch: int = 50) -> None:
+        """
+        Args:
+            max_delay (float, optional): Seconds a pair may wait for others.
+                Defaults to 0.005.
+            max_batch (int, optional): Pairs that close a batch right away. Also
+                bounds the sources and targets of each request. Defaults to 50.
+        """
+        self.max_delay = max_delay
+        self.max_batch = max_batch
+        self._pending: dict[str, list[_PendingPair]] = {}
+        self._timers: dict[str, asyncio.TimerHandle] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+    async def cost(
+        self,
+        origin: Coordinate,
+        destination: Coordinate,
+        costing: Costing = 'auto',
+        geometry: bool = False,
+    ) -> PairCost:
+        """
+        Time and distance from ``origin`` to ``destination``.
+
+        Args:
+            origin (Coordinate): Start location.
+            destination (Coordinate): End location.
+            costing (Costing, optional): Costing model. Defaults to 'auto'.
+            geometry (bool, optional): Also return the route, with a /route call
+                of its own instead of the batched matrix. Defaults to False.
+
+        Raises:
+            httpx.HTTPError: If the request of the batch (or the /route call) fails.
+
+        Returns:
+            PairCost: The cost of the pair; ``time`` and ``distance`` are None if
+            Valhalla finds no connection.
+        """
+        if geometry:
+            trip = await get_route([origin, destination], costing)
+            if trip is None:
+                return PairCost(None, None)
+            return PairCost(trip.summary.time, trip.summary.length, trip)
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        pending = self._pending.setdefault(costing, [])
+        pending.append(_PendingPair(origin, destination, future))
+        if len(pending) >= self.max_batch:
+            self._flush(costing)
+        elif costing not in self._timers:
+            self._timers[costing] = loop.call_later(self.max_delay, self._flush, costing)
+        return await future
+
+    def _flush(self, costing: str) -> None:
+        timer = self._timers.pop(costing, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self._pending.pop(costing, [])
+        if not batch:
+            return
+        task = asyncio.get_running_loop().create_task(self._send(costing, batch))
+        # Referencia fuerte hasta que termine: el bucle solo guarda referencias débiles
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, costing: str, batch: list[_PendingPair]) -> None:
+        sources: dict[tuple[float, float], int] = {}
+        targets: dict[tuple[float, float], int] = {}
+        for pair in batch:
+            sources.setdefault((pair.origin.lat, pair.origin.lng), len(sources))
+            targets.setdefault((pair.destination.lat, pair.destination.lng), len(targets))
+        payload = {
+            "sources": [{"lat": lat, "lon": lng} for lat, lng in sources],
+            "targets": [{"lat": lat, "lon": lng} for lat, lng in targets],
+            "costing": costing,
+            "units": "kilometers",
+        }
+        metrics = get_instrumentation(settings)
+        metrics.count("/sources_to_targets", "batches")
+        metrics.count("/sources_to_targets", "batched_pairs", len(batch))
+        try:
+            data = await _post_valhalla("/sources_to_targets", payload)
+            shape = (len(sources), len(targets))
+            times = _parse_matrix(data, "time", shape)
+            distances = _parse_matrix(data, "distance", shape)
+        except Exception as e:
+            logger.warning("Batched /sources_to_targets of %d pairs failed: %s", len(batch), e)
+            for pair in batch:
+                if not pair.future.done():
+                    pair.future.set_exception(e)
+            return
+
+        for pair in batch:
+            # El llamante puede haberse cancelado mientras tanto
+            if pair.future.done():
+                continue
+            i = sources[(pair.origin.lat, pair.origin.lng)]
+            j = targets[(pair.destination.lat, pair.destination.lng)]
+            time, distance = times[i, j], distances[i, j]
+            pair.future.set_result(
+                PairCost(
+                    float(time) if np.isfinite(time) else None,
+                    float(distance) if np.isfinite(distance) else None,
+                )
+            )
+
+
+_batcher: PairBatcher | None = None
+_batcher_loop: asyncio.AbstractEventLoop | None = None
+
+
+def get_pair_batcher(settings: Settings | None = None) -> PairBatcher:
+    """
+    Shared batcher for the running event loop, configured from settings.
+
+    Pending pairs belong to the loop that created them, so a new batcher is
+    created whenever the running loop changes, like the default client.
+    """
+    global _batcher, _batcher_loop
+    loop = asyncio.get_running_loop()
+    if _batcher is None or _batcher_loop is not loop:
+        settings = settings or Settings()
+        _batcher = PairBatcher(settings.batch_max_delay, settings.batch_max_size)
+        _batcher_loop = loop
+    return _batcher
+
+
+async def get_pair_cost(
+    origin: Coordinate,
+    destination: Coordinate,
+    costing: Costing = 'auto',
+    geometry: bool = False,
+) -> PairCost:
+    """
+    Time and distance between two locations through the shared ``PairBatcher``.
+
+    See ``PairBatcher.cost``.
+    """
+    return await get_pair_batcher(settings).cost(origin, destination, costing, geometry)
@@ -0,0 +1,464 @@
+import asyncio
+import hashlib
+import json
+import queue
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from logging import getLogger
+from typing import Any, Awaitable, Callable, TypeVar
+
+import shapely
+
+from valhalla.coordinates import Coordinates, as_coordinate_array
+from valhalla.entities import Coordinate
+from valhalla.settings import Settings
+
+logger = getLogger(__name__)
+
+T = TypeVar("T")
+
+# Escrituras en disco de la caché de isócronas por transacción
+WRITE_BATCH_SIZE = 256
+
+
+@dataclass(frozen=True)
+class IsochroneKey:
+    """
+    Cache key of an isochrone request.
+
+    Coordinates are rounded so that requests a few centimetres apart share the
+    same entry.
+    """
+
+    lat: float
+    lng: float
+    contours: tuple[int, ...]
+    costing: str
+    polygons: bool = True
+
+    @classmethod
+    def build(
+        cls,
+        center: Coordinate,
+        contours: list[int] | tuple[int, ...],
+        costing: str,
+        polygons: bool = True,
+        precision: int = 5,
+    ) -> "IsochroneKey":
+        return cls(
+            lat=round(center.lat, precision),
+            lng=round(center.lng, precision),
+            contours=tuple(contours),
+            costing=costing,
+            polygons=polygons,
+        )
+
+    def digest(self) -> str:
+        """
+        Content address of the key, stable across processes.
+        """
+        raw = json.dumps(
+            [self.lat, self.lng, list(self.contours), self.costing, self.polygons],
+            separators=(",", ":"),
+        )
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    disk_hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    expirations: int = 0
+
+
+@dataclass
+class _Entry:
+    geometry: shapely.Geometry
+    size: int
+    created: float
+
+
+class PolygonCache:
+    """
+    LRU cache of prepared isochrone geometries.
+
+    Entries are bounded by a byte budget (WKB size of the geometry) and a TTL.
+    If ``path`` is given, geometries are also written as WKB to a SQLite file so
+    they survive restarts; a memory miss then falls back to disk. Only the
+    memory tier runs on the event loop: disk reads go to a worker thread and
+    writes are queued to a writer thread that commits them in batches.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = 64 * 1024 * 1024,
+        ttl: float = 600.0,
+        path: str | None = None,
+    ) -> None:
+        """
+        Args:
+            max_bytes (int, optional): Memory budget in WKB bytes. Defaults to 64 MiB.
+            ttl (float, optional): Seconds an entry is valid. Defaults to 600.
+            path (str | None, optional): SQLite file for the disk tier. Defaults to None.
+        """
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.stats = CacheStats()
+        self.size = 0
+        self._entries: OrderedDict[str, _Entry] = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: sqlite3.Connection | None = None
+        self._db_lock = threading.Lock()
+        self._writes: queue.Queue | None = None
+        self._writer: threading.Thread | None = None
+        if path:
+            db = sqlite3.connect(path, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS isochrones "
+                "(key TEXT PRIMARY KEY, wkb BLOB NOT NULL, created REAL NOT NULL)"
+            )
+            db.commit()
+            self._db = db
+            self._writes = queue.Queue()
+            self._writer = threading.Thread(
+                target=self._write_loop, args=(path,), name="isochrone-cache-writer", daemon=True
+            )
+            self._writer.start()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def get(self, key: IsochroneKey) -> shapely.Geometry | None:
+        """
+        Cached geometry for the key, or None on miss or expiry.
+        """
+        digest = key.digest()
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None:
+                if now - entry.created <= self.ttl:
+                    self._entries.move_to_end(digest)
+                    self.stats.hits += 1
+                    return entry.geometry
+                self._remove(digest)
+                self.stats.expirations += 1
+
+        row = await asyncio.to_thread(self._read_disk, digest) if self._db is not None else None
+        with self._lock:
+            if row is None:
+                self.stats.misses += 1
+                return None
+            geometry, size, created = row
+            if now - created > self.ttl:
+                self._enqueue(("delete", digest))
+                self.stats.expirations += 1
+                self.stats.misses += 1
+                return None
+            self._put_memory(digest, _Entry(geometry, size, created))
+            self.stats.disk_hits += 1
+            return geometry
+
+    def put(self, key: IsochroneKey, geometry: shapely.Geometry) -> None:
+        """
+        Store a geometry, preparing it for fast predicates.
+        """
+        wkb = shapely.to_wkb(geometry)
+        shapely.prepare(geometry)
+        digest = key.digest()
+        now = time.time()
+        with self._lock:
+            self._put_memory(digest, _Entry(geometry, len(wkb), now))
+        self._enqueue(("put", digest, wkb, now))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+        self._enqueue(("clear",))
+
+    def flush(self) -> None:
+        """
+        Block until the queued disk writes are committed.
+        """
+        if self._writes is not None:
+            self._writes.join()
+
+    def close(self) -> None:
+        if self._writer is not None:
+            self._writes.put(None)
+            self._writer.join()
+            self._writer = None
+            self._writes = None
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def _put_memory(self, digest: str, entry: _Entry) -> None:
+        if entry.size > self.max_bytes:
+            return
+        if digest in self._entries:
+            self._remove(digest)
+        self._entries[digest] = entry
+        self.size += entry.size
+        while self.size > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.stats.evictions += 1
+
+    def _remove(self, digest: str) -> None:
+        entry = self._entries.pop(digest)
+        self.size -= entry.size
+
+    def _enqueue(self, op: tuple) -> None:
+        if self._writes is not None:
+            self._writes.put(op)
+
+    def _read_disk(self, digest: str) -> tuple[shapely.Geometry, int, float] | None:
+        # En un hilo: lectura de SQLite y decodificación del WKB fuera del bucle
+        with self._db_lock:
+            if self._db is None:
+                return None
+            row = self._db.execute(
+                "SELECT wkb, created FROM isochrones WHERE key = ?", (digest,)
+            ).fetchone()
+        if row is None:
+            return None
+        wkb, created = row
+        geometry = shapely.from_wkb(wkb)
+        shapely.prepare(geometry)
+        return geometry, len(wkb), created
+
+    def _write_loop(self, path: str) -> None:
+        db = sqlite3.connect(path)
+        try:
+            while True:
+                ops = [self._writes.get()]
+                # Todo lo que ya esté en cola va en la misma transacción
+                while len(ops) < WRITE_BATCH_SIZE:
+                    try:
+                        ops.append(self._writes.get_nowait())
+                    except queue.Empty:
+                        break
+                stop = None in ops
+                try:
+                    for op in ops:
+                        if op is None:
+                            continue
+                        if op[0] == "put":
+                            db.execute(
+                                "INSERT OR REPLACE INTO isochrones (key, wkb, created) "
+                                "VALUES (?, ?, ?)",
+                                op[1:],
+                            )
+                        elif op[0] == "delete":
+                            db.execute("DELETE FROM isochrones WHERE key = ?", (op[1],))
+                        else:
+                            db.execute("DELETE FROM isochrones")
+                    db.commit()
+                except sqlite3.Error as e:
+                    logger.error("Isochrone cache disk write failed: %s", e)
+                    db.rollback()
+                finally:
+                    for _ in ops:
+                        self._writes.task_done()
+                if stop:
+                    return
+        finally:
+            db.close()
+
+
+_isochrone_cache: PolygonCache | None = None
+
+
+def get_isochrone_cache(settings: Settings) -> PolygonCache | None:
+    """
+    Shared isochrone cache configured from settings, or None if disabled.
+    """
+    global _isochrone_cache
+    if not settings.isochrone_cache_enabled:
+        return None
+    if _isochrone_cache is None:
+        _isochrone_cache = PolygonCache(
+            max_bytes=settings.isochrone_cache_max_bytes,
+            ttl=settings.isochrone_cache_ttl,
+            path=settings.isochrone_cache_path,
+        )
+    return _isochrone_cache
+
+
+def route_cache_key(
+    locations: Coordinates,
+    costing: str,
+    units: str,
+    precision: int = 5,
+) -> str:
+    """
+    Canonical hash of a route request.
+
+    Args:
+        locations (Coordinates): Route locations, order matters.
+        costing (str): Costing model.
+        units (str): Distance units.
+        precision (int, optional): Decimals used to round coordinates. Defaults to 5.
+
+    Returns:
+        str: Hex digest identifying the request.
+    """
+    points = as_coordinate_array(locations)
+    raw = json.dumps(
+        [
+            [
+                [round(lat, precision), round(lng, precision)]
+                for lat, lng in zip(points.lat.tolist(), points.lng.tolist())
+            ],
+            costing,
+            units,
+        ],
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+class TTLCache:
+    """
+    Small LRU cache bounded by number of entries, with a TTL per entry.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 600.0) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stats = CacheStats()
+        self._entries: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key) is not None
+
+    def get(self, key: str) -> Any | None:
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                self.stats.misses += 1
+                return None
+            created, value = item
+            if time.monotonic() - created > self.ttl:
+                del self._entries[key]
+                self.stats.expirations += 1
+                self.stats.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats.hits += 1
+            return value
+
+    def put(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls with the same key into a single execution.
+
+    While a call for a key is in flight, later callers await the same task
+    instead of starting their own.
+    """
+
+    def __init__(self) -> None:
+        self._inflight: dict[str, asyncio.Future] = {}
+
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        """
+        Run ``fn`` once for all concurrent callers of ``key``.
+
+        Args:
+            key (str): Identifier of the call.
+            fn (Callable[[], Awaitable[T]]): Coroutine factory doing the real work.
+
+        Returns:
+            T: Result shared by every caller.
+        """
+        future = self._inflight.get(key)
+        if future is None or future.get_loop() is not asyncio.get_running_loop():
+            future = asyncio.ensure_future(fn())
+            self._inflight[key] = future
+            future.add_done_callback(lambda f: self._forget(key, f))
+        # shield: cancelar a un llamante no cancela la petición de los demás
+        return await asyncio.shield(future)
+
+    def _forget(self, key: str, future: asyncio.Future) -> None:
+        if self._inflight.get(key) is future:
+            del self._inflight[key]
+
+
+class CachedRoute:
+    """
+    Raw route response, parsed on demand once per projection.
+
+    The raw bytes are cached rather than a parsed trip so every projection of
+    the same request shares one cache entry and one upstream call.
+    """
+
+    def __init__(self, raw: bytes, endpoint: str) -> None:
+        self.raw = raw
+        self.endpoint = endpoint
+        self.parsed: dict[str, Any] = {}
+
+
+class RouteCache:
+    """
+    Memoized route responses (``CachedRoute``) plus remembered /optimized_route
+    failures.
+    """
+
+    def __init__(
+        self, max_entries: int = 1024, ttl: float = 600.0, negative_ttl: float = 3600.0
+    ) -> None:
+        self.trips = TTLCache(max_entries, ttl)
+        self.optimized_failures = TTLCache(max_entries, negative_ttl)
+        self.flights = SingleFlight()
+
+    def remember_optimized_failure(self, key: str) -> None:
+        self.optimized_failures.put(key, True)
+
+    def optimized_known_to_fail(self, key: str) -> bool:
+        return key in self.optimized_failures
+
+
+_route_cache: RouteCache | None = None
+
+
+def get_route_cache(settings: Settings) -> RouteCache | None:
+    """
+    Shared route cache configured from settings, or None if disabled.
+    """
+    global _route_cache
+    if not settings.route_cache_enabled:
+        return None
+    if _route_cache is None:
+        _route_cache = RouteCache(
+            max_entries=settings.route_cache_max_entries,
+            ttl=settings.route_cache_ttl,
+            negative_ttl=settings.route_negative_ttl,
+        )
+    return _route_cache
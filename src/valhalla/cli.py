@@ -0,0 +1,361 @@
+"""
+Batch routing from NDJSON.
+
+Each input line is a job:
+
+    {"type": "route", "id": "a", "locations": [{"lat": 36.72, "lng": -4.42}, ...], "costing": "auto"}
+    {"type": "isochrone", "id": "b", "center": {"lat": 36.72, "lng": -4.42}, "minutes": 15,
+     "points": [{"lat": 36.73, "lng": -4.41}, ...]}
+
+and each output line is its result:
+
+    {"id": "a", "line": 0, "ok": true, "elapsed": 0.12, "result": {...trip...}}
+    {"id": "b", "line": 1, "ok": true, "elapsed": 0.05, "result": {"reachable": [0, 3]}}
+
+Usage:
+    valhalla-batch jobs.ndjson -o results.ndjson --concurrency 32 --checkpoint jobs.ckpt
+    cat jobs.ndjson | valhalla-batch --order input > results.ndjson
+    valhalla-batch jobs.ndjson -o results.ndjson --trips-dir trips/
+
+With ``--trips-dir`` route trips go to columnar tables (see valhalla.export)
+and their result line only holds ``{"trip_id": <line>}``.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from collections import deque
+from itertools import islice
+from logging import getLogger
+from typing import Annotated, Any, Literal, TextIO
+
+from pydantic import BaseModel, Field, TypeAdapter
+
+from valhalla.entities import Coordinate
+from valhalla.export import TripWriter
+from valhalla.instrumentation import bind_request_id, install_request_id_logging
+from valhalla.offload import get_cpu_executor
+from valhalla.parsing import TripProjection
+from valhalla.reachability import reachable_indices
+from valhalla.stats import LatencyHistogram
+from valhalla.valhalla import get_optimal_route, settings
+
+logger = getLogger(__name__)
+
+READ_CHUNK = 1000
+
+
+class RouteJob(BaseModel):
+    type: Literal['route']
+    id: str | int | None = None
+    locations: list[Coordinate]
+    costing: Literal['auto', 'pedestrian', 'bicycle'] = 'auto'
+
+
+class IsochroneJob(BaseModel):
+    type: Literal['isochrone']
+    id: str | int | None = None
+    center: Coordinate
+    minutes: int
+    points: list[Coordinate]
+    costing: Literal['auto', 'pedestrian', 'bicycle'] = 'auto'
+
+
+Job = Annotated[RouteJob | IsochroneJob, Field(discriminator="type")]
+_job_adapter = TypeAdapter(Job)
+
+
+class JobResult(BaseModel):
+    id: str | int | None = None
+    line: int
+    ok: bool
+    elapsed: float
+    result: Any = None
+    error: str | None = None
+
+
+class Checkpoint:
+    """
+    Progress of a batch: every line below ``watermark`` is done, plus the lines
+    in ``done`` (finished out of order, bounded by the in-flight window).
+
+    ``output_size`` is the size of the output file when the checkpoint was
+    saved; on resume the output is truncated to it, so results written after
+    the last save are not duplicated when their jobs run again.
+    """
+
+    def __init__(self, path: str | None) -> None:
+        self.path = path
+        self.watermark = 0
+        self.done: set[int] = set()
+        self.output_size: int | None = None
+        if path and os.path.exists(path):
+            with open(path) as f:
+                data = json.load(f)
+            self.watermark = data["watermark"]
+            self.done = set(data["done"])
+            self.output_size = data.get("output_size")
+
+    @property
+    def resumed(self) -> bool:
+        return self.watermark > 0 or bool(self.done)
+
+    def is_done(self, line: int) -> bool:
+        return line < self.watermark or line in self.done
+
+    def mark(self, line: int) -> None:
+        if line < self.watermark:
+            return
+        self.done.add(line)
+        while self.watermark in self.done:
+            self.done.remove(self.watermark)
+            self.watermark += 1
+
+    def save(self, output_size: int | None = None) -> None:
+        if not self.path:
+            return
+        self.output_size = output_size
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(
+                {
+                    "watermark": self.watermark,
+                    "done": sorted(self.done),
+                    "output_size": output_size,
+                },
+                f,
+            )
+        os.replace(tmp, self.path)
+
+
+class BatchStats:
+    def __init__(self) -> None:
+        self.ok = 0
+        self.failed = 0
+        self.skipped = 0
+        self.latency = LatencyHistogram()
+        self.started = time.perf_counter()
+
+    def record(self, result: JobResult) -> None:
+        if result.ok:
+            self.ok += 1
+        else:
+            self.failed += 1
+        self.latency.observe(result.elapsed)
+
+    def report(self, out: TextIO) -> None:
+        elapsed = time.perf_counter() - self.started
+        total = self.ok + self.failed
+        lat = self.latency
+        print(
+            f"jobs: {total} ok: {self.ok} failed: {self.failed} skipped: {self.skipped}\n"
+            f"elapsed: {elapsed:.1f}s throughput: {total / elapsed if elapsed else 0:.1f} jobs/s\n"
+            f"latency p50: {lat.percentile(50) * 1000:.1f} ms "
+            f"p95: {lat.percentile(95) * 1000:.1f} ms "
+            f"p99: {lat.percentile(99) * 1000:.1f} ms "
+            f"max: {lat.max * 1000:.1f} ms",
+            file=out,
+        )
+
+
+async def run_job(line: int, raw: str, projection: TripProjection) -> JobResult:
+    """
+    Parse and execute one NDJSON job. Never raises: failures are reported in the
+    result.
+    """
+    start = time.perf_counter()
+    job_id = None
+    try:
+        job = _job_adapter.validate_json(raw)
+        job_id = job.id if job.id is not None else line
+        with bind_request_id(str(job_id)):
+            if isinstance(job, RouteJob):
+                trip = await get_optimal_route(job.locations, job.costing, projection=projection)
+                if trip is None:
+                    raise RuntimeError("No route found")
+                result = trip
+            else:
+                indices = await reachable_indices(job.center, job.minutes, job.points, job.costing)
+                result = {"reachable": indices.tolist()}
+    except Exception as e:
+        return JobResult(
+            id=job_id if job_id is not None else line,
+            line=line,
+            ok=False,
+            elapsed=time.perf_counter() - start,
+            error=f"{type(e).__name__}: {e}",
+        )
+    return JobResult(
+        id=job_id, line=line, ok=True, elapsed=time.perf_counter() - start, result=result
+    )
+
+
+async def run_batch(
+    source: TextIO,
+    sink: TextIO,
+    concurrency: int = 16,
+    order: Literal['completion', 'input'] = 'completion',
+    checkpoint: Checkpoint | None = None,
+    projection: TripProjection = 'full',
+    checkpoint_every: int = 1000,
+    trips: TripWriter | None = None,
+) -> BatchStats:
+    """
+    Run every job of ``source`` and write results to ``sink`` as NDJSON.
+
+    At most ``concurrency`` jobs run at once and at most ``4 * concurrency`` are
+    read ahead or waiting to be written, so memory stays constant regardless of
+    the input size.
+
+    Args:
+        source (TextIO): NDJSON jobs, one per line.
+        sink (TextIO): Where results are written.
+        concurrency (int, optional): Jobs running at once. Defaults to 16.
+        order (Literal['completion', 'input'], optional): Output order. Defaults
+            to 'completion'.
+        checkpoint (Checkpoint | None, optional): Lines already done are skipped
+            and progress is saved every ``checkpoint_every`` results.
+        projection (TripProjection, optional): Trip projection of route results.
+            Defaults to 'full'.
+        checkpoint_every (int, optional): Results between checkpoint saves.
+        trips (TripWriter | None, optional): Where route trips are written instead
+            of the NDJSON result, which then only holds their ``trip_id`` (the
+            input line). Its parts are closed on every checkpoint save.
+
+    Returns:
+        BatchStats: Counters and latency histogram.
+    """
+    checkpoint = checkpoint or Checkpoint(None)
+    stats = BatchStats()
+    window = asyncio.Semaphore(concurrency * 4)
+    queue: asyncio.Queue[tuple[int, str] | None] = asyncio.Queue(maxsize=concurrency)
+    dispatched: deque[int] = deque()
+    finished: dict[int, JobResult] = {}
+    since_save = 0
+
+    def save() -> None:
+        sink.flush()
+        # Las rutas ya escritas cuentan como hechas: sus partes se cierran y las
+        # siguientes van a partes nuevas, así el checkpoint solo apunta a ficheros completos
+        if trips is not None:
+            trips.commit()
+        checkpoint.save(sink.tell() if sink.seekable() else None)
+
+    def write(result: JobResult) -> None:
+        nonlocal since_save
+        if trips is not None and result.ok and isinstance(result.result, BaseModel):
+            trips.write(result.result, result.line)
+            result.result = {"trip_id": result.line}
+        sink.write(result.model_dump_json(exclude_none=True))
+        sink.write("\n")
+        stats.record(result)
+        checkpoint.mark(result.line)
+        window.release()
+        since_save += 1
+        if since_save >= checkpoint_every:
+            save()
+            since_save = 0
+
+    def emit(result: JobResult) -> None:
+        if order == "completion":
+            write(result)
+            return
+        finished[result.line] = result
+        while dispatched and dispatched[0] in finished:
+            write(finished.pop(dispatched.popleft()))
+
+    async def produce() -> None:
+        line_no = 0
+        while True:
+            lines = await asyncio.to_thread(lambda: list(islice(source, READ_CHUNK)))
+            if not lines:
+                break
+            for raw in lines:
+                line = line_no
+                line_no += 1
+                if not raw.strip():
+                    # Las líneas vacías cuentan como hechas o la marca de agua no avanza
+                    checkpoint.mark(line)
+                    continue
+                if checkpoint.is_done(line):
+                    stats.skipped += 1
+                    continue
+                await window.acquire()
+                dispatched.append(line)
+                await queue.put((line, raw))
+        for _ in range(concurrency):
+            await queue.put(None)
+
+    async def work() -> None:
+        while (item := await queue.get()) is not None:
+            emit(await run_job(*item, projection=projection))
+
+    try:
+        await asyncio.gather(produce(), *(work() for _ in range(concurrency)))
+    finally:
+        save()
+    return stats
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(
+        prog="valhalla-batch",
+        description="Run route and isochrone jobs from NDJSON against Valhalla.",
+    )
+    parser.add_argument("input", nargs="?", default="-", help="NDJSON jobs file, '-' for stdin")
+    parser.add_argument("-o", "--output", default="-", help="Results file, '-' for stdout")
+    parser.add_argument("-c", "--concurrency", type=int, default=16)
+    parser.add_argument("--order", choices=["completion", "input"], default="completion")
+    parser.add_argument("--checkpoint", help="Checkpoint file to resume an interrupted run")
+    parser.add_argument(
+        "--projection", choices=["full", "lazy", "shapes", "summary"], default="full"
+    )
+    parser.add_argument("--trips-dir", help="Write route trips as columnar tables to this directory")
+    parser.add_argument("--trips-format", choices=["parquet", "arrow"], default="parquet")
+    args = parser.parse_args(argv)
+    install_request_id_logging()
+
+    checkpoint = Checkpoint(args.checkpoint)
+    # Cada ejecución añade una parte nueva a las tablas, también al reanudar
+    trips = TripWriter(args.trips_dir, args.trips_format) if args.trips_dir else None
+    source = sys.stdin if args.input == "-" else open(args.input)
+    # Al reanudar se añaden resultados al fichero existente, sin los escritos
+    # después del último checkpoint (esos trabajos se repiten)
+    sink = (
+        sys.stdout
+        if args.output == "-"
+        else open(args.output, "a" if checkpoint.resumed else "w")
+    )
+    if sink is not sys.stdout and checkpoint.resumed and checkpoint.output_size is not None:
+        sink.truncate(checkpoint.output_size)
+    try:
+        stats = asyncio.run(
+            run_batch(
+                source,
+                sink,
+                concurrency=args.concurrency,
+                order=args.order,
+                checkpoint=checkpoint,
+                projection=args.projection,
+                trips=trips,
+            )
+        )
+    except KeyboardInterrupt:
+        print("Interrupted; progress saved to checkpoint", file=sys.stderr)
+        sys.exit(130)
+    finally:
+        get_cpu_executor(settings).shutdown()
+        if trips is not None:
+            trips.close()
+        if source is not sys.stdin:
+            source.close()
+        if sink is not sys.stdout:
+            sink.close()
+    stats.report(sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,398 @@
+import asyncio
+import json
+import random
+import time
+from logging import getLogger
+
+import httpx
+
+from valhalla.instrumentation import get_instrumentation
+from valhalla.settings import Settings
+from valhalla.upstream import (
+    CircuitBreaker,
+    Node,
+    UpstreamPool,
+    UpstreamUnavailable,
+    is_retryable,
+)
+
+logger = getLogger(__name__)
+
+
+def _discard_outcome(task: asyncio.Future) -> None:
+    # Recoger la excepción evita el aviso "Task exception was never retrieved"
+    if not task.cancelled():
+        task.exception()
+
+
+class ValhallaClient:
+    """
+    Long-lived HTTP client for the Valhalla API.
+
+    Owns one ``httpx.AsyncClient`` per Valhalla node, each with a bounded
+    connection pool so that consecutive requests reuse keep-alive connections
+    instead of paying the TCP setup on every call. With several nodes
+    (comma-separated ``VALHALLA_URL``) each call goes to the node with the fewest
+    requests in flight.
+
+    Every Valhalla endpoint is a read-only query, so calls failing with a
+    transport error, 429 or 5xx are retried with jittered exponential backoff,
+    preferably on another node. Each node has a circuit breaker that stops
+    sending it traffic after repeated failures. Endpoints listed in
+    ``VALHALLA_HEDGED_ENDPOINTS`` send a second copy to another node when the
+    first has not answered after the endpoint's p95 latency, and keep whichever
+    answers first.
+
+    Usage:
+        async with ValhallaClient(settings) as client:
+            data = await client.post("/route", payload)
+    """
+
+    def __init__(
+        self,
+        settings: Settings | None = None,
+        *,
+        transport: httpx.AsyncBaseTransport | None = None,
+    ) -> None:
+        """
+        Args:
+            settings (Settings | None, optional): Connection settings. Defaults to
+                reading them from the environment.
+            transport (httpx.AsyncBaseTransport | None, optional): Custom transport
+                shared by every node, mainly useful to plug a mock transport.
+                Defaults to None.
+        """
+        self.settings = settings or Settings()
+        self._transport = transport
+        self._pool: UpstreamPool | None = None
+        self._closed = False
+
+    async def __aenter__(self) -> "ValhallaClient":
+        self._get_pool()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.aclose()
+
+    @property
+    def is_closed(self) -> bool:
+        return self._closed
+
+    @property
+    def nodes(self) -> list[Node]:
+        return self._get_pool().nodes
+
+    def _get_pool(self) -> UpstreamPool:
+        if self._pool is None:
+            self._closed = False
+            http2 = self._http2_available()
+            self._pool = UpstreamPool(
+                [
+                    Node(
+                        url,
+                        self._new_http_client(url, http2),
+                        CircuitBreaker(
+                            self.settings.valhalla_breaker_failures,
+                            self.settings.valhalla_breaker_reset,
+                        ),
+                    )
+                    for url in self.settings.valhalla_urls
+                ]
+            )
+        return self._pool
+
+    def _new_http_client(self, url: str, http2: bool) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            base_url=url,
+            limits=httpx.Limits(
+                max_connections=self.settings.valhalla_max_connections,
+                max_keepalive_connections=self.settings.valhalla_max_keepalive_connections,
+                keepalive_expiry=self.settings.valhalla_keepalive_expiry,
+            ),
+            timeout=self.settings.valhalla_timeout,
+            http2=http2,
+            transport=self._transport,
+        )
+
+    def _http2_available(self) -> bool:
+        if not self.settings.valhalla_http2:
+            return False
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            logger.warning("VALHALLA_HTTP2 is set but 'h2' is not installed; using HTTP/1.1")
+            return False
+        return True
+
+    def timeout_for(self, path: str) -> float:
+        """
+        Timeout configured for the given endpoint.
+
+        Args:
+            path (str): Relative path on Valhalla API, e.g. "/isochrone".
+
+        Returns:
+            float: Timeout in seconds.
+        """
+        return self.settings.valhalla_endpoint_timeouts.get(
+            path, self.settings.valhalla_timeout
+        )
+
+    async def _send(self, node: Node, path: str, payload: dict, timeout: float) -> bytes:
+        """
+        One attempt against one node, updating its breaker and in-flight count.
+        """
+        metrics = get_instrumentation(self.settings)
+        trace = metrics.new_trace()
+        node.outstanding += 1
+        node.breaker.on_request()
+        start = time.perf_counter()
+        try:
+            with metrics.span(f"valhalla {path}", endpoint=path, node=node.url):
+                res = await node.client.post(
+                    path,
+                    json=payload,
+                    timeout=timeout,
+                    extensions={"trace": trace} if trace else None,
+                )
+        except httpx.HTTPError:
+            if trace:
+                metrics.count(path, "transport_error")
+            self._record_failure(node, path)
+            raise
+        except asyncio.CancelledError:
+            # Copia perdedora de un hedge: no cuenta ni como éxito ni como fallo
+            node.breaker.abandon()
+            raise
+        finally:
+            node.outstanding -= 1
+
+        elapsed = time.perf_counter() - start
+        if trace:
+            metrics.observe(path, "request", elapsed)
+            metrics.record_trace(path, trace)
+            metrics.observe_size(path, len(res.content))
+        try:
+            res.raise_for_status()
+        except httpx.HTTPStatusError as e:
+            if trace:
+                metrics.count(path, f"status_{e.response.status_code}")
+            logger.error(
+                "Valhalla %s %s -> %s | body=%s",
+                e.request.method,
+                e.request.url,
+                e.response.status_code,
+                e.response.text,
+            )
+            if is_retryable(e):
+                self._record_failure(node, path)
+            else:
+                # El nodo responde bien: el error es de la petición
+                node.breaker.record_success()
+            raise
+        node.breaker.record_success()
+        self._pool.observe(path, elapsed)
+        return res.content
+
+    def _record_failure(self, node: Node, path: str) -> None:
+        if node.breaker.record_failure():
+            logger.warning("Circuit breaker opened for Valhalla node %s", node.url)
+            get_instrumentation(self.settings).count(path, "breaker_open")
+
+    def _pick(self, exclude: set[int]) -> Node:
+        pool = self._get_pool()
+        # Con un solo nodo disponible se reintenta en el mismo
+        node = pool.pick(exclude) or pool.pick()
+        if node is None:
+            raise UpstreamUnavailable("Every Valhalla node has its circuit breaker open")
+        return node
+
+    async def _hedged(self, path: str, payload: dict, timeout: float, exclude: set[int]) -> bytes:
+        """
+        Send to one node and, if it is slower than the endpoint's p95, to another
+        one too. The first successful answer wins and the other is cancelled.
+        The nodes used are added to ``exclude`` so a retry goes elsewhere.
+        """
+        pool = self._get_pool()
+        first_node = self._pick(exclude)
+        exclude.add(id(first_node))
+        delay = pool.hedge_delay(
+            path,
+            self.settings.valhalla_hedge_min_samples,
+            self.settings.valhalla_hedge_min_delay,
+        )
+        first = asyncio.ensure_future(self._send(first_node, path, payload, timeout))
+        started = [first]
+        pending = {first}
+        try:
+            if delay is None:
+                return await first
+            done, _ = await asyncio.wait({first}, timeout=delay)
+            # Mejor un nodo que no se haya probado en este intento ni en los anteriores
+            second_node = None
+            if not done:
+                second_node = pool.pick(exclude) or pool.pick({id(first_node)})
+            if second_node is None:
+                return await first
+
+            exclude.add(id(second_node))
+            get_instrumentation(self.settings).count(path, "hedge")
+            second = asyncio.ensure_future(self._send(second_node, path, payload, timeout))
+            started.append(second)
+            pending.add(second)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is second:
+                            get_instrumentation(self.settings).count(path, "hedge_won")
+                        return task.result()
+                if not pending:
+                    # Han fallado las dos: se propaga el error de la primera
+                    return first.result()
+        finally:
+            # También si se cancela al llamante mientras espera. La perdedora
+            # puede acabar con error después (o a la vez que la ganadora)
+            for task in pending:
+                task.cancel()
+            for task in started:
+                task.add_done_callback(_discard_outcome)
+
+    async def post_raw(
+        self,
+        path: str,
+        payload: dict,
+        timeout: float | None = None,
+        hedge: bool | None = None,
+    ) -> bytes:
+        """
+        Post payload to Valhalla API at given path and return the raw body.
+
+        Args:
+            path (str): Relative path on Valhalla API to post to.
+            payload (dict): Payload to send.
+            timeout (float | None, optional): Timeout in seconds. Defaults to the
+                endpoint timeout from settings.
+            hedge (bool | None, optional): Send a hedged copy if the call is slow.
+                Defaults to whether ``path`` is in VALHALLA_HEDGED_ENDPOINTS.
+
+        Raises:
+            httpx.HTTPStatusError: If response status code is not 200 after the
+                retries.
+            UpstreamUnavailable: If every node has its circuit breaker open.
+
+        Returns:
+            bytes: Undecoded JSON response from Valhalla.
+        """
+        timeout = timeout or self.timeout_for(path)
+        if hedge is None:
+            hedge = path in self.settings.valhalla_hedged_endpoints
+        retries = self.settings.valhalla_retries
+        tried: set[int] = set()
+        attempt = 0
+        while True:
+            try:
+                if hedge and len(self.nodes) > 1:
+                    return await self._hedged(path, payload, timeout, tried)
+                node = self._pick(tried)
+                tried.add(id(node))
+                return await self._send(node, path, payload, timeout)
+            except httpx.HTTPError as e:
+                if attempt == retries or isinstance(e, UpstreamUnavailable) or not is_retryable(e):
+                    raise
+                delay = self.settings.valhalla_retry_backoff * 2**attempt
+                delay *= random.uniform(0.5, 1.5)
+                logger.warning(
+                    "Valhalla %s failed (%s); retry %d/%d in %.2fs",
+                    path, e, attempt + 1, retries, delay,
+                )
+                get_instrumentation(self.settings).count(path, "retry")
+                await asyncio.sleep(delay)
+                attempt += 1
+
+    async def post(
+        self,
+        path: str,
+        payload: dict,
+        timeout: float | None = None,
+        hedge: bool | None = None,
+    ) -> dict:
+        """
+        Post payload to Valhalla API at given path.
+
+        Args:
+            path (str): Relative path on Valhalla API to post to.
+            payload (dict): Payload to send.
+            timeout (float | None, optional): Timeout in seconds. Defaults to the
+                endpoint timeout from settings.
+            hedge (bool | None, optional): See ``post_raw``.
+
+        Raises:
+            httpx.HTTPStatusError: If response status code is not 200.
+
+        Returns:
+            dict: JSON response from Valhalla.
+        """
+        raw = await self.post_raw(path, payload, timeout, hedge)
+        with get_instrumentation(self.settings).phase(path, "decode"):
+            return json.loads(raw)
+
+    async def aclose(self) -> None:
+        self._closed = True
+        if self._pool is not None:
+            await self._pool.aclose()
+            self._pool = None
+
+
+_default_client: ValhallaClient | None = None
+_default_loop: asyncio.AbstractEventLoop | None = None
+
+
+def get_default_client(settings: Settings | None = None) -> ValhallaClient:
+    """
+    Shared client used by the module-level functions in ``valhalla.valhalla``.
+
+    The pooled connections belong to the event loop that opened them, so a new
+    client is created whenever the running loop changes (e.g. one
+    ``asyncio.run`` per Streamlit rerun). The replaced client is closed on its
+    own loop if that loop still exists.
+
+    Args:
+        settings (Settings | None, optional): Settings for a newly created client.
+
+    Returns:
+        ValhallaClient: The shared client for the running event loop.
+    """
+    global _default_client, _default_loop
+    loop = asyncio.get_running_loop()
+    if _default_client is None or _default_loop is not loop or _default_client.is_closed:
+        if _default_client is not None and not _default_client.is_closed:
+            _close_on_loop(_default_client, _default_loop)
+        _default_client = ValhallaClient(settings)
+        _default_loop = loop
+    return _default_client
+
+
+def _close_on_loop(client: ValhallaClient, loop: asyncio.AbstractEventLoop | None) -> None:
+    # Las conexiones solo se pueden cerrar en el bucle que las abrió
+    if loop is None or loop.is_closed():
+        return
+    try:
+        asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+    except RuntimeError:
+        # El bucle se cerró entre la comprobación y la llamada
+        pass
+
+
+def set_default_client(client: ValhallaClient | None) -> None:
+    """
+    Replace the shared client, e.g. with one managed by an application lifespan.
+
+    Must be called from within the event loop that will use the client.
+
+    Args:
+        client (ValhallaClient | None): Client to share, or None to reset.
+    """
+    global _default_client, _default_loop
+    _default_client = client
+    _default_loop = asyncio.get_running_loop() if client is not None else None
@@ -0,0 +1,99 @@
+from typing import Iterator, Sequence
+
+import numpy as np
+
+from valhalla.entities import Coordinate
+
+
+class CoordinateArray:
+    """
+    Columnar batch of coordinates: NumPy ``lat`` and ``lng`` arrays plus
+    optional ``ids``.
+
+    Much cheaper than ``list[Coordinate]`` for large point sets: no pydantic
+    object per point, and slicing with ``a[i:j]`` returns views of the same
+    columns. Indexing with an int returns a ``Coordinate``; indexing with an
+    array of indices or a boolean mask returns a new ``CoordinateArray``.
+
+    Usage:
+        points = CoordinateArray(lat=df["lat"].to_numpy(), lng=df["lng"].to_numpy(), ids=df.index)
+        reachable = await reachable_indices(center, 15, points)
+        points.ids[reachable]
+    """
+
+    __slots__ = ("lat", "lng", "ids")
+
+    def __init__(
+        self,
+        lat: Sequence[float] | np.ndarray,
+        lng: Sequence[float] | np.ndarray,
+        ids: Sequence | np.ndarray | None = None,
+    ) -> None:
+        """
+        Args:
+            lat (Sequence[float] | np.ndarray): Latitudes. Not copied if already a
+                float64 array.
+            lng (Sequence[float] | np.ndarray): Longitudes, same length.
+            ids (Sequence | np.ndarray | None, optional): Identifier per point.
+                Defaults to None.
+
+        Raises:
+            ValueError: If the columns have different lengths.
+        """
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.lng = np.asarray(lng, dtype=np.float64)
+        self.ids = None if ids is None else np.asarray(ids)
+        if self.lat.shape != self.lng.shape or self.lat.ndim != 1:
+            raise ValueError("lat and lng must be 1-D arrays of the same length")
+        if self.ids is not None and len(self.ids) != len(self.lat):
+            raise ValueError("ids must have one entry per coordinate")
+
+    @classmethod
+    def from_coordinates(
+        cls, coordinates: Sequence[Coordinate], ids: Sequence | np.ndarray | None = None
+    ) -> "CoordinateArray":
+        n = len(coordinates)
+        lat = np.fromiter((c.lat for c in coordinates), dtype=np.float64, count=n)
+        lng = np.fromiter((c.lng for c in coordinates), dtype=np.float64, count=n)
+        return cls(lat, lng, ids)
+
+    def to_coordinates(self) -> list[Coordinate]:
+        # Sin validación: los valores ya son floats
+        return [
+            Coordinate.model_construct(lat=lat, lng=lng)
+            for lat, lng in zip(self.lat.tolist(), self.lng.tolist())
+        ]
+
+    def to_valhalla(self) -> list[dict]:
+        """
+        Locations as expected by the Valhalla API.
+        """
+        return [{"lat": lat, "lon": lng} for lat, lng in zip(self.lat.tolist(), self.lng.tolist())]
+
+    def __len__(self) -> int:
+        return len(self.lat)
+
+    def __iter__(self) -> Iterator[Coordinate]:
+        return iter(self.to_coordinates())
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, np.integer)):
+            return Coordinate.model_construct(lat=float(self.lat[key]), lng=float(self.lng[key]))
+        return CoordinateArray(
+            self.lat[key], self.lng[key], None if self.ids is None else self.ids[key]
+        )
+
+    def __repr__(self) -> str:
+        return f"CoordinateArray(n={len(self)}, ids={self.ids is not None})"
+
+
+Coordinates = list[Coordinate] | CoordinateArray
+
+
+def as_coordinate_array(points: Coordinates) -> CoordinateArray:
+    """
+    The points as a ``CoordinateArray``, without copying if they already are one.
+    """
+    if isinstance(points, CoordinateArray):
+        return points
+    return CoordinateArray.from_coordinates(points)
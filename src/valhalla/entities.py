@@ -1,4 +1,11 @@
-from pydantic import BaseModel
+from functools import cached_property
+from typing import Self
+
+import numpy as np
+from pydantic import BaseModel, PrivateAttr
+from shapely.geometry import LineString
+
+from valhalla.shapes import concat_shapes, decode_polyline, slice_shape
 
 
 class ExitTowardElement(BaseModel):
@@ -46,7 +53,55 @@ class Summary(BaseModel):
     cost: float
 
 
-class Leg(BaseModel):
+# cached_property guardadas en el __dict__ del modelo, que model_copy copia
+_SHAPE_CACHE = ("coordinates", "line")
+
+
+class _DecodedShape:
+    """
+    Decoded geometry of a leg, computed once from the polyline6 ``shape``.
+
+    The model defines the ``shape`` field itself; declaring it here would make it
+    the first field and change the serialization order.
+    """
+
+    def model_copy(self, *, update: dict | None = None, deep: bool = False) -> Self:
+        """
+        ``BaseModel.model_copy`` that drops the decoded geometry when the copy
+        gets another ``shape``.
+        """
+        copy = super().model_copy(update=update, deep=deep)
+        if update and "shape" in update:
+            for name in _SHAPE_CACHE:
+                copy.__dict__.pop(name, None)
+        return copy
+
+    @cached_property
+    def coordinates(self) -> np.ndarray:
+        """
+        Read-only (n, 2) float64 array of [lat, lon].
+        """
+        coords = decode_polyline(self.shape, precision=6)
+        coords.flags.writeable = False
+        return coords
+
+    @cached_property
+    def line(self) -> LineString:
+        """
+        Shape as a LineString (x = lon, y = lat).
+        """
+        return LineString(self.coordinates[:, ::-1])
+
+    def maneuver_coordinates(self, maneuver: "Maneuver") -> np.ndarray:
+        """
+        Vertices covered by a maneuver, as a view of ``coordinates``.
+        """
+        return slice_shape(
+            self.coordinates, maneuver.begin_shape_index, maneuver.end_shape_index
+        )
+
+
+class Leg(_DecodedShape, BaseModel):
     maneuvers: list[Maneuver]
     summary: Summary
     shape: str
@@ -60,6 +115,19 @@ class TripLocation(BaseModel):
     side_of_street: str | None = None
 
 
+def concat_legs(legs: list["Leg | LegShape"]) -> np.ndarray:
+    """
+    Whole route geometry as one (n, 2) [lat, lon] array.
+
+    Args:
+        legs (list[Leg | LegShape]): Legs in travel order.
+
+    Returns:
+        np.ndarray: Concatenated coordinates without repeated junction vertices.
+    """
+    return concat_shapes(leg.coordinates for leg in legs)
+
+
 class Trip(BaseModel):
     locations: list[TripLocation]
     legs: list[Leg]
@@ -75,3 +143,90 @@ class Coordinate(BaseModel):
     lng: float
 
 
+class TracePoint(Coordinate):
+    """
+    GPS fix of a trace to map-match.
+
+    Attributes:
+        time (float | None): Epoch seconds of the fix, if known.
+    """
+
+    time: float | None = None
+
+
+class LegShape(_DecodedShape, BaseModel):
+    summary: Summary
+    shape: str
+
+
+class TripSummary(BaseModel):
+    locations: list[TripLocation]
+    summary: Summary
+    status_message: str
+    status: int
+    units: str
+    language: str
+
+
+class TripShapes(TripSummary):
+    legs: list[LegShape]
+
+
+class _LegManeuvers(BaseModel):
+    maneuvers: list[Maneuver]
+
+
+class _TripManeuvers(BaseModel):
+    legs: list[_LegManeuvers]
+
+
+class _TripManeuversResponse(BaseModel):
+    trip: _TripManeuvers
+
+
+class LazyLeg(LegShape):
+    """
+    Leg whose maneuvers are only validated on first access.
+    """
+
+    _trip: "LazyTrip | None" = PrivateAttr(None)
+    _index: int = PrivateAttr(0)
+    _maneuvers: list[Maneuver] | None = PrivateAttr(None)
+
+    @property
+    def maneuvers(self) -> list[Maneuver]:
+        if self._maneuvers is None:
+            if self._trip is None:
+                return []
+            self._trip._load_maneuvers()
+        return self._maneuvers
+
+
+class LazyTrip(TripSummary):
+    """
+    Trip that keeps the raw response and parses maneuvers on first access.
+
+    Behaves like ``Trip`` for reading. ``model_dump`` leaves maneuvers out.
+    """
+
+    legs: list[LazyLeg]
+
+    _raw: bytes | None = PrivateAttr(None)
+
+    def model_post_init(self, context) -> None:
+        for i, leg in enumerate(self.legs):
+            leg._trip = self
+            leg._index = i
+
+    def _load_maneuvers(self) -> None:
+        legs = (
+            _TripManeuversResponse.model_validate_json(self._raw).trip.legs
+            if self._raw is not None
+            else []
+        )
+        for leg, parsed in zip(self.legs, legs):
+            leg._maneuvers = parsed.maneuvers
+        for leg in self.legs[len(legs):]:
+            leg._maneuvers = []
+        # Ya no hace falta la respuesta original
+        self._raw = None
@@ -0,0 +1,457 @@
+"""
+Columnar export of trips for bulk analytics.
+
+A batch of trips is flattened into five tables, one row per:
+
+    trips       trip (summary, status)
+    locations   trip location
+    legs        leg (summary, vertex and maneuver counts)
+    maneuvers   maneuver (street names and exit signs as lists)
+    vertices    decoded shape vertex
+
+Every row carries ``trip_id`` and, below the trip, ``leg_index`` and its own
+position, so the tables join back together. Each table is a directory of
+``part-NNNNN.parquet`` or ``part-NNNNN.arrow`` files that warehouses read as a
+dataset. A part is written under a ``.tmp`` name and renamed once closed, so
+every visible part is complete.
+
+Requires pyarrow (``uv pip install -e .[arrow]``).
+"""
+
+import os
+from glob import glob
+from typing import Any, Iterable, Literal
+
+import numpy as np
+
+from valhalla.parsing import ParsedTrip
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+ExportFormat = Literal['parquet', 'arrow']
+
+TABLES = ("trips", "locations", "legs", "maneuvers", "vertices")
+
+_SUMMARY_FIELDS = (
+    ("time", "float64"),
+    ("length", "float64"),
+    ("cost", "float64"),
+    ("has_time_restrictions", "bool_"),
+    ("has_toll", "bool_"),
+    ("has_highway", "bool_"),
+    ("has_ferry", "bool_"),
+    ("min_lat", "float64"),
+    ("min_lon", "float64"),
+    ("max_lat", "float64"),
+    ("max_lon", "float64"),
+)
+
+_VERBAL_FIELDS = (
+    "verbal_succinct_transition_instruction",
+    "verbal_pre_transition_instruction",
+    "verbal_post_transition_instruction",
+    "verbal_transition_alert_instruction",
+)
+
+
+def _require_pyarrow() -> None:
+    if pa is None:
+        raise ImportError("Columnar export requires pyarrow: uv pip install -e .[arrow]")
+
+
+def trip_schemas() -> dict[str, "pa.Schema"]:
+    """
+    Arrow schema of each exported table.
+
+    Repeated strings (travel modes, street names, status messages...) are
+    dictionary-encoded; free text like instructions is not.
+    """
+    _require_pyarrow()
+    string = pa.dictionary(pa.int32(), pa.string())
+    summary = [(name, getattr(pa, kind)()) for name, kind in _SUMMARY_FIELDS]
+    return {
+        "trips": pa.schema(
+            [
+                ("trip_id", pa.int64()),
+                ("status", pa.int32()),
+                ("status_message", string),
+                ("units", string),
+                ("language", string),
+                ("legs", pa.int32()),
+                *summary,
+            ]
+        ),
+        "locations": pa.schema(
+            [
+                ("trip_id", pa.int64()),
+                ("location_index", pa.int32()),
+                ("type", string),
+                ("lat", pa.float64()),
+                ("lon", pa.float64()),
+                ("original_index", pa.int32()),
+                ("side_of_street", string),
+            ]
+        ),
+        "legs": pa.schema(
+            [
+                ("trip_id", pa.int64()),
+                ("leg_index", pa.int32()),
+                ("vertices", pa.int32()),
+                ("maneuvers", pa.int32()),
+                *summary,
+            ]
+        ),
+        "maneuvers": pa.schema(
+            [
+                ("trip_id", pa.int64()),
+                ("leg_index", pa.int32()),
+                ("maneuver_index", pa.int32()),
+                ("type", pa.int16()),
+                ("instruction", pa.string()),
+                ("time", pa.float64()),
+                ("length", pa.float64()),
+                ("cost", pa.float64()),
+                ("begin_shape_index", pa.int32()),
+                ("end_shape_index", pa.int32()),
+                ("travel_mode", string),
+                ("travel_type", string),
+                ("street_names", pa.list_(string)),
+                ("bearing_before", pa.float64()),
+                ("bearing_after", pa.float64()),
+                ("exit_toward", pa.list_(string)),
+                *((name, pa.string()) for name in _VERBAL_FIELDS),
+                ("verbal_multi_cue", pa.bool_()),
+            ]
+        ),
+        "vertices": pa.schema(
+            [
+                ("trip_id", pa.int64()),
+                ("leg_index", pa.int32()),
+                ("vertex_index", pa.int32()),
+                ("lat", pa.float64()),
+                ("lon", pa.float64()),
+            ]
+        ),
+    }
+
+
+class _Dictionary:
+    """
+    Values of a dictionary-encoded column, shared by every batch of a writer.
+
+    Values are only appended, so each batch's dictionary extends the previous
+    one: Arrow IPC writes just the new entries (a delta) and old indices stay
+    valid.
+    """
+
+    def __init__(self) -> None:
+        self.index: dict[str, int] = {}
+        self.values: list[str] = []
+
+    def encode(self, values: list[str | None]) -> np.ndarray:
+        codes = np.empty(len(values), dtype=np.int32)
+        for i, value in enumerate(values):
+            if value is None:
+                codes[i] = -1
+                continue
+            code = self.index.get(value)
+            if code is None:
+                code = self.index[value] = len(self.values)
+                self.values.append(value)
+            codes[i] = code
+        return codes
+
+    def array(self, values: list[str | None]) -> "pa.DictionaryArray":
+        codes = self.encode(values)
+        return pa.DictionaryArray.from_arrays(
+            pa.array(codes, mask=codes < 0), pa.array(self.values, pa.string())
+        )
+
+
+def _summary_values(summary) -> list[Any]:
+    return [getattr(summary, name) for name, _ in _SUMMARY_FIELDS]
+
+
+class TripWriter:
+    """
+    Write trips to columnar tables incrementally.
+
+    Rows are buffered per table and written as one Parquet row group or Arrow
+    record batch per table once any table holds ``batch_rows`` rows (usually
+    ``vertices``), so memory stays bounded however many trips are written.
+    Shape vertices are copied straight from the decoded NumPy arrays.
+
+    ``commit`` closes the open parts so that everything written so far is
+    readable; later trips go to new parts.
+
+    Usage:
+        with TripWriter("out/") as writer:
+            for trip_id, trip in results:
+                writer.write(trip, trip_id)
+        tables = read_trip_tables("out/")
+    """
+
+    def __init__(
+        self,
+        path: str,
+        format: ExportFormat = 'parquet',
+        batch_rows: int = 65536,
+        compression: str | None = None,
+    ) -> None:
+        """
+        Args:
+            path (str): Directory with one subdirectory per table, created if
+                needed. Files already there are kept; this writer adds a new part.
+            format (ExportFormat, optional): 'parquet' or 'arrow' (IPC file).
+                Defaults to 'parquet'.
+            batch_rows (int, optional): Buffered rows of a table that trigger a
+                write. Defaults to 65536.
+            compression (str | None, optional): Codec, e.g. 'zstd'. Defaults to
+                'snappy' for Parquet and none for Arrow, which keeps Arrow files
+                readable without copies.
+
+        Raises:
+            ImportError: If pyarrow is not installed.
+            ValueError: If ``format`` is unknown.
+        """
+        _require_pyarrow()
+        if format not in ('parquet', 'arrow'):
+            raise ValueError(f"Unknown export format: {format}")
+        self.path = path
+        self.format = format
+        self.batch_rows = batch_rows
+        self.compression = compression
+        self.schemas = trip_schemas()
+        self._dictionaries: dict[tuple[str, str], _Dictionary] = {}
+        self._rows: dict[str, dict[str, list]] = {}
+        self._sizes: dict[str, int] = {}
+        self._writers: dict[str, tuple[Any, str]] = {}
+        self._next_id = 0
+        self.trips_written = 0
+        self._reset()
+
+    def _reset(self) -> None:
+        self._rows = {name: {f.name: [] for f in schema} for name, schema in self.schemas.items()}
+        self._sizes = dict.fromkeys(self.schemas, 0)
+
+    def write(self, trip: ParsedTrip, trip_id: int | None = None) -> int:
+        """
+        Buffer one trip, writing a batch if the buffer is full.
+
+        Any trip projection is accepted: trips without maneuvers or legs (e.g.
+        'summary') just add no rows to those tables.
+
+        Args:
+            trip (ParsedTrip): Trip to export.
+            trip_id (int | None, optional): Its ID in the tables. Defaults to one
+                more than the last ID written.
+
+        Returns:
+            int: The trip ID.
+        """
+        if trip_id is None:
+            trip_id = self._next_id
+        self._next_id = trip_id + 1
+        legs = getattr(trip, "legs", [])
+
+        self._append(
+            "trips",
+            [trip_id, trip.status, trip.status_message, trip.units, trip.language, len(legs)]
+            + _summary_values(trip.summary),
+        )
+        for i, location in enumerate(trip.locations):
+            self._append(
+                "locations",
+                [
+                    trip_id,
+                    i,
+                    location.type,
+                    location.lat,
+                    location.lon,
+                    location.original_index,
+                    location.side_of_street,
+                ],
+            )
+        for leg_index, leg in enumerate(legs):
+            coords = leg.coordinates
+            maneuvers = getattr(leg, "maneuvers", [])
+            self._append(
+                "legs",
+                [trip_id, leg_index, len(coords), len(maneuvers)] + _summary_values(leg.summary),
+            )
+            for i, m in enumerate(maneuvers):
+                exit_toward = (
+                    [e.text for e in m.sign.exit_toward_elements]
+                    if m.sign and m.sign.exit_toward_elements
+                    else None
+                )
+                self._append(
+                    "maneuvers",
+                    [
+                        trip_id,
+                        leg_index,
+                        i,
+                        m.type,
+                        m.instruction,
+                        m.time,
+                        m.length,
+                        m.cost,
+                        m.begin_shape_index,
+                        m.end_shape_index,
+                        m.travel_mode,
+                        m.travel_type,
+                        m.street_names,
+                        m.bearing_before,
+                        m.bearing_after,
+                        exit_toward,
+                        *(getattr(m, name) for name in _VERBAL_FIELDS),
+                        m.verbal_multi_cue,
+                    ],
+                )
+            # Vértices por columnas: trozos NumPy sin pasar por objetos Python
+            n = len(coords)
+            columns = self._rows["vertices"]
+            columns["trip_id"].append(np.full(n, trip_id, dtype=np.int64))
+            columns["leg_index"].append(np.full(n, leg_index, dtype=np.int32))
+            columns["vertex_index"].append(np.arange(n, dtype=np.int32))
+            columns["lat"].append(coords[:, 0])
+            columns["lon"].append(coords[:, 1])
+            self._sizes["vertices"] += n
+
+        self.trips_written += 1
+        if max(self._sizes.values()) >= self.batch_rows:
+            self.flush()
+        return trip_id
+
+    def write_many(self, trips: Iterable[ParsedTrip]) -> None:
+        for trip in trips:
+            self.write(trip)
+
+    def _append(self, table: str, values: list[Any]) -> None:
+        for column, value in zip(self._rows[table].values(), values):
+            column.append(value)
+        self._sizes[table] += 1
+
+    def _column(self, table: str, field: "pa.Field", values: list) -> "pa.Array":
+        if table == "vertices":
+            return pa.array(np.concatenate(values), field.type)
+        if pa.types.is_dictionary(field.type):
+            dictionary = self._dictionaries.setdefault((table, field.name), _Dictionary())
+            return dictionary.array(values)
+        if pa.types.is_list(field.type):
+            dictionary = self._dictionaries.setdefault((table, field.name), _Dictionary())
+            offsets = np.zeros(len(values) + 1, dtype=np.int32)
+            flat: list[str] = []
+            for i, items in enumerate(values):
+                flat.extend(items or ())
+                offsets[i + 1] = len(flat)
+            return pa.ListArray.from_arrays(
+                pa.array(offsets),
+                dictionary.array(flat),
+                mask=pa.array([items is None for items in values]),
+            )
+        return pa.array(values, field.type)
+
+    def _open(self, table: str) -> tuple[Any, str]:
+        directory = os.path.join(self.path, table)
+        os.makedirs(directory, exist_ok=True)
+        # Las partes a medias de un proceso caído también cuentan, para no pisarlas
+        part = len(glob(os.path.join(directory, "part-*")))
+        file = os.path.join(directory, f"part-{part:05d}.{self.format}")
+        schema = self.schemas[table]
+        if self.format == "parquet":
+            writer = pq.ParquetWriter(
+                file + ".tmp", schema, compression=self.compression or "snappy"
+            )
+        else:
+            options = pa.ipc.IpcWriteOptions(
+                compression=self.compression, emit_dictionary_deltas=True
+            )
+            writer = pa.ipc.new_file(file + ".tmp", schema, options=options)
+        return writer, file
+
+    def flush(self) -> None:
+        """
+        Write the buffered rows: one row group or record batch per non-empty table.
+        """
+        for table, schema in self.schemas.items():
+            if not self._sizes[table]:
+                continue
+            columns = self._rows[table]
+            batch = pa.record_batch(
+                [self._column(table, field, columns[field.name]) for field in schema],
+                schema=schema,
+            )
+            if table not in self._writers:
+                self._writers[table] = self._open(table)
+            self._writers[table][0].write_batch(batch)
+        self._reset()
+
+    def commit(self) -> None:
+        """
+        Flush and close the open parts, making every trip written so far
+        readable. Parquet and Arrow files only get their footer when closed, so
+        a checkpoint must call this rather than ``flush``. Trips written after
+        it go to new parts.
+        """
+        try:
+            self.flush()
+        finally:
+            writers, self._writers = self._writers, {}
+            for writer, file in writers.values():
+                writer.close()
+                os.replace(file + ".tmp", file)
+
+    def close(self) -> None:
+        """
+        Flush and close every file. Tables that got no rows have no file.
+        """
+        self.commit()
+
+    def __enter__(self) -> "TripWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def read_trip_tables(
+    path: str, tables: Iterable[str] = TABLES
+) -> dict[str, "pa.Table"]:
+    """
+    Read exported tables back, memory-mapping the files.
+
+    Uncompressed Arrow files are not copied: the columns point into the mapped
+    files, so tables larger than memory can be read and sliced, and pages are
+    only loaded when touched. Parquet has to be decoded, so it is read into
+    memory (from a mapped file).
+
+    Args:
+        path (str): Directory given to ``TripWriter``.
+        tables (Iterable[str], optional): Tables to read. Defaults to all.
+
+    Raises:
+        ImportError: If pyarrow is not installed.
+
+    Returns:
+        dict[str, pa.Table]: Tables by name, with all their parts concatenated;
+        tables with no files are left out.
+    """
+    _require_pyarrow()
+    result = {}
+    for table in tables:
+        parts = []
+        # Las partes .tmp siguen abiertas o quedaron de un proceso caído
+        for file in sorted(glob(os.path.join(path, table, "part-*"))):
+            if file.endswith(".arrow"):
+                parts.append(pa.ipc.open_file(pa.memory_map(file)).read_all())
+            elif file.endswith(".parquet"):
+                parts.append(pq.read_table(file, memory_map=True))
+        if parts:
+            # Cada parte conserva su diccionario como un trozo más de la columna
+            result[table] = pa.concat_tables(parts)
+    return result
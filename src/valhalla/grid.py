@@ -0,0 +1,420 @@
+"""
+Precomputed reachability grid.
+
+Isochrones of a fixed set of origins (depots, stores...) for a few contour
+times and costing models are rasterized once onto a regular lat/lng grid. The
+grid is stored as a memory-mapped bitset, one bit per (origin, costing, minutes)
+and cell, so reachability queries for those origins are array lookups instead
+of Valhalla calls.
+
+Build or update it from the command line:
+
+    valhalla-grid grid/ --origins depots.json --bounds 36.4 -4.9 37.0 -4.0 \\
+        --minutes 10 20 30 --costing auto bicycle
+
+``depots.json`` is a list of ``{"lat": ..., "lng": ...}``. Running it again with
+a different list only computes the new origins and drops the missing ones.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+from dataclasses import dataclass
+from logging import getLogger
+from pathlib import Path
+from typing import Literal
+
+import numpy as np
+import shapely
+
+from valhalla.coordinates import Coordinates, as_coordinate_array
+from valhalla.entities import Coordinate
+from valhalla.reachability import ReachabilityMatrix, batch_filter_by_location_polygon
+from valhalla.isochrone import get_isochrone_geometries
+from valhalla.spatial import PointIndex
+from valhalla.valhalla import settings
+
+logger = getLogger(__name__)
+
+META_FILE = "meta.json"
+BITS_FILE = "bits.npy"
+
+Bounds = tuple[float, float, float, float]
+
+
+@dataclass
+class _Slot:
+    """
+    Origin stored in the grid. ``clipped`` is True if one of its isochrones
+    extends beyond the grid bounds.
+    """
+
+    lat: float
+    lng: float
+    clipped: bool = False
+
+
+class ReachabilityGrid:
+    """
+    Reachability of origins × costings × contour times rasterized on a grid.
+
+    Each cell is marked as reachable if its center is inside the isochrone, so
+    answers are exact up to the cell size. Bits are packed per cell, in uint8,
+    with ``(slot * len(costings) + costing) * len(minutes) + minutes`` as bit
+    index.
+
+    Usage:
+        grid = ReachabilityGrid.create("grid/", (36.4, -4.9, 37.0, -4.0), 0.001, [15, 30], ["auto"])
+        await grid.build(depots)
+        result = await grid.reachability(depots, [15], customers)  # sin llamar a Valhalla
+        result.reachable[:, 0]  # (depots, customers)
+    """
+
+    def __init__(self, path: str | Path, meta: dict, bits: np.ndarray) -> None:
+        self.path = Path(path)
+        self.bounds: Bounds = tuple(meta["bounds"])
+        self.cell_deg: float = meta["cell_deg"]
+        self.minutes: list[int] = meta["minutes"]
+        self.costings: list[str] = meta["costings"]
+        self.slots: list[_Slot | None] = [
+            None if slot is None else _Slot(**slot) for slot in meta["slots"]
+        ]
+        self.bits = bits
+        min_lat, min_lng, max_lat, max_lng = self.bounds
+        self.rows = int(np.ceil((max_lat - min_lat) / self.cell_deg))
+        self.cols = int(np.ceil((max_lng - min_lng) / self.cell_deg))
+        self._cells: PointIndex | None = None
+        self._slot_of = self._index_slots()
+
+    @classmethod
+    def create(
+        cls,
+        path: str | Path,
+        bounds: Bounds,
+        cell_deg: float,
+        minutes: list[int],
+        costings: list[str],
+    ) -> "ReachabilityGrid":
+        """
+        Empty grid on disk, overwriting any existing one in ``path``.
+
+        Args:
+            path (str | Path): Directory for the grid files.
+            bounds (Bounds): (min_lat, min_lng, max_lat, max_lng) covered.
+            cell_deg (float): Cell side in degrees (0.001 ~ 110 m of latitude).
+            minutes (list[int]): Contour times to store.
+            costings (list[str]): Costing models to store.
+
+        Returns:
+            ReachabilityGrid: The grid, with no origins yet.
+        """
+        meta = {
+            "bounds": list(bounds),
+            "cell_deg": cell_deg,
+            "minutes": sorted(set(minutes)),
+            "costings": list(dict.fromkeys(costings)),
+            "slots": [],
+        }
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        grid = cls(path, meta, np.zeros((0, 0), dtype=np.uint8))
+        grid.bits = grid._allocate(0)
+        grid._save_meta()
+        return grid
+
+    @classmethod
+    def open(cls, path: str | Path, writable: bool = False) -> "ReachabilityGrid":
+        """
+        Open a grid built before. The bitset is memory-mapped, not loaded.
+
+        Args:
+            path (str | Path): Directory of the grid.
+            writable (bool, optional): Open for ``build``. Defaults to False.
+        """
+        path = Path(path)
+        with open(path / META_FILE) as f:
+            meta = json.load(f)
+        bits = np.load(path / BITS_FILE, mmap_mode="r+" if writable else "r")
+        return cls(path, meta, bits)
+
+    def _allocate(self, n_slots: int) -> np.ndarray:
+        """
+        Bitset file sized for ``n_slots`` origins, keeping the current bits.
+        """
+        n_bytes = -(-n_slots * len(self.costings) * len(self.minutes) // 8)
+        file = self.path / BITS_FILE
+        tmp = self.path / (BITS_FILE + ".tmp")
+        bits = np.lib.format.open_memmap(
+            tmp, mode="w+", dtype=np.uint8, shape=(self.rows * self.cols, n_bytes)
+        )
+        old = self.bits
+        if old.size:
+            bits[:, :old.shape[1]] = old
+        bits.flush()
+        del bits
+        os.replace(tmp, file)
+        return np.load(file, mmap_mode="r+")
+
+    def _save_meta(self) -> None:
+        meta = {
+            "bounds": list(self.bounds),
+            "cell_deg": self.cell_deg,
+            "minutes": self.minutes,
+            "costings": self.costings,
+            "slots": [None if s is None else vars(s) for s in self.slots],
+        }
+        tmp = self.path / (META_FILE + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp, self.path / META_FILE)
+
+    @staticmethod
+    def _key(lat: float, lng: float) -> tuple[float, float]:
+        # Mismo redondeo que las claves de las cachés
+        precision = settings.cache_precision
+        return (round(lat, precision), round(lng, precision))
+
+    def _index_slots(self) -> dict[tuple[float, float], int]:
+        return {self._key(s.lat, s.lng): i for i, s in enumerate(self.slots) if s is not None}
+
+    def _layer(self, slot: int, costing: str, minutes: int) -> int:
+        c = self.costings.index(costing)
+        m = self.minutes.index(minutes)
+        return (slot * len(self.costings) + c) * len(self.minutes) + m
+
+    @property
+    def cells(self) -> PointIndex:
+        """
+        Index over the cell centers, used to rasterize the isochrones.
+        """
+        if self._cells is None:
+            min_lat, min_lng = self.bounds[0], self.bounds[1]
+            lat = min_lat + (np.arange(self.rows) + 0.5) * self.cell_deg
+            lng = min_lng + (np.arange(self.cols) + 0.5) * self.cell_deg
+            # Celda = fila * cols + columna
+            self._cells = PointIndex(np.tile(lng, self.rows), np.repeat(lat, self.cols))
+        return self._cells
+
+    def _cell_of(self, lat: np.ndarray, lng: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Cell of each point and whether it falls inside the grid.
+        """
+        row = np.floor((lat - self.bounds[0]) / self.cell_deg).astype(np.int64)
+        col = np.floor((lng - self.bounds[1]) / self.cell_deg).astype(np.int64)
+        inside = (row >= 0) & (row < self.rows) & (col >= 0) & (col < self.cols)
+        return np.where(inside, row * self.cols + col, 0), inside
+
+    def _set_layer(self, layer: int, cells: np.ndarray | None) -> None:
+        byte, mask = layer >> 3, np.uint8(0x80 >> (layer & 7))
+        self.bits[:, byte] &= ~mask
+        if cells is not None and cells.size:
+            self.bits[cells, byte] |= mask
+
+    async def build(self, origins: list[Coordinate], max_concurrency: int = 8) -> list[Coordinate]:
+        """
+        Make the grid hold exactly these origins.
+
+        Origins already in the grid are kept as they are, origins no longer in
+        the list are cleared, and only the new ones are requested from Valhalla
+        and rasterized. Freed slots are reused before the bitset grows.
+
+        Args:
+            origins (list[Coordinate]): Origins the grid should answer for.
+            max_concurrency (int, optional): Origins computed at once. Defaults to 8.
+
+        Returns:
+            list[Coordinate]: Origins whose isochrones failed; they stay out of
+            the grid and queries for them go to Valhalla.
+        """
+        wanted = {self._key(o.lat, o.lng): o for o in origins}
+        current = self._slot_of
+
+        for key, slot in current.items():
+            if key not in wanted:
+                for costing in self.costings:
+                    for m in self.minutes:
+                        self._set_layer(self._layer(slot, costing, m), None)
+                self.slots[slot] = None
+
+        new = [o for key, o in wanted.items() if key not in current]
+        free = [i for i, s in enumerate(self.slots) if s is None]
+        if len(new) > len(free):
+            # Crece al doble para que añadir orígenes de uno en uno no reescriba el fichero cada vez
+            grow = max(len(new) - len(free), len(self.slots))
+            self.slots.extend([None] * grow)
+            self.bits = self._allocate(len(self.slots))
+            free = [i for i, s in enumerate(self.slots) if s is None]
+
+        semaphore = asyncio.Semaphore(max_concurrency)
+        failed = []
+
+        async def add(origin: Coordinate, slot: int) -> None:
+            try:
+                async with semaphore:
+                    geometries = await asyncio.gather(
+                        *(
+                            get_isochrone_geometries(origin, self.minutes, costing, settings)
+                            for costing in self.costings
+                        )
+                    )
+            except Exception as e:
+                logger.error("Grid isochrones failed for %s: %s", origin, e)
+                failed.append(origin)
+                return
+            grid_box = shapely.box(self.bounds[1], self.bounds[0], self.bounds[3], self.bounds[2])
+            clipped = False
+            for costing, by_minutes in zip(self.costings, geometries):
+                for m in self.minutes:
+                    geometry = by_minutes[m]
+                    clipped |= not grid_box.contains(geometry)
+                    self._set_layer(self._layer(slot, costing, m), self.cells.within(geometry))
+            self.slots[slot] = _Slot(origin.lat, origin.lng, bool(clipped))
+
+        await asyncio.gather(*(add(o, slot) for o, slot in zip(new, free)))
+        self.bits.flush()
+        self._save_meta()
+        self._slot_of = self._index_slots()
+        return failed
+
+    def covers(self, origin: Coordinate) -> bool:
+        return self._key(origin.lat, origin.lng) in self._slot_of
+
+    def lookup(
+        self,
+        origins: list[Coordinate],
+        minutes: list[int],
+        coords_to_check: Coordinates,
+        costing: str = 'auto',
+    ) -> ReachabilityMatrix:
+        """
+        Reachability from origins in the grid, without calling Valhalla.
+
+        Points outside the grid are unreachable, which is exact unless an
+        origin's isochrone was clipped by the bounds (see ``reachability``).
+
+        Raises:
+            KeyError: If an origin, contour time or costing is not in the grid.
+
+        Returns:
+            ReachabilityMatrix: Shape (origins, minutes, points).
+        """
+        slots = [self._slot_of[self._key(o.lat, o.lng)] for o in origins]
+        if costing not in self.costings or not set(minutes) <= set(self.minutes):
+            raise KeyError(f"{costing} / {minutes} not in grid")
+        points = as_coordinate_array(coords_to_check)
+        cell, inside = self._cell_of(points.lat, points.lng)
+
+        layers = np.array(
+            [self._layer(s, costing, m) for s in slots for m in minutes], dtype=np.int64
+        )
+        values = self.bits[cell[:, None], layers >> 3]
+        bits = (values >> (7 - (layers & 7)).astype(np.uint8)) & 1
+        reachable = bits.astype(bool) & inside[:, None]
+        reachable = reachable.T.reshape(len(origins), len(minutes), len(points))
+        return ReachabilityMatrix(
+            minutes=list(minutes),
+            reachable=reachable,
+            failed=np.zeros((len(origins), len(minutes)), dtype=bool),
+        )
+
+    async def reachability(
+        self,
+        origins: list[Coordinate],
+        minutes: list[int],
+        coords_to_check: Coordinates,
+        costing: Literal['auto', 'pedestrian', 'bicycle'] = 'auto',
+    ) -> ReachabilityMatrix:
+        """
+        Same result as ``batch_filter_by_location_polygon``, answered from the
+        grid where possible.
+
+        Origins not in the grid, contour times or costings not stored, and
+        clipped origins asked about points outside the grid go to Valhalla.
+
+        Args:
+            origins (list[Coordinate]): Isochrone centers.
+            minutes (list[int]): Contour times in minutes.
+            coords_to_check (Coordinates): Candidate points.
+            costing (Literal['auto', 'pedestrian', 'bicycle'], optional): Costing
+                model. Defaults to 'auto'.
+
+        Returns:
+            ReachabilityMatrix: Shape (origins, minutes, points).
+        """
+        points = as_coordinate_array(coords_to_check)
+        stored = costing in self.costings and set(minutes) <= set(self.minutes)
+        _, inside = self._cell_of(points.lat, points.lng)
+        all_inside = bool(inside.all())
+
+        cached, live = [], []
+        for i, origin in enumerate(origins):
+            slot = self._slot_of.get(self._key(origin.lat, origin.lng))
+            if stored and slot is not None and (all_inside or not self.slots[slot].clipped):
+                cached.append(i)
+            else:
+                live.append(i)
+
+        result = ReachabilityMatrix(
+            minutes=list(minutes),
+            reachable=np.zeros((len(origins), len(minutes), len(points)), dtype=bool),
+            failed=np.zeros((len(origins), len(minutes)), dtype=bool),
+        )
+        if cached:
+            found = self.lookup([origins[i] for i in cached], minutes, points, costing)
+            result.reachable[cached] = found.reachable
+        if live:
+            fetched = await batch_filter_by_location_polygon(
+                [origins[i] for i in live], minutes, points, costing
+            )
+            result.reachable[live] = fetched.reachable
+            result.failed[live] = fetched.failed
+        return result
+
+
+def _load_origins(file: str) -> list[Coordinate]:
+    with open(file) as f:
+        return [Coordinate(**o) for o in json.load(f)]
+
+
+async def _build(args: argparse.Namespace) -> list[Coordinate]:
+    path = Path(args.path)
+    if (path / META_FILE).exists() and not args.recreate:
+        grid = ReachabilityGrid.open(path, writable=True)
+    else:
+        if args.bounds is None:
+            raise SystemExit("--bounds is required to create a grid")
+        grid = ReachabilityGrid.create(path, tuple(args.bounds), args.cell, args.minutes, args.costing)
+    return await grid.build(_load_origins(args.origins), args.concurrency)
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(
+        prog="valhalla-grid",
+        description="Build or update a precomputed reachability grid.",
+    )
+    parser.add_argument("path", help="Grid directory")
+    parser.add_argument("--origins", required=True, help="JSON list of {lat, lng}")
+    parser.add_argument(
+        "--bounds", type=float, nargs=4, metavar=("MIN_LAT", "MIN_LNG", "MAX_LAT", "MAX_LNG")
+    )
+    parser.add_argument("--cell", type=float, default=0.001, help="Cell side in degrees")
+    parser.add_argument("--minutes", type=int, nargs="+", default=[10, 20, 30])
+    parser.add_argument(
+        "--costing", nargs="+", default=["auto"], choices=["auto", "pedestrian", "bicycle"]
+    )
+    parser.add_argument("-c", "--concurrency", type=int, default=8)
+    parser.add_argument(
+        "--recreate", action="store_true", help="Start from scratch with the given bounds/minutes"
+    )
+    args = parser.parse_args(argv)
+
+    failed = asyncio.run(_build(args))
+    if failed:
+        print(f"{len(failed)} origins failed and were left out of the grid", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
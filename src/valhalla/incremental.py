@@ -0,0 +1,265 @@
+import asyncio
+import time
+from logging import getLogger
+from typing import Literal
+
+import numpy as np
+
+from valhalla.entities import Coordinate, Leg, Trip, TripLocation
+from valhalla.matrix import get_cost_block, get_cost_matrix
+from valhalla.optimizer import UNREACHABLE_PENALTY, _cost_table, improve_route
+from valhalla.planner import haversine_km, merge_summaries
+from valhalla.valhalla import get_optimal_route, get_route, settings
+
+logger = getLogger(__name__)
+
+# Paradas a cada lado del cambio que entran en la mejora local
+IMPROVE_WINDOW = 4
+
+# Piernas por id de parada: dos paradas en la misma coordenada no comparten pierna
+LegKey = tuple[int, int]
+
+
+class IncrementalRoute:
+    """
+    Optimized tour that is updated one stop at a time instead of re-optimized.
+
+    The visiting order and the legs already received from Valhalla are kept
+    between updates. A new stop goes in by cheapest insertion, using one row and
+    one column of the cost matrix; a removed stop is spliced out. Then 2-opt and
+    Or-opt run on the few stops around the change, and /route is called only for
+    the legs that are not cached yet. The first and last stops of the tour stay
+    fixed, like /optimized_route.
+
+    Usage:
+        route = await IncrementalRoute.create(stops)
+        trip = await route.add(new_stop)
+        trip = await route.remove(3)
+    """
+
+    def __init__(
+        self,
+        locations: list[Coordinate],
+        order: list[int],
+        legs: list[Leg],
+        costing: Literal['auto', 'pedestrian', 'bicycle'] = 'auto',
+        window: int = IMPROVE_WINDOW,
+        time_budget: float = 0.1,
+    ) -> None:
+        """
+        Args:
+            locations (list[Coordinate]): Stops; ``order`` and ``original_index``
+                in the trips refer to positions in this list.
+            order (list[int]): Current visiting order.
+            legs (list[Leg]): Legs of that order, ``legs[i]`` from ``order[i]`` to
+                ``order[i + 1]``.
+            costing (Literal['auto', 'pedestrian', 'bicycle'], optional): Costing
+                model. Defaults to 'auto'.
+            window (int, optional): Stops on each side of a change that the local
+                improvement may reorder. Defaults to IMPROVE_WINDOW.
+            time_budget (float, optional): Seconds for the local improvement.
+                Defaults to 0.1.
+        """
+        self.locations = list(locations)
+        # Id estable de cada parada de ``locations``; los índices cambian al quitar paradas
+        self._ids = list(range(len(self.locations)))
+        self._next_id = len(self.locations)
+        self.order = list(order)
+        self.costing = costing
+        self.window = window
+        self.time_budget = time_budget
+        self._legs: dict[LegKey, Leg] = {}
+        for (a, b), leg in zip(self._pairs(), legs):
+            self._legs[self._leg_key(a, b)] = leg
+        self._trip: Trip | None = None
+
+    @classmethod
+    async def create(
+        cls,
+        locations: list[Coordinate],
+        costing: Literal['auto', 'pedestrian', 'bicycle'] = 'auto',
+        **kwargs,
+    ) -> "IncrementalRoute | None":
+        """
+        Start from a full optimization with ``get_optimal_route``.
+
+        Returns:
+            IncrementalRoute | None: The route, or None if Valhalla failed.
+        """
+        trip = await get_optimal_route(locations, costing)
+        if trip is None:
+            return None
+        order = [loc.original_index for loc in trip.locations]
+        route = cls(locations, order, trip.legs, costing, **kwargs)
+        route._trip = trip
+        return route
+
+    @property
+    def trip(self) -> Trip | None:
+        """
+        Trip of the current order, as returned by the last update.
+        """
+        return self._trip
+
+    def _pairs(self) -> list[tuple[int, int]]:
+        return list(zip(self.order, self.order[1:]))
+
+    def _leg_key(self, a: int, b: int) -> LegKey:
+        return (self._ids[a], self._ids[b])
+
+    async def add(self, location: Coordinate) -> Trip | None:
+        """
+        Insert a stop at its cheapest position and update the trip.
+
+        The stop is appended to ``locations``, so its ``original_index`` is the
+        last one.
+
+        Returns:
+            Trip | None: Updated trip, or None if a leg could not be fetched. The
+            new order is kept and missing legs are requested on the next update.
+        """
+        index = len(self.locations)
+        self.locations.append(location)
+        self._ids.append(self._next_id)
+        self._next_id += 1
+        if len(self.order) < 2:
+            self.order.append(index)
+            return await self._refresh()
+
+        position = await self._cheapest_position(location)
+        self.order.insert(position, index)
+        await self._improve(position)
+        return await self._refresh()
+
+    async def remove(self, index: int) -> Trip | None:
+        """
+        Splice a stop out of the tour and update the trip.
+
+        Stops after ``index`` in ``locations`` shift down by one, like ``list.pop``.
+
+        Returns:
+            Trip | None: Updated trip, or None if a leg could not be fetched.
+        """
+        position = self.order.index(index)
+        del self.order[position]
+        self.locations.pop(index)
+        self._ids.pop(index)
+        self.order = [i - 1 if i > index else i for i in self.order]
+        if 0 < position < len(self.order):
+            await self._improve(position)
+        return await self._refresh()
+
+    async def _cheapest_position(self, location: Coordinate) -> int:
+        """
+        Position in ``order`` where inserting the stop adds the least time.
+        """
+        tour = [self.locations[i] for i in self.order]
+        pairs = self._pairs()
+        legs = [self._legs.get(self._leg_key(a, b)) for a, b in pairs]
+        # Las piernas sin ruta todavía se piden a la matriz en vez de contar como gratis
+        missing = [k for k, leg in enumerate(legs) if leg is None]
+        size = settings.matrix_block_size
+        chunks = [missing[i:i + size] for i in range(0, len(missing), size)]
+        try:
+            to_new, from_new, *blocks = await asyncio.gather(
+                get_cost_block(tour, [location], self.costing),
+                get_cost_block([location], tour, self.costing),
+                *(
+                    get_cost_block(
+                        [tour[k] for k in chunk], [tour[k + 1] for k in chunk], self.costing
+                    )
+                    for chunk in chunks
+                ),
+            )
+            to_new, from_new = to_new[:, 0], from_new[0]
+            current = np.array([np.nan if leg is None else leg.summary.time for leg in legs])
+            for chunk, block in zip(chunks, blocks):
+                current[chunk] = np.diagonal(block)
+        except Exception as e:
+            # Sin matriz se inserta por distancia en línea recta
+            logger.warning("Insertion costs failed (%s); using straight-line distance", e)
+            lat = np.array([loc.lat for loc in tour])
+            lng = np.array([loc.lng for loc in tour])
+            to_new = from_new = haversine_km(lat, lng, location.lat, location.lng)
+            current = haversine_km(lat[:-1], lng[:-1], lat[1:], lng[1:])
+
+        to_new = np.where(np.isfinite(to_new), to_new, UNREACHABLE_PENALTY)
+        from_new = np.where(np.isfinite(from_new), from_new, UNREACHABLE_PENALTY)
+        current = np.where(np.isfinite(current), current, UNREACHABLE_PENALTY)
+        delta = to_new[:-1] + from_new[1:] - current
+        return int(np.argmin(delta)) + 1
+
+    async def _improve(self, position: int) -> None:
+        """
+        2-opt and Or-opt on the stops around ``position``, ends of the window fixed.
+        """
+        start = max(0, position - self.window)
+        stop = min(len(self.order), position + self.window + 1)
+        window = self.order[start:stop]
+        if len(window) < 4:
+            return
+        try:
+            matrix = await get_cost_matrix(
+                [self.locations[i] for i in window], self.costing
+            )
+        except Exception as e:
+            logger.warning("Local improvement skipped: %s", e)
+            return
+        deadline = time.perf_counter() + self.time_budget
+        route = improve_route(list(range(len(window))), _cost_table(matrix), deadline)
+        self.order[start:stop] = [window[i] for i in route]
+
+    async def _refresh(self) -> Trip | None:
+        """
+        Request the legs missing from the cache and rebuild the trip.
+        """
+        pairs = self._pairs()
+        missing = [k for k, (a, b) in enumerate(pairs) if self._leg_key(a, b) not in self._legs]
+
+        # Piernas consecutivas que faltan: una sola petición /route por tramo
+        runs: list[list[int]] = []
+        for k in missing:
+            if runs and runs[-1][-1] == k - 1:
+                runs[-1].append(k)
+            else:
+                runs.append([k])
+
+        async def fetch(run: list[int]) -> None:
+            stops = self.order[run[0]:run[-1] + 2]
+            trip = await get_route([self.locations[i] for i in stops], self.costing)
+            if trip is None:
+                raise ValueError("No 'trip' in route response")
+            for a, b, leg in zip(stops, stops[1:], trip.legs):
+                self._legs[self._leg_key(a, b)] = leg
+
+        try:
+            await asyncio.gather(*(fetch(run) for run in runs))
+        except Exception as e:
+            logger.error("Incremental /route failed: %s", e)
+            return None
+
+        # Solo se guardan las piernas del orden actual
+        legs = [self._legs[self._leg_key(a, b)] for a, b in pairs]
+        self._legs = {self._leg_key(a, b): leg for (a, b), leg in zip(pairs, legs)}
+        self._trip = self._build_trip(legs) if legs else None
+        return self._trip
+
+    def _build_trip(self, legs: list[Leg]) -> Trip:
+        previous = self._trip
+        return Trip(
+            locations=[
+                TripLocation(
+                    type="break",
+                    lat=self.locations[i].lat,
+                    lon=self.locations[i].lng,
+                    original_index=i,
+                )
+                for i in self.order
+            ],
+            legs=legs,
+            summary=merge_summaries([leg.summary for leg in legs]),
+            status_message=previous.status_message if previous else "Found route between points",
+            status=previous.status if previous else 0,
+            units=previous.units if previous else "kilometers",
+            language=previous.language if previous else "en-US",
+        )
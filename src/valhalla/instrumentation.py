@@ -0,0 +1,240 @@
+"""
+Timing of every Valhalla call, split by endpoint and phase.
+
+Phases:
+    request   whole HTTP call, as seen by the client
+    connect   TCP (and TLS) connection setup, only when a new connection is opened
+    server    from the request being sent to the response headers arriving
+    download  reading the response body
+    decode    JSON decoding
+    validate  pydantic validation
+    geometry  shapely work (polygon construction, point predicates)
+
+Disabled by default (INSTRUMENTATION_ENABLED). When disabled every hook is a
+single attribute check.
+"""
+
+import logging
+import time
+import uuid
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import Iterator
+
+from valhalla.settings import Settings
+from valhalla.stats import LatencyHistogram, prometheus_histogram
+
+request_id: ContextVar[str | None] = ContextVar("valhalla_request_id", default=None)
+
+SIZE_BUCKETS = [float(2**i) for i in range(8, 27)]  # 256 B .. 64 MiB
+
+_NULL_CONTEXT = nullcontext()
+
+# Formato de los logs de la API y el CLI si la aplicación no configura el logging
+REQUEST_ID_LOG_FORMAT = "%(asctime)s %(levelname)s [%(request_id)s] %(name)s: %(message)s"
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+@contextmanager
+def bind_request_id(value: str | None = None) -> Iterator[str]:
+    """
+    Set the request ID for the current task and everything it awaits.
+    """
+    value = value or new_request_id()
+    token = request_id.set(value)
+    try:
+        yield value
+    finally:
+        request_id.reset(token)
+
+
+def install_request_id_logging() -> None:
+    """
+    Add ``request_id`` to every log record so formats can use ``%(request_id)s``.
+
+    If the root logger has no handlers yet, one is added on stderr with
+    ``REQUEST_ID_LOG_FORMAT``. Applications that configure logging themselves
+    keep their handlers and can add ``%(request_id)s`` to their own format.
+    """
+    logging.basicConfig(format=REQUEST_ID_LOG_FORMAT)
+    factory = logging.getLogRecordFactory()
+    if getattr(factory, "_adds_request_id", False):
+        return
+
+    def record_factory(*args, **kwargs) -> logging.LogRecord:
+        record = factory(*args, **kwargs)
+        record.request_id = request_id.get() or "-"
+        return record
+
+    record_factory._adds_request_id = True
+    logging.setLogRecordFactory(record_factory)
+
+
+class _RequestTrace:
+    """
+    httpcore ``trace`` extension callback recording when each event happened.
+    """
+
+    def __init__(self) -> None:
+        self.marks: dict[str, float] = {}
+
+    async def __call__(self, event: str, info: dict) -> None:
+        # "http11.send_request_body.complete" -> "send_request_body.complete"
+        self.marks[event.split(".", 1)[1]] = time.perf_counter()
+
+    def duration(self, start: str, end: str) -> float | None:
+        if start in self.marks and end in self.marks:
+            return self.marks[end] - self.marks[start]
+        return None
+
+
+class Instrumentation:
+    """
+    Per-endpoint, per-phase latency histograms and counters.
+    """
+
+    def __init__(self, enabled: bool = False, otel: bool = False) -> None:
+        self.enabled = enabled
+        self.phases: dict[tuple[str, str], LatencyHistogram] = {}
+        self.response_bytes: dict[str, LatencyHistogram] = {}
+        self.counters: dict[tuple[str, str], int] = {}
+        self._tracer = self._otel_tracer() if otel else None
+
+    @staticmethod
+    def _otel_tracer():
+        try:
+            from opentelemetry import trace
+        except ImportError:
+            logging.getLogger(__name__).warning(
+                "OTEL_ENABLED is set but opentelemetry is not installed"
+            )
+            return None
+        return trace.get_tracer("valhalla")
+
+    def reset(self) -> None:
+        self.phases.clear()
+        self.response_bytes.clear()
+        self.counters.clear()
+
+    def observe(self, endpoint: str, phase: str, seconds: float) -> None:
+        key = (endpoint, phase)
+        histogram = self.phases.get(key)
+        if histogram is None:
+            histogram = self.phases[key] = LatencyHistogram()
+        histogram.observe(seconds)
+
+    def count(self, endpoint: str, event: str, value: int = 1) -> None:
+        if not self.enabled:
+            return
+        key = (endpoint, event)
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe_size(self, endpoint: str, size: int) -> None:
+        histogram = self.response_bytes.get(endpoint)
+        if histogram is None:
+            histogram = self.response_bytes[endpoint] = LatencyHistogram(bounds=list(SIZE_BUCKETS))
+        histogram.observe(size)
+
+    def phase(self, endpoint: str, name: str):
+        """
+        Context manager timing a phase. A shared no-op when disabled.
+        """
+        if not self.enabled:
+            return _NULL_CONTEXT
+        return self._timed(endpoint, name)
+
+    @contextmanager
+    def _timed(self, endpoint: str, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(endpoint, name, time.perf_counter() - start)
+
+    def span(self, name: str, **attributes):
+        """
+        OpenTelemetry span around a call, if enabled and installed.
+        """
+        if not self.enabled or self._tracer is None:
+            return _NULL_CONTEXT
+        rid = request_id.get()
+        if rid:
+            attributes["request_id"] = rid
+        return self._tracer.start_as_current_span(name, attributes=attributes)
+
+    def new_trace(self) -> _RequestTrace | None:
+        return _RequestTrace() if self.enabled else None
+
+    def record_trace(self, endpoint: str, trace: _RequestTrace) -> None:
+        connect = trace.duration("connect_tcp.started", "connect_tcp.complete")
+        if connect is not None:
+            tls = trace.duration("start_tls.started", "start_tls.complete") or 0.0
+            self.observe(endpoint, "connect", connect + tls)
+        server = trace.duration("send_request_body.complete", "receive_response_headers.complete")
+        if server is not None:
+            self.observe(endpoint, "server", server)
+        download = trace.duration(
+            "receive_response_headers.complete", "receive_response_body.complete"
+        )
+        if download is not None:
+            self.observe(endpoint, "download", download)
+
+    def render_prometheus(self) -> str:
+        """
+        Histograms and counters in Prometheus text format.
+        """
+        lines = ["# TYPE valhalla_call_duration_seconds histogram"]
+        for (endpoint, phase), histogram in sorted(self.phases.items()):
+            lines.extend(
+                prometheus_histogram(
+                    "valhalla_call_duration_seconds",
+                    histogram,
+                    {"endpoint": endpoint, "phase": phase},
+                )
+            )
+        lines.append("# TYPE valhalla_response_bytes histogram")
+        for endpoint, histogram in sorted(self.response_bytes.items()):
+            lines.extend(
+                prometheus_histogram("valhalla_response_bytes", histogram, {"endpoint": endpoint})
+            )
+        lines.append("# TYPE valhalla_call_events_total counter")
+        for (endpoint, event), value in sorted(self.counters.items()):
+            lines.append(
+                f'valhalla_call_events_total{{endpoint="{endpoint}",event="{event}"}} {value}'
+            )
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> dict[str, dict[str, dict[str, float]]]:
+        """
+        Percentiles per endpoint and phase, e.g. ``summary()["/route"]["server"]["p95"]``.
+        """
+        result: dict[str, dict[str, dict[str, float]]] = {}
+        for (endpoint, phase), histogram in self.phases.items():
+            result.setdefault(endpoint, {})[phase] = histogram.summary()
+        return result
+
+
+_instrumentation: Instrumentation | None = None
+
+
+def get_instrumentation(settings: Settings | None = None) -> Instrumentation:
+    """
+    Shared instrumentation, created from settings on first use.
+
+    Args:
+        settings (Settings | None, optional): Settings read on first use.
+            Defaults to reading them from the environment.
+
+    Returns:
+        Instrumentation: The process-wide instance.
+    """
+    global _instrumentation
+    if _instrumentation is None:
+        settings = settings or Settings()
+        _instrumentation = Instrumentation(
+            enabled=settings.instrumentation_enabled, otel=settings.otel_enabled
+        )
+    return _instrumentation
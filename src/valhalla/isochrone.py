@@ -0,0 +1,179 @@
+import asyncio
+import json
+
+import numpy as np
+import shapely
+from shapely.geometry import shape
+
+from valhalla.cache import IsochroneKey, get_isochrone_cache
+from valhalla.client import get_default_client
+from valhalla.entities import Coordinate
+from valhalla.instrumentation import get_instrumentation
+from valhalla.offload import get_cpu_executor
+from valhalla.settings import Settings
+from valhalla.spatial import PointIndex, points_within
+
+# Valhalla acepta como máximo 4 contornos por petición (service_limits.isochrone.max_contours)
+MAX_CONTOURS_PER_REQUEST = 4
+
+
+def isochrone_geometries(data: dict) -> dict[float, shapely.Geometry]:
+    """
+    Map each contour time of an /isochrone response to its geometry.
+
+    Every polygon of the contour is kept, holes included: a contour with several
+    disconnected areas becomes a MultiPolygon.
+
+    Args:
+        data (dict): /isochrone response requested with ``polygons: true``.
+
+    Returns:
+        dict[float, shapely.Geometry]: Geometry by contour time in minutes.
+    """
+    parts: dict[float, list[shapely.Geometry]] = {}
+    for feature in data["features"]:
+        if feature["geometry"]["type"] not in ("Polygon", "MultiPolygon"):
+            continue
+        contour = float(feature["properties"]["contour"])
+        parts.setdefault(contour, []).append(shape(feature["geometry"]))
+
+    geometries = {}
+    for contour, geoms in parts.items():
+        geometry = geoms[0] if len(geoms) == 1 else shapely.union_all(geoms)
+        if not geometry.is_valid:
+            geometry = shapely.make_valid(geometry)
+        geometries[contour] = geometry
+    return geometries
+
+
+def decode_isochrone(raw: bytes, as_wkb: bool = False) -> dict[float, shapely.Geometry | bytes]:
+    """
+    ``isochrone_geometries`` from the raw /isochrone body, optionally as WKB to
+    send the result back from a worker process.
+    """
+    geometries = isochrone_geometries(json.loads(raw))
+    if as_wkb:
+        return {contour: shapely.to_wkb(g) for contour, g in geometries.items()}
+    return geometries
+
+
+async def parse_isochrone(
+    raw: bytes, settings: Settings | None = None
+) -> dict[float, shapely.Geometry]:
+    """
+    Decode an /isochrone response on the CPU executor.
+    """
+    settings = settings or Settings()
+    executor = get_cpu_executor(settings)
+    as_wkb = executor.pickles(len(raw))
+    with get_instrumentation(settings).phase("/isochrone", "geometry"):
+        geometries = await executor.run(decode_isochrone, raw, as_wkb, size=len(raw))
+        if as_wkb:
+            geometries = {contour: shapely.from_wkb(wkb) for contour, wkb in geometries.items()}
+    return geometries
+
+
+async def query_points_within(
+    index: PointIndex, geometry: shapely.Geometry, settings: Settings | None = None
+) -> np.ndarray:
+    """
+    ``index.within(geometry)`` on the CPU executor. A worker process gets the
+    coordinate arrays and the geometry as WKB and builds its own index.
+    """
+    settings = settings or Settings()
+    executor = get_cpu_executor(settings)
+    size = index.lng.nbytes + index.lat.nbytes
+    with get_instrumentation(settings).phase("/isochrone", "geometry"):
+        if executor.pickles(size):
+            return await executor.run(
+                points_within, index.lng, index.lat, shapely.to_wkb(geometry), size=size
+            )
+        return await executor.run(index.within, geometry, size=size)
+
+
+async def get_isochrone_geometries(
+    center_coords: Coordinate,
+    minutes: list[int],
+    costing: str,
+    settings: Settings | None = None,
+) -> dict[int, shapely.Geometry]:
+    """
+    Isochrone geometries around a center for several contour times.
+
+    Contours are cached one by one; the missing ones are requested together, up
+    to ``MAX_CONTOURS_PER_REQUEST`` per call, with the calls running concurrently.
+
+    Args:
+        center_coords (Coordinate): Center of the isochrones.
+        minutes (list[int]): Contour times in minutes.
+        costing (str): Costing model.
+        settings (Settings | None, optional): Settings for the shared client,
+            cache and executor.
+
+    Raises:
+        httpx.HTTPError: If an isochrone request fails.
+        ValueError: If a requested contour is missing from the response.
+
+    Returns:
+        dict[int, shapely.Geometry]: Geometry by contour time.
+    """
+    settings = settings or Settings()
+    cache = get_isochrone_cache(settings)
+    keys = {
+        m: IsochroneKey.build(center_coords, (m,), costing, precision=settings.cache_precision)
+        for m in minutes
+    }
+    geometries = {}
+    if cache is not None:
+        for m, key in keys.items():
+            geometry = await cache.get(key)
+            if geometry is not None:
+                geometries[m] = geometry
+
+    missing = sorted(set(minutes) - geometries.keys())
+    chunks = [
+        missing[i:i + MAX_CONTOURS_PER_REQUEST]
+        for i in range(0, len(missing), MAX_CONTOURS_PER_REQUEST)
+    ]
+
+    async def fetch(chunk: list[int]) -> dict[float, shapely.Geometry]:
+        payload = {
+            "locations": [{"lat": center_coords.lat, "lon": center_coords.lng}],
+            "costing": costing,
+            "contours": [{"time": m} for m in chunk],
+            "polygons": True,
+        }
+        raw = await get_default_client(settings).post_raw("/isochrone", payload)
+        return await parse_isochrone(raw, settings)
+
+    for chunk, fetched in zip(chunks, await asyncio.gather(*(fetch(c) for c in chunks))):
+        for m in chunk:
+            geometry = fetched.get(float(m))
+            if geometry is None:
+                raise ValueError(f"No {m} min contour in isochrone response")
+            geometries[m] = geometry
+            if cache is not None:
+                cache.put(keys[m], geometry)
+    return geometries
+
+
+async def get_isochrone_polygon(
+    center_coords: Coordinate,
+    minutes: int,
+    costing: str,
+    settings: Settings | None = None,
+) -> shapely.Geometry:
+    """
+    Isochrone geometry around a center, served from the cache when possible.
+
+    Args:
+        center_coords (Coordinate): Center of the isochrone.
+        minutes (int): Contour time in minutes.
+        costing (str): Costing model.
+        settings (Settings | None, optional): See ``get_isochrone_geometries``.
+
+    Returns:
+        shapely.Geometry: Polygon or MultiPolygon of the contour, holes included.
+    """
+    geometries = await get_isochrone_geometries(center_coords, [minutes], costing, settings)
+    return geometries[minutes]
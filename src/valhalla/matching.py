@@ -0,0 +1,273 @@
+import asyncio
+from collections import deque
+from typing import AsyncIterable, AsyncIterator, Iterable, Literal
+
+import numpy as np
+import polyline
+
+from valhalla.entities import Coordinate, Leg, Maneuver, Trip, TripLocation
+from valhalla.planner import merge_summaries
+from valhalla.shapes import concat_shapes
+from valhalla.valhalla import _parse_trip, _post_valhalla_raw, settings
+
+# Tipos de maniobra de llegada de Valhalla (destination, destination right/left)
+ARRIVE_TYPES = {4, 5, 6}
+
+
+async def _aiter(
+    points: AsyncIterable[Coordinate] | Iterable[Coordinate],
+) -> AsyncIterator[Coordinate]:
+    if isinstance(points, AsyncIterable):
+        async for point in points:
+            yield point
+    else:
+        for point in points:
+            yield point
+
+
+def _to_shape(points: list[Coordinate], breaks: tuple[int, ...]) -> list[dict]:
+    shape = []
+    for i, point in enumerate(points):
+        item = {"lat": point.lat, "lon": point.lng}
+        time = getattr(point, "time", None)
+        if time is not None:
+            item["time"] = time
+        if i in breaks:
+            item["type"] = "break"
+        shape.append(item)
+    return shape
+
+
+async def _match_chunk(
+    points: list[Coordinate],
+    costing: str,
+    left_cut: int | None,
+    right_cut: int | None,
+    options: dict | None,
+) -> list[Leg]:
+    """
+    Map-match one chunk and keep the legs between its cuts.
+
+    The cuts are sent as "break" points, so the chunk comes back split into legs
+    there and the legs beyond a cut, which the neighbouring chunk also matches,
+    can be dropped.
+    """
+    breaks = tuple(i for i in (left_cut, right_cut) if i is not None)
+    payload = {
+        "shape": _to_shape(points, breaks),
+        "costing": costing,
+        "shape_match": "map_snap",
+        "units": "kilometers",
+        **(options or {}),
+    }
+    raw = await _post_valhalla_raw("/trace_route", payload)
+    trip = await _parse_trip(raw, 'full', "/trace_route")
+    if trip is None:
+        raise ValueError("No 'trip' in trace_route response")
+    legs = trip.legs
+    return legs[int(left_cut is not None):len(legs) - int(right_cut is not None)]
+
+
+async def stream_trace_route(
+    points: AsyncIterable[Coordinate] | Iterable[Coordinate],
+    costing: Literal['auto', 'pedestrian', 'bicycle'] = 'auto',
+    chunk_size: int | None = None,
+    overlap: int | None = None,
+    concurrency: int | None = None,
+    options: dict | None = None,
+) -> AsyncIterator[Leg]:
+    """
+    Map-match a GPS trace of any length with /trace_route, as a stream of legs.
+
+    Points are read as they arrive and cut into chunks of ``chunk_size``.
+    Consecutive chunks share ``overlap`` points and are cut in the middle of
+    that shared stretch, so the matching around each cut has context on both
+    sides; the part of a chunk beyond its cuts is dropped. Up to
+    ``concurrency`` chunks are matched at once and their legs are yielded in
+    trace order, one or two per chunk, each ending where the next begins.
+
+    Only the current chunk and the chunks in flight are held in memory, so
+    day-long traces can be matched from a generator. /trace_attributes is not
+    used because it returns matched edges but no maneuvers.
+
+    Args:
+        points (AsyncIterable[Coordinate] | Iterable[Coordinate]): GPS points in
+            trace order. ``TracePoint`` times are sent along.
+        costing (Literal['auto', 'pedestrian', 'bicycle'], optional): Costing model.
+            Defaults to 'auto'.
+        chunk_size (int | None, optional): Points per request. Defaults to
+            TRACE_CHUNK_SIZE.
+        overlap (int | None, optional): Points shared by consecutive chunks, at
+            least 3 so the cut is neither end of the chunk. Defaults to
+            TRACE_OVERLAP.
+        concurrency (int | None, optional): Chunks matched at once. Defaults to
+            TRACE_CONCURRENCY.
+        options (dict | None, optional): Extra /trace_route options, e.g.
+            ``{"trace_options": {"search_radius": 50}}``.
+
+    Raises:
+        ValueError: If ``overlap`` is not between 3 and ``chunk_size - 1``, or a
+            chunk has no trip.
+        httpx.HTTPError: If a request fails.
+
+    Yields:
+        Leg: Matched legs in trace order.
+    """
+    chunk_size = chunk_size or settings.trace_chunk_size
+    overlap = overlap if overlap is not None else settings.trace_overlap
+    concurrency = concurrency or settings.trace_concurrency
+    # Con overlap 2 el corte derecho sería el último punto y se perdería una pierna
+    if not 3 <= overlap < chunk_size:
+        raise ValueError(f"overlap must be between 3 and {chunk_size - 1}, got {overlap}")
+    # El corte cae en mitad del tramo compartido: en el trozo siguiente es el punto overlap // 2
+    cut = overlap // 2
+
+    pending: deque[asyncio.Task] = deque()
+    buffer: list[Coordinate] = []
+    left_cut: int | None = None
+    try:
+        async for point in _aiter(points):
+            buffer.append(point)
+            if len(buffer) < chunk_size:
+                continue
+            right_cut = chunk_size - overlap + cut
+            pending.append(
+                asyncio.create_task(_match_chunk(buffer, costing, left_cut, right_cut, options))
+            )
+            buffer = buffer[-overlap:]
+            left_cut = cut
+            # Sin leer más puntos mientras haya ``concurrency`` trozos en vuelo
+            while pending and (len(pending) >= concurrency or pending[0].done()):
+                for leg in await pending.popleft():
+                    yield leg
+
+        # Tras un corte siempre queda al menos un punto después de él
+        if left_cut is not None or len(buffer) >= 2:
+            pending.append(
+                asyncio.create_task(_match_chunk(buffer, costing, left_cut, None, options))
+            )
+        while pending:
+            for leg in await pending.popleft():
+                yield leg
+    finally:
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+
+def join_legs(legs: Iterable[Leg]) -> Leg:
+    """
+    Join consecutive legs into one, e.g. the output of ``stream_trace_route``.
+
+    Shapes are concatenated without repeating the junction vertex, maneuver
+    shape indices are shifted to the joined shape, and the arrive maneuver at
+    each junction is dropped.
+
+    Args:
+        legs (Iterable[Leg]): Legs in travel order.
+
+    Raises:
+        ValueError: If there are no legs.
+
+    Returns:
+        Leg: Single leg covering all of them.
+    """
+    shapes: list[np.ndarray] = []
+    maneuvers: list[Maneuver] = []
+    summaries = []
+    size = 0
+    for leg in legs:
+        coords = leg.coordinates
+        offset = size
+        if shapes:
+            if maneuvers and maneuvers[-1].type in ARRIVE_TYPES:
+                maneuvers.pop()
+            if len(coords) and np.array_equal(shapes[-1][-1], coords[0]):
+                offset -= 1
+        maneuvers.extend(
+            m.model_copy(
+                update={
+                    "begin_shape_index": m.begin_shape_index + offset,
+                    "end_shape_index": m.end_shape_index + offset,
+                }
+            )
+            for m in leg.maneuvers
+        )
+        if len(coords):
+            shapes.append(coords)
+            size = offset + len(coords)
+        summaries.append(leg.summary)
+    if not summaries:
+        raise ValueError("No legs to join")
+
+    coords = concat_shapes(shapes)
+    return Leg(
+        maneuvers=maneuvers,
+        summary=merge_summaries(summaries),
+        shape=polyline.encode(coords.tolist(), precision=6),
+    )
+
+
+async def match_trace(
+    points: AsyncIterable[Coordinate] | Iterable[Coordinate],
+    costing: Literal['auto', 'pedestrian', 'bicycle'] = 'auto',
+    chunk_size: int | None = None,
+    overlap: int | None = None,
+    concurrency: int | None = None,
+    options: dict | None = None,
+) -> Trip | None:
+    """
+    Map-match a whole GPS trace into one trip with a single leg.
+
+    Collects ``stream_trace_route``; the result grows with the trace, so very
+    long traces are better consumed leg by leg from the stream.
+
+    Args:
+        points (AsyncIterable[Coordinate] | Iterable[Coordinate]): GPS points in
+            trace order.
+        costing (Literal['auto', 'pedestrian', 'bicycle'], optional): Costing model.
+            Defaults to 'auto'.
+        chunk_size (int | None, optional): See ``stream_trace_route``.
+        overlap (int | None, optional): See ``stream_trace_route``.
+        concurrency (int | None, optional): See ``stream_trace_route``.
+        options (dict | None, optional): See ``stream_trace_route``.
+
+    Raises:
+        ValueError: If the chunk parameters are invalid or a chunk has no trip.
+        httpx.HTTPError: If a request fails.
+
+    Returns:
+        Trip | None: Matched trip whose locations are the snapped first and last
+        points, or None if the trace has fewer than two points.
+    """
+    count = 0
+
+    async def counted() -> AsyncIterator[Coordinate]:
+        nonlocal count
+        async for point in _aiter(points):
+            count += 1
+            yield point
+
+    legs = [
+        leg
+        async for leg in stream_trace_route(
+            counted(), costing, chunk_size, overlap, concurrency, options
+        )
+    ]
+    if not legs:
+        return None
+
+    leg = join_legs(legs)
+    coords = leg.coordinates
+    return Trip(
+        locations=[
+            TripLocation(type="break", lat=lat, lon=lon, original_index=i)
+            for (lat, lon), i in ((coords[0], 0), (coords[-1], count - 1))
+        ],
+        legs=[leg],
+        summary=leg.summary,
+        status_message="Found route between points",
+        status=0,
+        units="kilometers",
+        language="en-US",
+    )
@@ -0,0 +1,318 @@
+import asyncio
+import hashlib
+import json
+import time
+from dataclasses import dataclass
+from logging import getLogger
+from pathlib import Path
+from typing import Callable, Literal
+
+import numpy as np
+
+from valhalla.coordinates import Coordinates
+from valhalla.valhalla import _post_valhalla, _to_valhalla_coords, settings
+
+logger = getLogger(__name__)
+
+Metric = Literal['time', 'distance']
+
+MANIFEST_FILE = "manifest.json"
+
+
+@dataclass
+class BlockTiming:
+    source_block: int
+    target_block: int
+    seconds: float
+
+
+ProgressCallback = Callable[[int, int, BlockTiming], None]
+
+
+def _parse_matrix(data: dict, metric: Metric, shape: tuple[int, int]) -> np.ndarray:
+    """
+    Parse a /sources_to_targets response into a float32 array.
+
+    Supports both the verbose response (list of rows of cells) and the concise
+    one (``{"durations": [[...]], "distances": [[...]]}``). Unreachable pairs are
+    returned as ``inf``.
+    """
+    matrix = np.full(shape, np.inf, dtype=np.float32)
+    sources_to_targets = data["sources_to_targets"]
+    if isinstance(sources_to_targets, dict):
+        values = sources_to_targets["durations" if metric == "time" else "distances"]
+        for i, row in enumerate(values):
+            matrix[i] = [np.inf if v is None else v for v in row]
+        return matrix
+
+    for i, row in enumerate(sources_to_targets):
+        for j, cell in enumerate(row):
+            value = cell.get(metric)
+            if value is not None:
+                matrix[i, j] = value
+    return matrix
+
+
+class MatrixBuilder:
+    """
+    Build large N×N cost matrices from blocks that fit the server limits.
+
+    The locations are split into source and target blocks of at most
+    ``block_size`` each. Blocks are requested concurrently and written into
+    preallocated float32 arrays. If ``path`` is given the arrays are
+    memory-mapped ``.npy`` files in that directory, together with a record of the
+    finished blocks of each metric, so an interrupted build resumes where it
+    stopped. A manifest with a fingerprint of the locations, costing and block
+    size guards the directory: files from a different build are discarded.
+
+    Usage:
+        builder = MatrixBuilder(locations, metrics=("time", "distance"), path="matrix/")
+        matrices = await builder.build()
+        matrices["time"]  # np.memmap of shape (N, N)
+    """
+
+    def __init__(
+        self,
+        locations: Coordinates,
+        costing: Literal['auto', 'pedestrian', 'bicycle'] = 'auto',
+        metrics: tuple[Metric, ...] = ('time',),
+        block_size: int | None = None,
+        concurrency: int | None = None,
+        path: str | Path | None = None,
+        progress: ProgressCallback | None = None,
+    ) -> None:
+        """
+        Args:
+            locations (Coordinates): Locations used as sources and targets.
+            costing (Literal['auto', 'pedestrian', 'bicycle'], optional): Costing model.
+                Defaults to 'auto'.
+            metrics (tuple[Metric, ...], optional): Matrices to fill. Defaults to ('time',).
+            block_size (int | None, optional): Max sources/targets per request.
+                Defaults to MATRIX_BLOCK_SIZE.
+            concurrency (int | None, optional): Blocks in flight. Defaults to
+                MATRIX_CONCURRENCY.
+            path (str | Path | None, optional): Directory for memory-mapped output.
+                Defaults to None (in-memory arrays).
+            progress (ProgressCallback | None, optional): Called after each block
+                with (finished blocks, total blocks, timing).
+        """
+        self.locations = locations
+        self.costing = costing
+        self.metrics = tuple(metrics)
+        self.block_size = block_size or settings.matrix_block_size
+        self.concurrency = concurrency or settings.matrix_concurrency
+        self.path = Path(path) if path is not None else None
+        self.progress = progress
+        self.timings: list[BlockTiming] = []
+
+        n = len(locations)
+        self.n_blocks = -(-n // self.block_size) if n else 0
+        self._coords = _to_valhalla_coords(locations)
+        if self.path is not None:
+            self._check_manifest()
+        self.matrices = {metric: self._allocate(metric) for metric in self.metrics}
+        self.done = {metric: self._load_done(metric) for metric in self.metrics}
+
+    def _fingerprint(self) -> str:
+        raw = json.dumps([self._coords, self.costing, self.block_size], separators=(",", ":"))
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def _check_manifest(self) -> None:
+        """
+        Discard the files in ``path`` if they belong to a different build.
+        """
+        self.path.mkdir(parents=True, exist_ok=True)
+        file = self.path / MANIFEST_FILE
+        fingerprint = self._fingerprint()
+        manifest = json.loads(file.read_text()) if file.exists() else None
+        if manifest is None or manifest.get("fingerprint") != fingerprint:
+            stale = [f for f in self.path.glob("*.npy") if f.stem in ("time", "distance")]
+            stale += list(self.path.glob("blocks*.npy"))
+            if stale:
+                logger.warning("Discarding matrix files in %s from a different build", self.path)
+            for f in stale:
+                f.unlink()
+            manifest = {"fingerprint": fingerprint, "metrics": []}
+        manifest["metrics"] = sorted(set(manifest["metrics"]) | set(self.metrics))
+        tmp = self.path / (MANIFEST_FILE + ".tmp")
+        tmp.write_text(json.dumps(manifest))
+        tmp.replace(file)
+
+    def _allocate(self, metric: Metric) -> np.ndarray:
+        n = len(self.locations)
+        if self.path is None:
+            return np.full((n, n), np.nan, dtype=np.float32)
+        self.path.mkdir(parents=True, exist_ok=True)
+        file = self.path / f"{metric}.npy"
+        if file.exists():
+            matrix = np.load(file, mmap_mode="r+")
+            if matrix.shape == (n, n) and matrix.dtype == np.float32:
+                return matrix
+            logger.warning("Ignoring %s: shape %s does not match", file, matrix.shape)
+        matrix = np.lib.format.open_memmap(file, mode="w+", dtype=np.float32, shape=(n, n))
+        matrix[:] = np.nan
+        return matrix
+
+    def _load_done(self, metric: Metric) -> np.ndarray:
+        shape = (self.n_blocks, self.n_blocks)
+        if self.path is not None:
+            file = self.path / f"blocks_{metric}.npy"
+            if file.exists():
+                done = np.load(file)
+                if done.shape == shape:
+                    return done
+        return np.zeros(shape, dtype=bool)
+
+    def _save_done(self) -> None:
+        if self.path is None:
+            return
+        for metric, matrix in self.matrices.items():
+            matrix.flush()
+            np.save(self.path / f"blocks_{metric}.npy", self.done[metric])
+
+    @property
+    def pending(self) -> np.ndarray:
+        """
+        Boolean (blocks, blocks) array, True where some metric lacks the block.
+        """
+        pending = np.zeros((self.n_blocks, self.n_blocks), dtype=bool)
+        for done in self.done.values():
+            pending |= ~done
+        return pending
+
+    @property
+    def remaining_blocks(self) -> int:
+        return int(self.pending.sum())
+
+    def _block_slice(self, block: int) -> slice:
+        return slice(block * self.block_size, min((block + 1) * self.block_size, len(self.locations)))
+
+    async def _fetch_block(self, sb: int, tb: int) -> BlockTiming:
+        rows, cols = self._block_slice(sb), self._block_slice(tb)
+        payload = {
+            "sources": self._coords[rows],
+            "targets": self._coords[cols],
+            "costing": self.costing,
+            "units": "kilometers",
+        }
+        start = time.perf_counter()
+        # Los reintentos y el hedging los hace el cliente
+        data = await _post_valhalla("/sources_to_targets", payload)
+
+        shape = (rows.stop - rows.start, cols.stop - cols.start)
+        for metric, matrix in self.matrices.items():
+            matrix[rows, cols] = _parse_matrix(data, metric, shape)
+        return BlockTiming(sb, tb, time.perf_counter() - start)
+
+    async def build(self) -> dict[str, np.ndarray]:
+        """
+        Request every pending block and fill the matrices.
+
+        Raises:
+            httpx.HTTPError: If a block keeps failing after the client retries. Blocks
+                finished so far are kept, so calling ``build`` again resumes.
+
+        Returns:
+            dict[str, np.ndarray]: One (N, N) float32 matrix per metric, ``inf``
+            where unreachable.
+        """
+        pending = [(int(sb), int(tb)) for sb, tb in np.argwhere(self.pending)]
+        total = self.n_blocks**2
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def run(sb: int, tb: int) -> None:
+            async with semaphore:
+                timing = await self._fetch_block(sb, tb)
+            for done in self.done.values():
+                done[sb, tb] = True
+            self.timings.append(timing)
+            self._save_done()
+            finished = total - self.remaining_blocks
+            logger.debug(
+                "Matrix block (%d, %d) in %.3fs [%d/%d]", sb, tb, timing.seconds, finished, total
+            )
+            if self.progress is not None:
+                self.progress(finished, total, timing)
+
+        tasks = [asyncio.create_task(run(sb, tb)) for sb, tb in pending]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self._save_done()
+            raise
+        return self.matrices
+
+
+async def get_cost_matrix(
+    locations: Coordinates,
+    costing: Literal['auto', 'pedestrian', 'bicycle'] = 'auto',
+    metric: Metric = 'time',
+) -> np.ndarray:
+    """
+    Full N×N cost matrix between locations using /sources_to_targets.
+
+    Large location sets are split into blocks that fit the server limits.
+
+    Args:
+        locations (Coordinates): Locations used as both sources and targets.
+        costing (Literal['auto', 'pedestrian', 'bicycle'], optional): Costing model.
+            Defaults to 'auto'.
+        metric (Metric, optional): 'time' (seconds) or 'distance' (kilometers).
+            Defaults to 'time'.
+
+    Returns:
+        np.ndarray: float32 array of shape (N, N); ``inf`` where unreachable.
+    """
+    matrices = await MatrixBuilder(locations, costing, metrics=(metric,)).build()
+    return matrices[metric]
+
+
+async def get_cost_block(
+    sources: Coordinates,
+    targets: Coordinates,
+    costing: Literal['auto', 'pedestrian', 'bicycle'] = 'auto',
+    metric: Metric = 'time',
+) -> np.ndarray:
+    """
+    Rectangular cost matrix from some sources to some targets, e.g. a single
+    row or column of a larger matrix.
+
+    Targets beyond ``MATRIX_BLOCK_SIZE`` are split into concurrent requests.
+
+    Args:
+        sources (Coordinates): Origin locations, at most ``MATRIX_BLOCK_SIZE``.
+        targets (Coordinates): Destination locations.
+        costing (Literal['auto', 'pedestrian', 'bicycle'], optional): Costing model.
+            Defaults to 'auto'.
+        metric (Metric, optional): 'time' (seconds) or 'distance' (kilometers).
+            Defaults to 'time'.
+
+    Raises:
+        httpx.HTTPError: If a request fails.
+
+    Returns:
+        np.ndarray: float32 array of shape (len(sources), len(targets)); ``inf``
+        where unreachable.
+    """
+    block = settings.matrix_block_size
+    source_coords = _to_valhalla_coords(sources)
+    target_coords = _to_valhalla_coords(targets)
+
+    async def fetch(start: int) -> np.ndarray:
+        chunk = target_coords[start:start + block]
+        payload = {
+            "sources": source_coords,
+            "targets": chunk,
+            "costing": costing,
+            "units": "kilometers",
+        }
+        data = await _post_valhalla("/sources_to_targets", payload)
+        return _parse_matrix(data, metric, (len(source_coords), len(chunk)))
+
+    if not target_coords:
+        return np.empty((len(source_coords), 0), dtype=np.float32)
+    parts = await asyncio.gather(*(fetch(s) for s in range(0, len(target_coords), block)))
+    return np.hstack(parts)
@@ -0,0 +1,111 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from logging import getLogger
+from typing import Any, Callable, Literal, TypeVar
+
+from valhalla.settings import Settings
+
+logger = getLogger(__name__)
+
+ExecutorKind = Literal['inline', 'thread', 'process']
+
+T = TypeVar("T")
+
+
+class CpuExecutor:
+    """
+    Where the CPU-bound stages (JSON and trip parsing, polygon construction,
+    point-in-polygon tests) run.
+
+    - ``inline``: on the event loop, as before.
+    - ``thread``: a thread pool. Helps with shapely, which releases the GIL in
+      its vectorized operations; JSON and pydantic parsing keep it.
+    - ``process``: a process pool. Nothing holds the event loop's GIL, but the
+      arguments and results are pickled, so callers send raw response bytes and
+      WKB instead of parsed objects (see ``pickles``).
+
+    Work smaller than ``min_bytes`` always runs inline: handing it to a pool
+    costs more than doing it.
+    """
+
+    def __init__(
+        self, kind: ExecutorKind = 'inline', workers: int | None = None, min_bytes: int = 65536
+    ) -> None:
+        """
+        Args:
+            kind (ExecutorKind, optional): 'inline', 'thread' or 'process'.
+                Defaults to 'inline'.
+            workers (int | None, optional): Pool size. Defaults to the
+                ``concurrent.futures`` default.
+            min_bytes (int, optional): Input size, in bytes, below which work runs
+                inline. Defaults to 65536.
+        """
+        if kind not in ('inline', 'thread', 'process'):
+            raise ValueError(f"Unknown executor kind: {kind}")
+        self.kind = kind
+        self.workers = workers
+        self.min_bytes = min_bytes
+        self._pool: Executor | None = None
+
+    def _get_pool(self) -> Executor:
+        if self._pool is None:
+            if self.kind == 'thread':
+                self._pool = ThreadPoolExecutor(self.workers, thread_name_prefix="valhalla-cpu")
+            else:
+                # spawn: hacer fork con el bucle y los hilos del cliente en marcha no es seguro
+                self._pool = ProcessPoolExecutor(
+                    self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+        return self._pool
+
+    def offloads(self, size: int) -> bool:
+        """
+        Whether work on ``size`` bytes of input leaves the event loop.
+        """
+        return self.kind != 'inline' and size >= self.min_bytes
+
+    def pickles(self, size: int) -> bool:
+        """
+        Whether work on ``size`` bytes of input goes to another process, so its
+        arguments should be bytes or WKB rather than objects.
+        """
+        return self.kind == 'process' and size >= self.min_bytes
+
+    async def run(self, fn: Callable[..., T], *args: Any, size: int) -> T:
+        """
+        Run ``fn(*args)`` on the configured executor.
+
+        Args:
+            fn (Callable[..., T]): Function to run. With a process pool it must be
+                importable (a module-level function).
+            *args (Any): Its arguments.
+            size (int): Approximate input size in bytes, e.g. ``len(raw)``.
+
+        Returns:
+            T: What ``fn`` returns.
+        """
+        if not self.offloads(size):
+            return fn(*args)
+        return await asyncio.get_running_loop().run_in_executor(self._get_pool(), fn, *args)
+
+    def shutdown(self, wait: bool = True) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=wait)
+            self._pool = None
+
+
+_cpu_executor: CpuExecutor | None = None
+
+
+def get_cpu_executor(settings: Settings | None = None) -> CpuExecutor:
+    """
+    Shared CPU executor, created from settings on first use.
+    """
+    global _cpu_executor
+    if _cpu_executor is None:
+        settings = settings or Settings()
+        _cpu_executor = CpuExecutor(
+            settings.cpu_executor, settings.cpu_workers, settings.cpu_offload_min_bytes
+        )
+    return _cpu_executor
@@ -0,0 +1,385 @@
+import asyncio
+import time
+from dataclasses import dataclass, field
+from logging import getLogger
+from typing import Literal
+
+import numpy as np
+
+from valhalla.entities import Coordinate, Trip
+from valhalla.matrix import get_cost_matrix
+from valhalla.valhalla import _parse_trip, _post_valhalla_raw, _to_valhalla_coords
+
+logger = getLogger(__name__)
+
+# Coste usado para pares sin conexión, para no operar con inf en los deltas
+UNREACHABLE_PENALTY = 1e9
+
+
+@dataclass
+class VehicleRoutes:
+    """
+    Solution of a multi-vehicle problem.
+
+    Attributes:
+        routes (list[list[int]]): One route per vehicle as indices into the cost
+            matrix, starting and ending at the depot. Unused vehicles get
+            ``[depot, depot]``.
+        loads (list[float]): Total demand served by each vehicle.
+        cost (float): Total cost of all routes.
+        unassigned (list[int]): Stops that did not fit in any vehicle.
+    """
+
+    routes: list[list[int]]
+    loads: list[float]
+    cost: float
+    unassigned: list[int] = field(default_factory=list)
+
+
+@dataclass
+class FleetTrips:
+    """
+    Trips of a multi-vehicle problem.
+
+    Attributes:
+        trips (list[Trip | None]): One trip per vehicle, None for unused vehicles
+            or failures. ``original_index`` 0 is the depot and ``i + 1`` is
+            ``stops[i]``.
+        unassigned (list[int]): Indices into ``stops`` of the stops that did not
+            fit in any vehicle.
+    """
+
+    trips: list[Trip | None]
+    unassigned: list[int] = field(default_factory=list)
+
+
+def _cost_table(matrix: np.ndarray) -> list[list[float]]:
+    # Las listas de Python son mucho más rápidas que indexar numpy elemento a elemento
+    m = np.asarray(matrix, dtype=np.float64)
+    return np.where(np.isfinite(m), m, UNREACHABLE_PENALTY).tolist()
+
+
+def route_cost(route: list[int], m: list[list[float]]) -> float:
+    return sum(m[a][b] for a, b in zip(route, route[1:]))
+
+
+def nearest_neighbour(m: list[list[float]], start: int, end: int | None = None) -> list[int]:
+    """
+    Greedy route from ``start`` visiting every node, finishing at ``end`` if given.
+    """
+    n = len(m)
+    pending = set(range(n)) - {start} - ({end} if end is not None else set())
+    route = [start]
+    current = start
+    while pending:
+        row = m[current]
+        current = min(pending, key=row.__getitem__)
+        pending.remove(current)
+        route.append(current)
+    if end is not None and end != start:
+        route.append(end)
+    return route
+
+
+def _two_opt_pass(route: list[int], m: list[list[float]], deadline: float) -> bool:
+    """
+    Apply improving segment reversals in place. Endpoints stay fixed.
+
+    Works with asymmetric matrices: the cost of the reversed segment is taken
+    from prefix sums of forward and backward edge costs.
+    """
+    improved = False
+    n = len(route)
+    i = 1
+    while i < n - 2:
+        fwd = [0.0] * n
+        bwd = [0.0] * n
+        for k in range(1, n):
+            fwd[k] = fwd[k - 1] + m[route[k - 1]][route[k]]
+            bwd[k] = bwd[k - 1] + m[route[k]][route[k - 1]]
+        a, b = route[i - 1], route[i]
+        applied = False
+        for j in range(i + 1, n - 1):
+            c, d = route[j], route[j + 1]
+            delta = (
+                m[a][c] + m[b][d] - m[a][b] - m[c][d]
+                + (bwd[j] - bwd[i]) - (fwd[j] - fwd[i])
+            )
+            if delta < -1e-9:
+                route[i:j + 1] = route[i:j + 1][::-1]
+                improved = applied = True
+                break
+        if time.perf_counter() > deadline:
+            break
+        if not applied:
+            i += 1
+    return improved
+
+
+def _or_opt_pass(route: list[int], m: list[list[float]], deadline: float) -> bool:
+    """
+    Move segments of 1 to 3 consecutive nodes to a better position in place.
+    """
+    improved = False
+    for length in (1, 2, 3):
+        i = 1
+        while i + length < len(route):
+            if time.perf_counter() > deadline:
+                return improved
+            seg = route[i:i + length]
+            prev, nxt = route[i - 1], route[i + length]
+            gain = m[prev][seg[0]] + m[seg[-1]][nxt] - m[prev][nxt]
+            rest = route[:i] + route[i + length:]
+            best_delta, best_k = -1e-9, None
+            for k in range(len(rest) - 1):
+                if k == i - 1:
+                    continue
+                u, v = rest[k], rest[k + 1]
+                delta = m[u][seg[0]] + m[seg[-1]][v] - m[u][v] - gain
+                if delta < best_delta:
+                    best_delta, best_k = delta, k
+            if best_k is None:
+                i += 1
+                continue
+            route[:] = rest[:best_k + 1] + seg + rest[best_k + 1:]
+            improved = True
+    return improved
+
+
+def improve_route(route: list[int], m: list[list[float]], deadline: float) -> list[int]:
+    """
+    Local search with 2-opt and Or-opt until no move improves or time runs out.
+    """
+    route = list(route)
+    while time.perf_counter() < deadline:
+        changed = _two_opt_pass(route, m, deadline)
+        changed |= _or_opt_pass(route, m, deadline)
+        if not changed:
+            break
+    return route
+
+
+def solve_tsp(matrix: np.ndarray, time_budget: float = 1.0) -> list[int]:
+    """
+    Order of visit that keeps the first and last locations fixed, like
+    /optimized_route.
+
+    Args:
+        matrix (np.ndarray): N×N cost matrix.
+        time_budget (float, optional): Seconds allowed for the improvement phase.
+            Defaults to 1.0.
+
+    Returns:
+        list[int]: Permutation of ``range(N)`` starting at 0 and ending at N-1.
+    """
+    n = len(matrix)
+    if n <= 3:
+        return list(range(n))
+    deadline = time.perf_counter() + time_budget
+    m = _cost_table(matrix)
+    route = nearest_neighbour(m, 0, n - 1)
+    return improve_route(route, m, deadline)
+
+
+def _relocate_between_routes(
+    routes: list[list[int]],
+    loads: list[float],
+    demands: list[float],
+    capacities: list[float],
+    m: list[list[float]],
+    deadline: float,
+) -> bool:
+    """
+    Move single stops to the cheapest position in another route with spare capacity.
+    """
+    improved = False
+    for a, route_a in enumerate(routes):
+        i = 1
+        while i < len(route_a) - 1:
+            if time.perf_counter() > deadline:
+                return improved
+            node = route_a[i]
+            prev, nxt = route_a[i - 1], route_a[i + 1]
+            gain = m[prev][node] + m[node][nxt] - m[prev][nxt]
+            best = (-1e-9, None, None)
+            for b, route_b in enumerate(routes):
+                if b == a or loads[b] + demands[node] > capacities[b]:
+                    continue
+                for k in range(len(route_b) - 1):
+                    u, v = route_b[k], route_b[k + 1]
+                    delta = m[u][node] + m[node][v] - m[u][v] - gain
+                    if delta < best[0]:
+                        best = (delta, b, k)
+            if best[1] is None:
+                i += 1
+                continue
+            _, b, k = best
+            del route_a[i]
+            routes[b].insert(k + 1, node)
+            loads[a] -= demands[node]
+            loads[b] += demands[node]
+            improved = True
+    return improved
+
+
+def solve_vrp(
+    matrix: np.ndarray,
+    demands: list[float],
+    capacities: list[float],
+    depot: int = 0,
+    time_budget: float = 1.0,
+) -> VehicleRoutes:
+    """
+    Capacitated routes for several vehicles leaving from and returning to a depot.
+
+    Routes are built with nearest neighbour (each vehicle takes the closest stop
+    that still fits), then improved with 2-opt and Or-opt inside each route and
+    relocations between routes.
+
+    Args:
+        matrix (np.ndarray): N×N cost matrix, depot included.
+        demands (list[float]): Demand of each node; the depot's is ignored.
+        capacities (list[float]): Capacity of each vehicle.
+        depot (int, optional): Index of the depot. Defaults to 0.
+        time_budget (float, optional): Seconds allowed for the improvement phase.
+            Defaults to 1.0.
+
+    Returns:
+        VehicleRoutes: Routes, loads, total cost and stops that did not fit.
+    """
+    n = len(matrix)
+    if len(demands) != n:
+        raise ValueError("demands must have one entry per matrix row")
+    deadline = time.perf_counter() + time_budget
+    m = _cost_table(matrix)
+    demands = [0.0 if i == depot else float(d) for i, d in enumerate(demands)]
+
+    pending = set(range(n)) - {depot}
+    routes, loads = [], []
+    for capacity in capacities:
+        route, load, current = [depot], 0.0, depot
+        while True:
+            fits = [j for j in pending if load + demands[j] <= capacity]
+            if not fits:
+                break
+            current = min(fits, key=m[current].__getitem__)
+            pending.remove(current)
+            route.append(current)
+            load += demands[current]
+        route.append(depot)
+        routes.append(route)
+        loads.append(load)
+
+    while time.perf_counter() < deadline:
+        routes = [improve_route(r, m, deadline) for r in routes]
+        if not _relocate_between_routes(routes, loads, demands, capacities, m, deadline):
+            break
+
+    return VehicleRoutes(
+        routes=routes,
+        loads=loads,
+        cost=sum(route_cost(r, m) for r in routes),
+        unassigned=sorted(pending),
+    )
+
+
+async def _route_in_order(
+    locations: list[Coordinate], order: list[int], costing: str
+) -> Trip | None:
+    """
+    Call /route for the locations in the given order and remap ``original_index``
+    to positions in ``locations``.
+    """
+    payload = {
+        "locations": _to_valhalla_coords([locations[i] for i in order]),
+        "costing": costing,
+        "units": "kilometers",
+    }
+    try:
+        raw = await _post_valhalla_raw("/route", payload)
+    except Exception as e:
+        logger.error("Local optimization /route failed: %s", e)
+        return None
+    try:
+        trip = await _parse_trip(raw, 'full', "/route")
+    except ValueError as e:
+        # Incluye pydantic.ValidationError: solo se pierde esta ruta
+        logger.error("Local optimization /route response is invalid: %s", e)
+        return None
+    if trip is None:
+        return None
+    for loc in trip.locations:
+        loc.original_index = order[loc.original_index]
+    return trip
+
+
+async def optimize_route(
+    locations: list[Coordinate],
+    costing: Literal['auto', 'pedestrian', 'bicycle'] = 'auto',
+    time_budget: float = 1.0,
+) -> Trip | None:
+    """
+    Local alternative to /optimized_route with no distance limit.
+
+    Fetches the time matrix once, solves the visiting order locally keeping the
+    first and last locations fixed, and requests /route only for that order.
+
+    Args:
+        locations (list[Coordinate]): Locations to visit.
+        costing (Literal['auto', 'pedestrian', 'bicycle'], optional): Costing model.
+            Defaults to 'auto'.
+        time_budget (float, optional): Seconds for the local search. Defaults to 1.0.
+
+    Returns:
+        Trip | None: Route in the optimized order, or None if Valhalla failed.
+    """
+    try:
+        matrix = await get_cost_matrix(locations, costing)
+    except Exception as e:
+        logger.error("Valhalla error (sources_to_targets): %s", e)
+        return None
+    order = solve_tsp(matrix, time_budget)
+    return await _route_in_order(locations, order, costing)
+
+
+async def optimize_vehicle_routes(
+    depot: Coordinate,
+    stops: list[Coordinate],
+    demands: list[float],
+    capacities: list[float],
+    costing: Literal['auto', 'pedestrian', 'bicycle'] = 'auto',
+    time_budget: float = 1.0,
+) -> FleetTrips:
+    """
+    Split the stops among several capacitated vehicles and route each of them.
+
+    Args:
+        depot (Coordinate): Start and end of every vehicle.
+        stops (list[Coordinate]): Stops to serve.
+        demands (list[float]): Demand of each stop.
+        capacities (list[float]): Capacity of each vehicle.
+        costing (Literal['auto', 'pedestrian', 'bicycle'], optional): Costing model.
+            Defaults to 'auto'.
+        time_budget (float, optional): Seconds for the local search. Defaults to 1.0.
+
+    Returns:
+        FleetTrips: One trip per vehicle and the stops that exceed the capacity.
+    """
+    locations = [depot, *stops]
+    try:
+        matrix = await get_cost_matrix(locations, costing)
+    except Exception as e:
+        logger.error("Valhalla error (sources_to_targets): %s", e)
+        return FleetTrips([None] * len(capacities))
+
+    solution = solve_vrp(matrix, [0.0, *demands], capacities, 0, time_budget)
+    if solution.unassigned:
+        logger.warning("%d stops exceed the vehicles capacity", len(solution.unassigned))
+
+    async def route_vehicle(route: list[int]) -> Trip | None:
+        if len(route) <= 2:
+            return None
+        return await _route_in_order(locations, route, costing)
+
+    trips = await asyncio.gather(*(route_vehicle(r) for r in solution.routes))
+    return FleetTrips(list(trips), [i - 1 for i in solution.unassigned])
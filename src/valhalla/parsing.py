@@ -0,0 +1,51 @@
+from typing import Generic, Literal, TypeVar
+
+from pydantic import BaseModel
+
+from valhalla.entities import LazyTrip, Trip, TripShapes, TripSummary
+
+TripProjection = Literal['full', 'lazy', 'shapes', 'summary']
+
+ParsedTrip = Trip | LazyTrip | TripShapes | TripSummary
+
+T = TypeVar("T", bound=BaseModel)
+
+
+class _TripResponse(BaseModel, Generic[T]):
+    trip: T | None = None
+
+
+_RESPONSE_MODELS: dict[str, type[BaseModel]] = {
+    "full": _TripResponse[Trip],
+    "lazy": _TripResponse[LazyTrip],
+    "shapes": _TripResponse[TripShapes],
+    "summary": _TripResponse[TripSummary],
+}
+
+
+def parse_trip(raw: bytes, projection: TripProjection = 'full') -> ParsedTrip | None:
+    """
+    Parse a /route or /optimized_route response straight from its raw bytes.
+
+    Fields left out of the projection are skipped by the JSON parser instead of
+    being built and then discarded.
+
+    Args:
+        raw (bytes): Undecoded response body.
+        projection (TripProjection, optional): What to parse:
+            - 'full': complete ``Trip``.
+            - 'lazy': ``LazyTrip``, maneuvers parsed on first access.
+            - 'shapes': ``TripShapes``, summaries and leg shapes only.
+            - 'summary': ``TripSummary``, no legs.
+            Defaults to 'full'.
+
+    Raises:
+        pydantic.ValidationError: If the response does not match the models.
+
+    Returns:
+        ParsedTrip | None: Parsed trip, or None if the response has no 'trip'.
+    """
+    trip = _RESPONSE_MODELS[projection].model_validate_json(raw).trip
+    if isinstance(trip, LazyTrip):
+        trip._raw = raw
+    return trip
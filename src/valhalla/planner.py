@@ -0,0 +1,268 @@
+import asyncio
+from logging import getLogger
+from typing import Literal
+
+import numpy as np
+
+from valhalla.coordinates import Coordinates, as_coordinate_array
+from valhalla.entities import Summary, Trip
+from valhalla.valhalla import get_optimal_route, get_route, settings
+
+logger = getLogger(__name__)
+
+EARTH_RADIUS_KM = 6371.0088
+
+# Margen sobre el límite: el pre-chequeo es en línea recta y Valhalla puede medir algo distinto
+DISTANCE_MARGIN = 0.9
+
+
+def haversine_km(
+    lat1: np.ndarray | float,
+    lng1: np.ndarray | float,
+    lat2: np.ndarray | float,
+    lng2: np.ndarray | float,
+) -> np.ndarray | float:
+    """
+    Great-circle distance in kilometers, vectorized over NumPy arrays.
+    """
+    lat1, lng1, lat2, lng2 = map(np.radians, (lat1, lng1, lat2, lng2))
+    a = (
+        np.sin((lat2 - lat1) / 2) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+def bbox_diagonal_km(lat: np.ndarray, lng: np.ndarray) -> float:
+    """
+    Diagonal of the bounding box, an upper bound of any pairwise distance.
+    """
+    if len(lat) < 2:
+        return 0.0
+    return float(haversine_km(lat.min(), lng.min(), lat.max(), lng.max()))
+
+
+def exceeds_distance_limit(locations: Coordinates, max_km: float | None = None) -> bool:
+    """
+    Whether the location set may exceed the /optimized_route distance limit.
+
+    Args:
+        locations (Coordinates): Locations to check.
+        max_km (float | None, optional): Limit in kilometers. Defaults to
+            OPTIMIZED_ROUTE_MAX_DISTANCE_KM.
+
+    Returns:
+        bool: True if the bounding box diagonal is over the limit (with margin).
+    """
+    max_km = max_km or settings.optimized_route_max_distance_km
+    points = as_coordinate_array(locations)
+    return bbox_diagonal_km(points.lat, points.lng) > max_km * DISTANCE_MARGIN
+
+
+def split_clusters(lat: np.ndarray, lng: np.ndarray, max_km: float) -> list[np.ndarray]:
+    """
+    Recursively halve the points along their widest axis until every cluster's
+    bounding box fits in ``max_km``.
+
+    Returns:
+        list[np.ndarray]: Indices of each cluster.
+    """
+    pending = [np.arange(len(lat))]
+    clusters = []
+    while pending:
+        idx = pending.pop()
+        if len(idx) <= 1 or bbox_diagonal_km(lat[idx], lng[idx]) <= max_km:
+            clusters.append(idx)
+            continue
+        lat_span = np.ptp(lat[idx])
+        lng_span = np.ptp(lng[idx]) * np.cos(np.radians(lat[idx].mean()))
+        key = lat[idx] if lat_span >= lng_span else lng[idx]
+        ordered = idx[np.argsort(key, kind="stable")]
+        half = len(ordered) // 2
+        pending += [ordered[:half], ordered[half:]]
+    return clusters
+
+
+def _order_clusters(
+    clusters: list[np.ndarray], lat: np.ndarray, lng: np.ndarray, first: int, last: int
+) -> list[np.ndarray]:
+    """
+    Nearest-neighbour order of the clusters by centroid, from the cluster of the
+    first location to the cluster of the last one.
+    """
+    # El origen y el destino tienen que quedar en clusters distintos
+    start = next(i for i, c in enumerate(clusters) if first in c)
+    end = next(i for i, c in enumerate(clusters) if last in c)
+    if start == end and len(clusters) > 1:
+        clusters[start] = clusters[start][clusters[start] != last]
+        clusters.append(np.array([last]))
+        end = len(clusters) - 1
+
+    centroids = np.array([[lat[c].mean(), lng[c].mean()] for c in clusters])
+    order = [start]
+    pending = set(range(len(clusters))) - {start, end}
+    while pending:
+        here = centroids[order[-1]]
+        candidates = sorted(pending)
+        dist = haversine_km(here[0], here[1], centroids[candidates, 0], centroids[candidates, 1])
+        nxt = candidates[int(np.argmin(dist))]
+        pending.remove(nxt)
+        order.append(nxt)
+    if end != start:
+        order.append(end)
+    return [clusters[i] for i in order]
+
+
+def _nearest(idx: np.ndarray, lat: np.ndarray, lng: np.ndarray, to_lat: float, to_lng: float) -> int:
+    return int(idx[np.argmin(haversine_km(lat[idx], lng[idx], to_lat, to_lng))])
+
+
+def _entry_exit_sequences(
+    clusters: list[np.ndarray], lat: np.ndarray, lng: np.ndarray, first: int, last: int
+) -> list[list[int]]:
+    """
+    Visiting sequence of each cluster as [entry, ..., exit].
+
+    The entry is the point closest to the previous cluster's exit and the exit
+    the point closest to the next cluster's centroid.
+    """
+    sequences = []
+    prev_exit = None
+    for i, idx in enumerate(clusters):
+        is_last = i == len(clusters) - 1
+        if i == 0:
+            entry = first
+        else:
+            # En el último cluster la entrada no puede ser el destino final
+            candidates = idx[idx != last] if is_last and len(idx) > 1 else idx
+            entry = _nearest(candidates, lat, lng, lat[prev_exit], lng[prev_exit])
+        rest = idx[idx != entry]
+        if is_last:
+            exit_ = last
+        elif len(rest):
+            nxt = clusters[i + 1]
+            exit_ = _nearest(rest, lat, lng, lat[nxt].mean(), lng[nxt].mean())
+        else:
+            exit_ = entry
+        middle = [int(j) for j in idx if j != entry and j != exit_]
+        sequences.append([entry, *middle] + ([exit_] if exit_ != entry else []))
+        prev_exit = exit_
+    return sequences
+
+
+def merge_summaries(summaries: list[Summary]) -> Summary:
+    return Summary(
+        has_time_restrictions=any(s.has_time_restrictions for s in summaries),
+        has_toll=any(s.has_toll for s in summaries),
+        has_highway=any(s.has_highway for s in summaries),
+        has_ferry=any(s.has_ferry for s in summaries),
+        min_lat=min(s.min_lat for s in summaries),
+        min_lon=min(s.min_lon for s in summaries),
+        max_lat=max(s.max_lat for s in summaries),
+        max_lon=max(s.max_lon for s in summaries),
+        time=sum(s.time for s in summaries),
+        length=sum(s.length for s in summaries),
+        cost=sum(s.cost for s in summaries),
+    )
+
+
+def merge_trips(pieces: list[tuple[Trip, list[int]]]) -> Trip:
+    """
+    Join consecutive trips into one, recomputing the summary.
+
+    Args:
+        pieces (list[tuple[Trip, list[int]]]): Trips in travel order, each with the
+            global index of the location sent in each position. Consecutive trips
+            share their junction location, which is kept once.
+
+    Returns:
+        Trip: Merged trip with ``original_index`` pointing to the global locations.
+    """
+    locations, legs = [], []
+    for trip, indices in pieces:
+        trip_locations = [
+            loc.model_copy(update={"original_index": indices[loc.original_index]})
+            for loc in trip.locations
+        ]
+        if locations and locations[-1].original_index == trip_locations[0].original_index:
+            trip_locations = trip_locations[1:]
+        locations.extend(trip_locations)
+        legs.extend(trip.legs)
+
+    first = pieces[0][0]
+    return Trip(
+        locations=locations,
+        legs=legs,
+        summary=merge_summaries([trip.summary for trip, _ in pieces]),
+        status_message=first.status_message,
+        status=first.status,
+        units=first.units,
+        language=first.language,
+    )
+
+
+async def plan_route(
+    locations: Coordinates,
+    costing: Literal['auto', 'pedestrian', 'bicycle'] = 'auto',
+    max_distance_km: float | None = None,
+) -> Trip | None:
+    """
+    Optimal route that also works for location sets over the /optimized_route
+    distance limit.
+
+    Small sets go straight to ``get_optimal_route``. Larger ones are split into
+    regions that fit the limit, each region is optimized concurrently keeping its
+    entry and exit points fixed, and the regions are joined with /route legs into
+    a single trip. The first and last locations stay first and last.
+
+    Args:
+        locations (Coordinates): Locations to visit.
+        costing (Literal['auto', 'pedestrian', 'bicycle'], optional): Costing model.
+            Defaults to 'auto'.
+        max_distance_km (float | None, optional): Distance limit. Defaults to
+            OPTIMIZED_ROUTE_MAX_DISTANCE_KM.
+
+    Returns:
+        Trip | None: Merged trip, or None if any part failed.
+    """
+    max_km = (max_distance_km or settings.optimized_route_max_distance_km) * DISTANCE_MARGIN
+    if not exceeds_distance_limit(locations, max_distance_km):
+        return await get_optimal_route(locations, costing)
+
+    points = as_coordinate_array(locations)
+    lat, lng = points.lat, points.lng
+    first, last = 0, len(locations) - 1
+    clusters = _order_clusters(split_clusters(lat, lng, max_km), lat, lng, first, last)
+    sequences = _entry_exit_sequences(clusters, lat, lng, first, last)
+    logger.info("Splitting %d locations into %d regions", len(locations), len(sequences))
+
+    async def optimize(sequence: list[int]) -> Trip | None:
+        if len(sequence) < 2:
+            return None
+        return await get_optimal_route([locations[i] for i in sequence], costing)
+
+    async def connect(a: int, b: int) -> Trip | None:
+        try:
+            return await get_route([locations[a], locations[b]], costing)
+        except Exception as e:
+            logger.error("Connector /route %d -> %d failed: %s", a, b, e)
+            return None
+
+    connectors = [(seq[-1], nxt[0]) for seq, nxt in zip(sequences, sequences[1:])]
+    results = await asyncio.gather(
+        *(optimize(seq) for seq in sequences),
+        *(connect(a, b) for a, b in connectors),
+    )
+    region_trips, connector_trips = results[:len(sequences)], results[len(sequences):]
+
+    pieces = []
+    for i, sequence in enumerate(sequences):
+        if len(sequence) >= 2:
+            if region_trips[i] is None:
+                return None
+            pieces.append((region_trips[i], sequence))
+        if i < len(connectors):
+            if connector_trips[i] is None:
+                return None
+            pieces.append((connector_trips[i], list(connectors[i])))
+    return merge_trips(pieces)
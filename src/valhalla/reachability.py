@@ -0,0 +1,232 @@
+import asyncio
+from dataclasses import dataclass
+from logging import getLogger
+from typing import Literal
+
+import numpy as np
+
+from valhalla.coordinates import Coordinates
+from valhalla.entities import Coordinate
+from valhalla.isochrone import (
+    MAX_CONTOURS_PER_REQUEST,
+    get_isochrone_geometries,
+    get_isochrone_polygon,
+    query_points_within,
+)
+from valhalla.spatial import PointIndex
+from valhalla.valhalla import settings
+
+logger = getLogger(__name__)
+
+
+@dataclass
+class ReachabilityMatrix:
+    """
+    Result of a batch reachability query.
+
+    Attributes:
+        minutes (list[int]): Contour times, in the order of the second axis.
+        reachable (np.ndarray): Boolean array of shape (centers, minutes, points).
+            ``reachable[i, j, k]`` is True if point k is inside the isochrone of
+            center i for ``minutes[j]``.
+        failed (np.ndarray): Boolean array of shape (centers, minutes), True where
+            the isochrone could not be computed.
+    """
+
+    minutes: list[int]
+    reachable: np.ndarray
+    failed: np.ndarray
+
+    def indices(self, center: int, minutes: int) -> np.ndarray:
+        """
+        Indices of the points reachable from a center within the given time.
+
+        Args:
+            center (int): Position of the center in the input list.
+            minutes (int): One of the requested contour times.
+
+        Returns:
+            np.ndarray: Sorted indices into the input points.
+        """
+        return np.flatnonzero(self.reachable[center, self.minutes.index(minutes)])
+
+    def counts(self) -> np.ndarray:
+        """
+        Number of reachable points per center and contour, shape (centers, minutes).
+        """
+        return self.reachable.sum(axis=2)
+
+
+# Banda de los puntos fuera de todas las isócronas
+UNREACHABLE = -1
+
+
+@dataclass
+class IsochroneBands:
+    """
+    Smallest isochrone band of each point around one center.
+
+    Attributes:
+        minutes (list[int]): Contour times in ascending order.
+        band (np.ndarray): int16 array with one entry per point: the position in
+            ``minutes`` of the smallest contour containing the point, or
+            ``UNREACHABLE`` (-1).
+    """
+
+    minutes: list[int]
+    band: np.ndarray
+
+    def minutes_to_reach(self) -> np.ndarray:
+        """
+        Band upper bound in minutes per point, ``inf`` where unreachable.
+        """
+        bounds = np.append(np.asarray(self.minutes, dtype=np.float64), np.inf)
+        # band == -1 indexa el último elemento: inf
+        return bounds[self.band]
+
+    def indices(self, minutes: int) -> np.ndarray:
+        """
+        Indices of the points reachable within the given contour time.
+        """
+        j = self.minutes.index(minutes)
+        return np.flatnonzero((self.band >= 0) & (self.band <= j))
+
+    def counts(self) -> np.ndarray:
+        """
+        Number of points whose smallest band is each contour, in ``minutes`` order.
+        """
+        return np.bincount(self.band[self.band >= 0], minlength=len(self.minutes))
+
+
+async def reachable_indices(
+    center_coords: Coordinate,
+    minutes: int,
+    coords_to_check: Coordinates | PointIndex,
+    costing: Literal['auto', 'pedestrian', 'bicycle'] = 'auto',
+) -> np.ndarray:
+    """
+    Indices of the points reachable from a center, using the isochrone cache.
+
+    Same check as ``filter_by_location_polygon`` but vectorized, returning
+    indices into ``coords_to_check`` and raising on Valhalla errors instead of
+    returning an empty result.
+
+    Args:
+        center_coords (Coordinate): Isochrone center.
+        minutes (int): Contour time in minutes.
+        coords_to_check (Coordinates | PointIndex): Candidate points as a list or
+            a ``CoordinateArray``, or a ``PointIndex`` over them to reuse across
+            calls.
+        costing (Literal['auto', 'pedestrian', 'bicycle'], optional): Costing model.
+            Defaults to 'auto'.
+
+    Raises:
+        httpx.HTTPError: If the isochrone request fails.
+
+    Returns:
+        np.ndarray: Sorted indices into ``coords_to_check``.
+    """
+    polygon = await get_isochrone_polygon(center_coords, minutes, costing, settings)
+    return await query_points_within(PointIndex.from_points(coords_to_check), polygon, settings)
+
+
+async def isochrone_bands(
+    center_coords: Coordinate,
+    minutes: list[int],
+    coords_to_check: Coordinates | PointIndex,
+    costing: Literal['auto', 'pedestrian', 'bicycle'] = 'auto',
+) -> IsochroneBands:
+    """
+    Minutes-to-reach bucket of every point, from one multi-contour isochrone.
+
+    Up to 4 contours (e.g. 5/10/15/30 min) come from a single /isochrone call;
+    more are split into concurrent calls. Each contour keeps all its polygons and
+    holes, and every contour is tested against the points with a ``PointIndex``
+    query.
+
+    Args:
+        center_coords (Coordinate): Isochrone center.
+        minutes (list[int]): Contour times in minutes.
+        coords_to_check (Coordinates | PointIndex): Candidate points as a list or
+            a ``CoordinateArray``, or a ``PointIndex`` over them to reuse across
+            calls.
+        costing (Literal['auto', 'pedestrian', 'bicycle'], optional): Costing model.
+            Defaults to 'auto'.
+
+    Raises:
+        httpx.HTTPError: If an isochrone request fails.
+
+    Returns:
+        IsochroneBands: Smallest band of each point.
+    """
+    minutes = sorted(set(minutes))
+    geometries = await get_isochrone_geometries(center_coords, minutes, costing, settings)
+    index = PointIndex.from_points(coords_to_check)
+    band = np.full(len(index), UNREACHABLE, dtype=np.int16)
+
+    # De mayor a menor: la banda más pequeña sobrescribe a las mayores.
+    # No se asume que los contornos estén anidados.
+    for j in reversed(range(len(minutes))):
+        band[await query_points_within(index, geometries[minutes[j]], settings)] = j
+    return IsochroneBands(minutes=minutes, band=band)
+
+
+async def batch_filter_by_location_polygon(
+    centers: list[Coordinate],
+    minutes: list[int],
+    coords_to_check: Coordinates | PointIndex,
+    costing: Literal['auto', 'pedestrian', 'bicycle'] = 'auto',
+    max_concurrency: int = 8,
+) -> ReachabilityMatrix:
+    """
+    Check which points are reachable from each center for several time limits.
+
+    Isochrones for all centers are requested concurrently (bounded by
+    ``max_concurrency``), asking for up to 4 contours per request, and go
+    through the same isochrone cache as ``reachable_indices``. Point-in-polygon
+    tests run in bulk against a ``PointIndex`` built once over the points.
+
+    Args:
+        centers (list[Coordinate]): Isochrone centers.
+        minutes (list[int]): Contour times in minutes.
+        coords_to_check (Coordinates | PointIndex): Candidate points as a list or
+            a ``CoordinateArray``, or a ``PointIndex`` over them to reuse across
+            calls.
+        costing (Literal['auto', 'pedestrian', 'bicycle'], optional): Costing model.
+            Defaults to 'auto'.
+        max_concurrency (int, optional): Maximum in-flight isochrone requests.
+            Defaults to 8.
+
+    Returns:
+        ReachabilityMatrix: Boolean matrix of shape (centers, minutes, points).
+    """
+    minutes = list(minutes)
+    index = PointIndex.from_points(coords_to_check)
+    reachable = np.zeros((len(centers), len(minutes), len(index)), dtype=bool)
+    failed = np.zeros((len(centers), len(minutes)), dtype=bool)
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    chunks = [
+        list(range(i, min(i + MAX_CONTOURS_PER_REQUEST, len(minutes))))
+        for i in range(0, len(minutes), MAX_CONTOURS_PER_REQUEST)
+    ]
+
+    async def fetch(center_idx: int, contour_idxs: list[int]) -> None:
+        try:
+            async with semaphore:
+                geometries = await get_isochrone_geometries(
+                    centers[center_idx], [minutes[j] for j in contour_idxs], costing, settings
+                )
+        except Exception as e:
+            logger.error(f"Valhalla error (isochrone) for center {center_idx}: {e}")
+            failed[center_idx, contour_idxs] = True
+            return
+
+        for j in contour_idxs:
+            inside = await query_points_within(index, geometries[minutes[j]], settings)
+            reachable[center_idx, j, inside] = True
+
+    await asyncio.gather(
+        *(fetch(i, chunk) for i in range(len(centers)) for chunk in chunks)
+    )
+    return ReachabilityMatrix(minutes=minutes, reachable=reachable, failed=failed)
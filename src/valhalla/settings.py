@@ -1,10 +1,202 @@
+from typing import Literal
+
 from pydantic_settings import BaseSettings
 from pydantic import Field
 
 
 class Settings(BaseSettings):
     valhalla_url: str = Field(
-        ..., description="Valhalla service URL", alias="VALHALLA_URL"
+        ...,
+        description="Valhalla service URL, or several comma-separated URLs to balance across",
+        alias="VALHALLA_URL",
+    )
+
+    # Pool de conexiones del cliente HTTP compartido
+    valhalla_max_connections: int = Field(
+        20,
+        description="Maximum number of concurrent connections to Valhalla",
+        alias="VALHALLA_MAX_CONNECTIONS",
+    )
+    valhalla_max_keepalive_connections: int = Field(
+        10,
+        description="Maximum number of idle keep-alive connections kept in the pool",
+        alias="VALHALLA_MAX_KEEPALIVE_CONNECTIONS",
+    )
+    valhalla_keepalive_expiry: float = Field(
+        30.0,
+        description="Seconds an idle keep-alive connection is kept open",
+        alias="VALHALLA_KEEPALIVE_EXPIRY",
+    )
+    valhalla_http2: bool = Field(
+        False,
+        description="Use HTTP/2 when talking to Valhalla (requires httpx[http2])",
+        alias="VALHALLA_HTTP2",
+    )
+    valhalla_timeout: float = Field(
+        15.0,
+        description="Default request timeout in seconds",
+        alias="VALHALLA_TIMEOUT",
+    )
+    valhalla_endpoint_timeouts: dict[str, float] = Field(
+        default_factory=lambda: {"/isochrone": 10.0},
+        description="Per-endpoint timeouts in seconds, keyed by path",
+        alias="VALHALLA_ENDPOINT_TIMEOUTS",
+    )
+
+    # Reintentos, circuit breaker y hedging entre nodos
+    valhalla_retries: int = Field(
+        2,
+        description="Retries of a call that failed with a transport error, 429 or 5xx",
+        alias="VALHALLA_RETRIES",
+    )
+    valhalla_retry_backoff: float = Field(
+        0.1,
+        description="Base backoff in seconds between retries (exponential, jittered)",
+        alias="VALHALLA_RETRY_BACKOFF",
+    )
+    valhalla_breaker_failures: int = Field(
+        5,
+        description="Consecutive failures that open a node's circuit breaker",
+        alias="VALHALLA_BREAKER_FAILURES",
+    )
+    valhalla_breaker_reset: float = Field(
+        30.0,
+        description="Seconds an open circuit breaker waits before probing the node again",
+        alias="VALHALLA_BREAKER_RESET",
+    )
+    valhalla_hedged_endpoints: list[str] = Field(
+        default_factory=list,
+        description="Endpoints that send a second copy to another node after their p95 latency",
+        alias="VALHALLA_HEDGED_ENDPOINTS",
+    )
+    valhalla_hedge_min_delay: float = Field(
+        0.05,
+        description="Minimum seconds before sending a hedged copy",
+        alias="VALHALLA_HEDGE_MIN_DELAY",
+    )
+    valhalla_hedge_min_samples: int = Field(
+        20,
+        description="Calls of an endpoint seen before hedging it",
+        alias="VALHALLA_HEDGE_MIN_SAMPLES",
+    )
+
+    # Caché de isócronas
+    isochrone_cache_enabled: bool = Field(
+        True, description="Cache parsed isochrone polygons", alias="ISOCHRONE_CACHE_ENABLED"
+    )
+    isochrone_cache_max_bytes: int = Field(
+        64 * 1024 * 1024,
+        description="Memory budget of the isochrone cache, measured as WKB bytes",
+        alias="ISOCHRONE_CACHE_MAX_BYTES",
+    )
+    isochrone_cache_ttl: float = Field(
+        600.0,
+        description="Seconds an isochrone stays valid in the cache",
+        alias="ISOCHRONE_CACHE_TTL",
+    )
+    isochrone_cache_path: str | None = Field(
+        None,
+        description="SQLite file for the on-disk isochrone cache tier; disabled if unset",
+        alias="ISOCHRONE_CACHE_PATH",
+    )
+    # Caché de rutas
+    route_cache_enabled: bool = Field(
+        True, description="Memoize get_optimal_route results", alias="ROUTE_CACHE_ENABLED"
     )
+    route_cache_max_entries: int = Field(
+        1024, description="Maximum number of cached trips", alias="ROUTE_CACHE_MAX_ENTRIES"
+    )
+    route_cache_ttl: float = Field(
+        600.0, description="Seconds a cached trip stays valid", alias="ROUTE_CACHE_TTL"
+    )
+    route_negative_ttl: float = Field(
+        3600.0,
+        description="Seconds a known /optimized_route failure is remembered",
+        alias="ROUTE_NEGATIVE_TTL",
+    )
+    # Matrices de costes por bloques
+    matrix_block_size: int = Field(
+        50,
+        description="Maximum sources and targets per /sources_to_targets request",
+        alias="MATRIX_BLOCK_SIZE",
+    )
+    matrix_concurrency: int = Field(
+        4, description="Matrix blocks requested concurrently", alias="MATRIX_CONCURRENCY"
+    )
+    # Agrupación de consultas punto a punto en /sources_to_targets
+    batch_max_delay: float = Field(
+        0.005,
+        description="Seconds a point-to-point lookup waits for others to share its matrix call",
+        alias="BATCH_MAX_DELAY",
+    )
+    batch_max_size: int = Field(
+        50,
+        description="Pending point-to-point lookups that close a batch right away",
+        alias="BATCH_MAX_SIZE",
+    )
+    # Map matching de trazas GPS por trozos
+    trace_chunk_size: int = Field(
+        1000, description="GPS points per /trace_route request", alias="TRACE_CHUNK_SIZE"
+    )
+    trace_overlap: int = Field(
+        50,
+        description="Points shared by consecutive trace chunks to stitch them",
+        alias="TRACE_OVERLAP",
+    )
+    trace_concurrency: int = Field(
+        4, description="Trace chunks matched concurrently", alias="TRACE_CONCURRENCY"
+    )
+    # Límite de distancia de /optimized_route (service_limits de Valhalla)
+    optimized_route_max_distance_km: float = Field(
+        400.0,
+        description="Maximum distance between locations accepted by /optimized_route",
+        alias="OPTIMIZED_ROUTE_MAX_DISTANCE_KM",
+    )
+
+    # Servicio HTTP
+    api_max_in_flight: int = Field(
+        64,
+        description="Requests processed at once by the API before answering 429",
+        alias="API_MAX_IN_FLIGHT",
+    )
+    api_matrix_max_locations: int = Field(
+        500,
+        description="Maximum locations accepted by the API /matrix endpoint",
+        alias="API_MATRIX_MAX_LOCATIONS",
+    )
+    # Ejecución de las etapas de CPU fuera del bucle de eventos
+    cpu_executor: Literal['inline', 'thread', 'process'] = Field(
+        'inline',
+        description="Where JSON/trip parsing and geometry work run: inline, thread or process pool",
+        alias="CPU_EXECUTOR",
+    )
+    cpu_workers: int | None = Field(
+        None, description="Workers of the CPU thread or process pool", alias="CPU_WORKERS"
+    )
+    cpu_offload_min_bytes: int = Field(
+        64 * 1024,
+        description="Input size in bytes below which CPU work stays on the event loop",
+        alias="CPU_OFFLOAD_MIN_BYTES",
+    )
+    # Instrumentación
+    instrumentation_enabled: bool = Field(
+        False,
+        description="Record per-endpoint and per-phase latency histograms of Valhalla calls",
+        alias="INSTRUMENTATION_ENABLED",
+    )
+    otel_enabled: bool = Field(
+        False,
+        description="Emit OpenTelemetry spans for Valhalla calls (requires opentelemetry-api)",
+        alias="OTEL_ENABLED",
+    )
+    cache_precision: int = Field(
+        5,
+        description="Decimals used to round coordinates in cache keys (5 ~ 1 m)",
+        alias="CACHE_PRECISION",
+    )
+
+    @property
+    def valhalla_urls(self) -> list[str]:
+        return [url.strip() for url in self.valhalla_url.split(",") if url.strip()]
 
     model_config = {"env_file": ".env", "extra": "ignore"}
@@ -0,0 +1,82 @@
+from typing import Iterable
+
+import numpy as np
+
+
+def decode_polyline(encoded: str, precision: int = 6) -> np.ndarray:
+    """
+    Decode an encoded polyline into an (n, 2) array of [lat, lon].
+
+    Works on the whole string at once with NumPy instead of building a tuple per
+    vertex. Valhalla encodes shapes with precision 6.
+
+    Args:
+        encoded (str): Encoded polyline.
+        precision (int, optional): Number of decimals of the encoding. Defaults to 6.
+
+    Raises:
+        ValueError: If the string is truncated or has an odd number of values.
+
+    Returns:
+        np.ndarray: float64 array of shape (n, 2) with columns lat, lon.
+    """
+    if not encoded:
+        return np.empty((0, 2), dtype=np.float64)
+
+    chunks = np.frombuffer(encoded.encode("ascii"), dtype=np.uint8).astype(np.int64) - 63
+    # Cada valor es una secuencia de trozos de 5 bits; el bit 0x20 marca que sigue
+    ends = (chunks & 0x20) == 0
+    if not ends[-1]:
+        raise ValueError("Truncated polyline")
+
+    end_positions = np.flatnonzero(ends)
+    starts = np.empty_like(end_positions)
+    starts[0] = 0
+    starts[1:] = end_positions[:-1] + 1
+    value_ids = np.repeat(np.arange(len(starts)), end_positions - starts + 1)
+    offsets = np.arange(len(chunks)) - starts[value_ids]
+
+    values = np.add.reduceat((chunks & 0x1F) << (5 * offsets), starts)
+    # zigzag: el bit bajo indica signo
+    deltas = np.where(values & 1, ~(values >> 1), values >> 1)
+    if len(deltas) % 2:
+        raise ValueError("Polyline has an odd number of values")
+
+    coords = np.cumsum(deltas.reshape(-1, 2), axis=0, dtype=np.int64)
+    return coords / 10.0**precision
+
+
+def concat_shapes(shapes: Iterable[np.ndarray]) -> np.ndarray:
+    """
+    Join consecutive leg shapes into one, dropping the repeated junction vertex.
+
+    Args:
+        shapes (Iterable[np.ndarray]): (n, 2) arrays in travel order.
+
+    Returns:
+        np.ndarray: Single (n, 2) array.
+    """
+    parts = []
+    for shape in shapes:
+        if parts and len(shape) and np.array_equal(parts[-1][-1], shape[0]):
+            shape = shape[1:]
+        if len(shape):
+            parts.append(shape)
+    if not parts:
+        return np.empty((0, 2), dtype=np.float64)
+    return np.concatenate(parts)
+
+
+def slice_shape(shape: np.ndarray, begin_shape_index: int, end_shape_index: int) -> np.ndarray:
+    """
+    Vertices between two shape indices, both included, as a view (no copy).
+
+    Args:
+        shape (np.ndarray): (n, 2) leg shape.
+        begin_shape_index (int): First vertex, e.g. ``Maneuver.begin_shape_index``.
+        end_shape_index (int): Last vertex, e.g. ``Maneuver.end_shape_index``.
+
+    Returns:
+        np.ndarray: View of shape (end - begin + 1, 2).
+    """
+    return shape[begin_shape_index:end_shape_index + 1]
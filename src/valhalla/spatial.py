@@ -0,0 +1,151 @@
+import numpy as np
+import shapely
+from shapely.strtree import STRtree
+
+from valhalla.coordinates import Coordinates, as_coordinate_array
+
+# Por debajo de esto el test exacto sobre los candidatos es más barato que clasificar la rejilla
+GRID_MIN_POINTS = 8192
+# Puntos candidatos por celda al dimensionar la rejilla
+POINTS_PER_CELL = 64
+MAX_GRID_SIDE = 128
+
+
+class PointIndex:
+    """
+    Reusable index over a fixed set of points for point-in-isochrone queries.
+
+    Build it once per candidate set and query it with as many isochrones as
+    needed. Each query:
+
+    1. keeps the points inside the geometry's bounding box (STRtree);
+    2. with many candidates, lays a grid over the bounding box and classifies
+       every cell as fully inside, fully outside or crossing the boundary, with
+       one vectorized predicate over the cells;
+    3. runs the exact predicate only on the points of the boundary cells.
+
+    Points on the boundary count as inside, like ``contains or touches``.
+
+    Usage:
+        index = PointIndex.from_points(customers)
+        for polygon in isochrones:
+            reachable = index.within(polygon)
+    """
+
+    def __init__(
+        self,
+        lng: np.ndarray,
+        lat: np.ndarray,
+        points: Coordinates | None = None,
+    ) -> None:
+        """
+        Args:
+            lng (np.ndarray): Longitudes (x).
+            lat (np.ndarray): Latitudes (y).
+            points (Coordinates | None, optional): The indexed points, kept to
+                map results back to them. Defaults to None.
+        """
+        self.lng = np.ascontiguousarray(lng, dtype=np.float64)
+        self.lat = np.ascontiguousarray(lat, dtype=np.float64)
+        self.points = points
+        self._tree: STRtree | None = None
+
+    @classmethod
+    def from_points(cls, points: "Coordinates | PointIndex") -> "PointIndex":
+        """
+        Index over a list of coordinates or a ``CoordinateArray`` (whose columns
+        are used without copying). An existing index is returned as is.
+        """
+        if isinstance(points, PointIndex):
+            return points
+        # OJO: x = lng, y = lat
+        array = as_coordinate_array(points)
+        return cls(array.lng, array.lat, points)
+
+    def __len__(self) -> int:
+        return len(self.lng)
+
+    @property
+    def tree(self) -> STRtree:
+        if self._tree is None:
+            self._tree = STRtree(shapely.points(self.lng, self.lat))
+        return self._tree
+
+    def within(self, geometry: shapely.Geometry) -> np.ndarray:
+        """
+        Indices of the points inside or on the boundary of the geometry.
+
+        Args:
+            geometry (shapely.Geometry): Polygon or MultiPolygon, holes included.
+
+        Returns:
+            np.ndarray: Sorted indices into the indexed points.
+        """
+        candidates = self.tree.query(geometry)
+        if candidates.size == 0:
+            return candidates
+        candidates.sort()
+        shapely.prepare(geometry)
+        lng, lat = self.lng[candidates], self.lat[candidates]
+        if candidates.size < GRID_MIN_POINTS:
+            # intersects == contains or touches para puntos
+            return candidates[shapely.intersects_xy(geometry, lng, lat)]
+        return candidates[self._grid_mask(geometry, lng, lat)]
+
+    def mask(self, geometry: shapely.Geometry) -> np.ndarray:
+        """
+        Boolean array, True for the points inside or on the boundary.
+        """
+        result = np.zeros(len(self), dtype=bool)
+        result[self.within(geometry)] = True
+        return result
+
+    @staticmethod
+    def _grid_mask(geometry: shapely.Geometry, lng: np.ndarray, lat: np.ndarray) -> np.ndarray:
+        """
+        Exact inside test of the candidates, using grid cells to skip the points
+        far from the boundary.
+        """
+        x0, y0, x1, y1 = geometry.bounds
+        side = int(np.clip(np.sqrt(lng.size / POINTS_PER_CELL), 4, MAX_GRID_SIDE))
+        dx = (x1 - x0) / side or 1.0
+        dy = (y1 - y0) / side or 1.0
+
+        ix = np.clip(((lng - x0) / dx).astype(np.int64), 0, side - 1)
+        iy = np.clip(((lat - y0) / dy).astype(np.int64), 0, side - 1)
+        cell = iy * side + ix
+
+        # Solo se clasifican las celdas con algún punto
+        occupied = np.flatnonzero(np.bincount(cell, minlength=side * side))
+        cx, cy = occupied % side, occupied // side
+        # Celdas algo más grandes para que el redondeo de ix/iy no deje puntos fuera de su celda
+        ex, ey = dx * 1e-6, dy * 1e-6
+        boxes = shapely.box(
+            x0 + cx * dx - ex, y0 + cy * dy - ey, x0 + (cx + 1) * dx + ex, y0 + (cy + 1) * dy + ey
+        )
+        # Celda cerrada dentro: sus puntos (bordes incluidos) están dentro.
+        # Celda que no toca la geometría: sus puntos están fuera.
+        inside = shapely.contains(geometry, boxes)
+        outside = ~shapely.intersects(geometry, boxes)
+
+        state = np.zeros(side * side, dtype=np.int8)  # 0 = frontera
+        state[occupied[inside]] = 1
+        state[occupied[outside]] = -1
+        point_state = state[cell]
+
+        result = point_state == 1
+        boundary = np.flatnonzero(point_state == 0)
+        result[boundary] = shapely.intersects_xy(geometry, lng[boundary], lat[boundary])
+        return result
+
+
+def points_within(
+    lng: np.ndarray, lat: np.ndarray, geometry: shapely.Geometry | bytes
+) -> np.ndarray:
+    """
+    One-off ``PointIndex(lng, lat).within(geometry)``, with the geometry as an
+    object or as WKB. Module-level so it can run in a worker process.
+    """
+    if isinstance(geometry, bytes):
+        geometry = shapely.from_wkb(geometry)
+    return PointIndex(lng, lat).within(geometry)
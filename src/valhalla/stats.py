@@ -0,0 +1,106 @@
+import math
+from dataclasses import dataclass, field
+
+
+def _log_buckets(start: float = 0.0005, end: float = 120.0, factor: float = 1.25) -> list[float]:
+    bounds = [start]
+    while bounds[-1] < end:
+        bounds.append(bounds[-1] * factor)
+    return bounds
+
+
+DEFAULT_BUCKETS = _log_buckets()
+
+
+@dataclass
+class LatencyHistogram:
+    """
+    Fixed-size latency histogram with log-spaced buckets.
+
+    Memory does not grow with the number of observations; percentiles are
+    estimated from bucket upper bounds (about 25% resolution with the default
+    buckets).
+    """
+
+    bounds: list[float] = field(default_factory=lambda: list(DEFAULT_BUCKETS))
+    counts: list[int] = field(default_factory=list)
+    count: int = 0
+    total: float = 0.0
+    max: float = 0.0
+
+    def __post_init__(self) -> None:
+        if not self.counts:
+            # Último cubo: valores por encima del último límite
+            self.counts = [0] * (len(self.bounds) + 1)
+
+    def observe(self, seconds: float) -> None:
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        lo, hi = 0, len(self.bounds)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if seconds <= self.bounds[mid]:
+                hi = mid
+            else:
+                lo = mid + 1
+        self.counts[lo] += 1
+
+    def merge(self, other: "LatencyHistogram") -> None:
+        for i, c in enumerate(other.counts):
+            self.counts[i] += c
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, q: float) -> float:
+        """
+        Estimated q-th percentile (0-100) in seconds.
+        """
+        if not self.count:
+            return 0.0
+        rank = math.ceil(q / 100 * self.count)
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= rank:
+                return min(self.bounds[i], self.max) if i < len(self.bounds) else self.max
+        return self.max
+
+    def summary(self) -> dict[str, float]:
+        return {
+            "count": self.count,
+            "mean": self.mean,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+            "max": self.max,
+        }
+
+
+def _labels(labels: dict[str, str]) -> str:
+    return ",".join(f'{k}="{v}"' for k, v in labels.items())
+
+
+def prometheus_histogram(
+    name: str, histogram: LatencyHistogram, labels: dict[str, str] | None = None
+) -> list[str]:
+    """
+    Lines of a Prometheus text-format histogram (without HELP/TYPE headers).
+    """
+    labels = labels or {}
+    prefix = _labels(labels)
+    sep = "," if prefix else ""
+    lines = []
+    cumulative = 0
+    for bound, count in zip(histogram.bounds, histogram.counts):
+        cumulative += count
+        lines.append(f'{name}_bucket{{{prefix}{sep}le="{bound:.6g}"}} {cumulative}')
+    lines.append(f'{name}_bucket{{{prefix}{sep}le="+Inf"}} {histogram.count}')
+    lines.append(f"{name}_sum{{{prefix}}} {histogram.total}")
+    lines.append(f"{name}_count{{{prefix}}} {histogram.count}")
+    return lines
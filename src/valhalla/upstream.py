@@ -0,0 +1,153 @@
+import random
+import time
+from logging import getLogger
+
+import httpx
+
+from valhalla.stats import LatencyHistogram
+
+logger = getLogger(__name__)
+
+# Códigos que indican un problema del nodo, no de la petición
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+class UpstreamUnavailable(httpx.TransportError):
+    """
+    Every Valhalla node has its circuit breaker open.
+    """
+
+
+def is_retryable(error: Exception) -> bool:
+    """
+    Whether a failed Valhalla call may succeed if sent again (to any node).
+    """
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code in RETRYABLE_STATUS
+    return isinstance(error, httpx.TransportError)
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker.
+
+    After ``failures`` consecutive failures the breaker opens and the node gets
+    no traffic for ``reset_after`` seconds. Then a single probe request is let
+    through (half-open): success closes the breaker, failure opens it again.
+    """
+
+    def __init__(self, failures: int = 5, reset_after: float = 30.0) -> None:
+        self.max_failures = failures
+        self.reset_after = reset_after
+        self.failures = 0
+        self.opened_at: float | None = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_after:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._probing:
+            return True
+        return False
+
+    def on_request(self) -> None:
+        if self.state == "half_open":
+            self._probing = True
+
+    def abandon(self) -> None:
+        """
+        A request was cancelled before it finished; let another probe through.
+        """
+        self._probing = False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def record_failure(self) -> bool:
+        """
+        Count a failure. Returns True if this failure opened the breaker.
+        """
+        self.failures += 1
+        was_open = self.opened_at is not None
+        if self._probing or self.failures >= self.max_failures:
+            self.opened_at = time.monotonic()
+            self._probing = False
+            return not was_open
+        return False
+
+
+class Node:
+    """
+    One Valhalla instance: its HTTP client, in-flight count and breaker.
+    """
+
+    def __init__(self, url: str, client: httpx.AsyncClient, breaker: CircuitBreaker) -> None:
+        self.url = url
+        self.client = client
+        self.breaker = breaker
+        self.outstanding = 0
+
+    def __repr__(self) -> str:
+        return f"Node({self.url!r}, outstanding={self.outstanding}, {self.breaker.state})"
+
+
+class UpstreamPool:
+    """
+    Valhalla nodes balanced by least outstanding requests.
+    """
+
+    def __init__(self, nodes: list[Node]) -> None:
+        self.nodes = nodes
+        # Latencias por endpoint de todos los nodos, para el retardo del hedging
+        self.latency: dict[str, LatencyHistogram] = {}
+
+    def pick(self, exclude: set[int] | None = None) -> Node | None:
+        """
+        Available node with the fewest requests in flight, ties broken at random.
+
+        Args:
+            exclude (set[int] | None, optional): ``id()`` of nodes to skip.
+
+        Returns:
+            Node | None: The chosen node, or None if every node is excluded or
+            has its breaker open.
+        """
+        candidates = [
+            node
+            for node in self.nodes
+            if node.breaker.allow() and (not exclude or id(node) not in exclude)
+        ]
+        if not candidates:
+            return None
+        fewest = min(node.outstanding for node in candidates)
+        return random.choice([node for node in candidates if node.outstanding == fewest])
+
+    def observe(self, path: str, seconds: float) -> None:
+        histogram = self.latency.get(path)
+        if histogram is None:
+            histogram = self.latency[path] = LatencyHistogram()
+        histogram.observe(seconds)
+
+    def hedge_delay(self, path: str, min_samples: int, min_delay: float) -> float | None:
+        """
+        p95 latency of the endpoint, or None until ``min_samples`` calls are seen.
+        """
+        histogram = self.latency.get(path)
+        if histogram is None or histogram.count < min_samples:
+            return None
+        return max(histogram.percentile(95), min_delay)
+
+    async def aclose(self) -> None:
+        for node in self.nodes:
+            await node.client.aclose()
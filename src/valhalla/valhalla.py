@@ -1,72 +1,93 @@
 from typing import Literal
 import httpx
-from shapely.geometry import Point, Polygon
+import numpy as np
 
-from valhalla.entities import Trip, Coordinate
+from valhalla.cache import CachedRoute, RouteCache, get_route_cache, route_cache_key
+from valhalla.client import get_default_client
+from valhalla.coordinates import CoordinateArray, Coordinates
+from valhalla.entities import Coordinate
+from valhalla.instrumentation import get_instrumentation
+from valhalla.isochrone import get_isochrone_polygon, query_points_within
+from valhalla.offload import get_cpu_executor
+from valhalla.parsing import ParsedTrip, TripProjection, parse_trip
+from valhalla.spatial import PointIndex
 from valhalla.settings import Settings
 from logging import getLogger
 
 settings = Settings()
 logger = getLogger(__name__)
+
+
+async def _parse_trip(raw: bytes, projection: TripProjection, endpoint: str) -> ParsedTrip | None:
+    """
+    ``parse_trip`` on the CPU executor, timed as the endpoint's validate phase.
+    """
+    with get_instrumentation(settings).phase(endpoint, "validate"):
+        return await get_cpu_executor(settings).run(parse_trip, raw, projection, size=len(raw))
+
+
 async def filter_by_location_polygon(
     center_coords: Coordinate,
     minutes: int,
-    coords_to_check: list[Coordinate],
+    coords_to_check: Coordinates | PointIndex,
     costing: Literal['auto', 'pedestrian', 'bicycle'] = 'auto'
-) -> list[Coordinate]:
-    payload = {
-        "locations": [{"lat": center_coords.lat, "lon": center_coords.lng}],
-        "costing": costing,
-        "contours": [{"time": minutes}],
-        "polygons": True,
-    }
+) -> list[Coordinate] | np.ndarray:
+    """
+    Points reachable from a center within the given time.
+
+    Args:
+        center_coords (Coordinate): Isochrone center.
+        minutes (int): Contour time in minutes.
+        coords_to_check (Coordinates | PointIndex): Candidate points, as a list,
+            a ``CoordinateArray`` or a ``PointIndex`` built once to check the same
+            set against many isochrones.
+        costing (Literal['auto', 'pedestrian', 'bicycle'], optional): Costing model.
+            Defaults to 'auto'.
+
+    Returns:
+        list[Coordinate] | np.ndarray: Reachable points (inside or on the
+        isochrone boundary). For a list input, the reachable ``Coordinate``
+        objects; for a ``CoordinateArray`` (or an index over one), their sorted
+        indices into it. Empty if Valhalla fails.
+    """
+    index = PointIndex.from_points(coords_to_check)
+    as_list = isinstance(index.points, list)
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{settings.valhalla_url}/isochrone", json=payload, timeout=10
-            )
-            response.raise_for_status()
-            data = response.json()
-
-            # Primer polígono de la isócrona
-            polygon_coords = data["features"][0]["geometry"]["coordinates"][0]
-            # polygon_coords es lista de [lon, lat]
-            polygon = Polygon(polygon_coords)
+        polygon = await get_isochrone_polygon(center_coords, minutes, costing, settings)
     except Exception as e:
         logger.error(f"Valhalla error (isochrone): {e}")
-        return []
+        return [] if as_list else np.empty(0, dtype=np.intp)
 
-    # OJO: Point(lng, lat)
-    reachable = []
-    for coord in coords_to_check:
-        point = Point(coord.lng, coord.lat)
-        if polygon.contains(point) or polygon.touches(point):
-            reachable.append(coord)
+    indices = await query_points_within(index, polygon, settings)
+    if as_list:
+        return [index.points[i] for i in indices]
+    return indices
 
-    return reachable
 
-
-def _to_valhalla_coords(locs: list[Coordinate]) -> list[dict]:
+def _to_valhalla_coords(locs: Coordinates) -> list[dict]:
     """
     Convert a list of coordinates to a list of dicts as expected by Valhalla API.
 
     Args:
-        locs (listist[Coordinate]): List of coordinates to convert.
+        locs (Coordinates): List of coordinates or ``CoordinateArray`` to convert.
 
     Returns:
         list[dict]: List of dicts with "lat" and "lon" keys.
     """
+    if isinstance(locs, CoordinateArray):
+        return locs.to_valhalla()
     return [{"lat": loc.lat, "lon": loc.lng} for loc in locs]
 
 
-async def _post_valhalla(path: str, payload: dict, timeout: int = 15) -> dict:
+async def _post_valhalla(path: str, payload: dict, timeout: float | None = None) -> dict:
     """
-    Post payload to Valhalla API at given path.
+    Post payload to Valhalla API at given path using the shared pooled client.
 
     Args:
         path (str): Relative path on Valhalla API to post to.
         payload (dict): Payload to send.
-        timeout (int, optional): Timeout in seconds. Defaults to 15.
+        timeout (float | None, optional): Timeout in seconds. Defaults to the
+            endpoint timeout configured in Settings.
 
     Raises:
         httpx.HTTPStatusError: If response status code is not 200.
@@ -74,37 +95,90 @@ async def _post_valhalla(path: str, payload: dict, timeout: int = 15) -> dict:
     Returns:
         dict: JSON response from Valhalla.
     """
-    async with httpx.AsyncClient() as client:
-        res = await client.post(
-            f"{settings.valhalla_url}{path}", json=payload, timeout=timeout
-        )
-        try:
-            res.raise_for_status()
-        except httpx.HTTPStatusError as e:
-            body = e.response.text
-            logger.error(
-                "Valhalla %s %s -> %s | body=%s",
-                e.request.method,
-                e.request.url,
-                e.response.status_code,
-                body,
-            )
-            raise
-        return res.json()
+    client = get_default_client(settings)
+    return await client.post(path, payload, timeout=timeout)
+
+
+async def _post_valhalla_raw(
+    path: str, payload: dict, timeout: float | None = None
+) -> bytes:
+    """
+    Same as ``_post_valhalla`` but returns the undecoded response body.
+
+    Args:
+        path (str): Relative path on Valhalla API to post to.
+        payload (dict): Payload to send.
+        timeout (float | None, optional): Timeout in seconds. Defaults to the
+            endpoint timeout configured in Settings.
+
+    Raises:
+        httpx.HTTPStatusError: If response status code is not 200.
+
+    Returns:
+        bytes: Raw JSON response from Valhalla.
+    """
+    client = get_default_client(settings)
+    return await client.post_raw(path, payload, timeout=timeout)
+
+
+async def get_route(
+    locations: Coordinates,
+    costing: Literal['auto', 'pedestrian', 'bicycle'] = 'auto',
+    projection: TripProjection = 'full',
+) -> ParsedTrip | None:
+    """
+    Get the route visiting the locations in the given order using /route.
 
+    Args:
+        locations (Coordinates): Locations in visiting order, as a list or a
+            ``CoordinateArray``.
+        costing (Literal['auto', 'pedestrian', 'bicycle'], optional): Costing model.
+            Defaults to 'auto'.
+        projection (TripProjection, optional): How much of the response to parse.
+            Defaults to 'full'.
 
-async def get_optimal_route(locations: list[Coordinate],costing: Literal['auto', 'pedestrian', 'bicycle'] = 'auto' ) -> Trip | None:
+    Raises:
+        httpx.HTTPError: If the request fails.
+
+    Returns:
+        ParsedTrip | None: The route, or None if the response has no trip.
+    """
+    payload = {
+        "locations": _to_valhalla_coords(locations),
+        "costing": costing,
+        "units": "kilometers",
+    }
+    raw = await _post_valhalla_raw("/route", payload)
+    return await _parse_trip(raw, projection, "/route")
+
+
+async def get_optimal_route(
+    locations: Coordinates,
+    costing: Literal['auto', 'pedestrian', 'bicycle'] = 'auto',
+    projection: TripProjection = 'full',
+) -> ParsedTrip | None:
     """
     Get the optimal route between the given locations using Valhalla.
 
     The function first tries to get the optimal route using the /optimized_route endpoint.
     If that fails, it tries the simpler /route endpoint as a fallback.
 
+    Results are memoized by a canonical hash of the locations, costing and units,
+    whatever the projection, and concurrent identical calls share a single
+    upstream request. When /optimized_route rejects a location set (400, 409, 422)
+    that is remembered, so repeated calls go straight to /route. A /route
+    fallback after a transient failure is returned but not cached.
+
     Args:
-        locations (list[Coordinate]): List of coordinates for which to compute the route.
+        locations (Coordinates): List of coordinates (or ``CoordinateArray``) for
+            which to compute the route.
+        projection (TripProjection, optional): How much of the response to parse,
+            see ``parse_trip``. Use 'lazy', 'shapes' or 'summary' when maneuvers are
+            not needed. Defaults to 'full'.
 
     Returns:
-        Trip | None: The computed route as a Trip object, or None if both attempts failed.
+        ParsedTrip | None: The computed route as a Trip object (or the requested
+        projection), or None if both attempts failed.
 
     Notes:
         optimized_route will fail if the location exceed 400000 meters
@@ -116,27 +190,95 @@ async def get_optimal_route(locations: list[Coordinate],costing: Literal['auto',
         "units": "kilometers",
     }
 
-    try:
-        data = await _post_valhalla("/optimized_route", base_payload)
-        trip_data = data.get("trip")
-        if not trip_data:
-            raise ValueError("No 'trip' in optimized_route response")
-        return Trip(**trip_data)
-    except httpx.HTTPStatusError as e:
-        if e.response is None or e.response.status_code not in (400, 422, 409):
-            logger.warning(
-                "optimized_route failed with status %s; trying /route",
-                getattr(e.response, "status_code", "unknown"),
-            )
-    except Exception as e:
-        logger.warning("optimized_route failed; trying with /route", e)
+    cache = get_route_cache(settings)
+    if cache is None:
+        return await _project(await _compute_optimal_route(base_payload, projection), projection)
+
+    # La proyección no forma parte de la clave: se aplica tras la consulta
+    key = route_cache_key(
+        locations, costing, base_payload["units"], precision=settings.cache_precision
+    )
+    entry = cache.trips.get(key)
+    if entry is None:
+        entry = await cache.flights.do(
+            key, lambda: _compute_optimal_route(base_payload, projection, cache, key)
+        )
+    return await _project(entry, projection)
+
+
+async def _project(entry: CachedRoute | None, projection: TripProjection) -> ParsedTrip | None:
+    """
+    The trip of a route response in the given projection, parsed once per projection.
+    """
+    if entry is None:
+        return None
+    if projection not in entry.parsed:
+        entry.parsed[projection] = await _parse_trip(entry.raw, projection, entry.endpoint)
+    return entry.parsed[projection]
+
+
+async def _compute_optimal_route(
+    base_payload: dict,
+    projection: TripProjection = 'full',
+    cache: RouteCache | None = None,
+    key: str | None = None,
+) -> CachedRoute | None:
+    """
+    Call /optimized_route with /route as fallback, updating the route cache.
+
+    The /route fallback is only cached when /optimized_route rejected the
+    locations for good (400, 409, 422); after a transient failure (5xx,
+    timeout, transport error, no trip) it is returned without caching, so the
+    next call tries to optimize again.
+
+    Args:
+        base_payload (dict): Payload shared by both endpoints.
+        projection (TripProjection, optional): Projection parsed right away, to
+            check that the response has a trip.
+        cache (RouteCache | None, optional): Route cache to read and update.
+        key (str | None, optional): Cache key of the request.
+
+    Returns:
+        CachedRoute | None: The route response, or None if both attempts failed.
+    """
+    metrics = get_instrumentation(settings)
+    rejected = cache is not None and cache.optimized_known_to_fail(key)
+    if rejected:
+        metrics.count("/optimized_route", "skipped")
+
+    if not rejected:
+        try:
+            raw = await _post_valhalla_raw("/optimized_route", base_payload)
+            entry = CachedRoute(raw, "/optimized_route")
+            if await _project(entry, projection) is None:
+                raise ValueError("No 'trip' in optimized_route response")
+            if cache is not None:
+                cache.trips.put(key, entry)
+            return entry
+        except httpx.HTTPStatusError as e:
+            if e.response is None or e.response.status_code not in (400, 422, 409):
+                logger.warning(
+                    "optimized_route failed with status %s; trying /route",
+                    getattr(e.response, "status_code", "unknown"),
+                )
+            else:
+                # Error determinista para este conjunto: no volver a intentarlo
+                rejected = True
+                if cache is not None:
+                    cache.remember_optimized_failure(key)
+        except Exception as e:
+            logger.warning("optimized_route failed; trying with /route: %s", e)
+        metrics.count("/optimized_route", "fallback")
 
     try:
-        data = await _post_valhalla("/route", base_payload)
-        trip_data = data.get("trip")
-        if not trip_data:
+        raw = await _post_valhalla_raw("/route", base_payload)
+        entry = CachedRoute(raw, "/route")
+        if await _project(entry, projection) is None:
             return None
-        return Trip(**trip_data)
+        # Solo se guarda como "óptima" si /optimized_route nunca va a funcionar
+        if cache is not None and rejected:
+            cache.trips.put(key, entry)
+        return entry
     except Exception as e:
         logger.error("Fallback /route failed: %s", e)
         return None
@@ -0,0 +1,48 @@
+import asyncio
+import json
+import os
+from typing import Any, Coroutine
+
+import httpx
+import pytest
+
+# settings se crea al importar valhalla.valhalla
+os.environ.setdefault("VALHALLA_URL", "http://valhalla.test")
+os.environ.setdefault("VALHALLA_RETRIES", "0")
+os.environ.setdefault("ROUTE_CACHE_ENABLED", "false")
+os.environ.setdefault("ISOCHRONE_CACHE_ENABLED", "false")
+
+from stub_server import HANDLERS  # noqa: E402
+from valhalla.client import ValhallaClient, set_default_client  # noqa: E402
+from valhalla.valhalla import settings  # noqa: E402
+
+
+class Stub:
+    """
+    Default client answering with the synthetic responses of the benchmark stub.
+    """
+
+    def __init__(self) -> None:
+        self.calls: list[tuple[str, dict]] = []
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        payload = json.loads(request.content)
+        self.calls.append((request.url.path, payload))
+        return httpx.Response(200, json=HANDLERS[request.url.path](payload))
+
+    def run(self, coro: Coroutine[Any, Any, Any]) -> Any:
+        async def main() -> Any:
+            client = ValhallaClient(settings, transport=httpx.MockTransport(self.handler))
+            set_default_client(client)
+            try:
+                return await coro
+            finally:
+                await client.aclose()
+                set_default_client(None)
+
+        return asyncio.run(main())
+
+
+@pytest.fixture
+def stub() -> Stub:
+    return Stub()
@@ -0,0 +1,52 @@
+import pytest
+
+pytest.importorskip("fastapi")
+
+from fastapi.testclient import TestClient  # noqa: E402
+from valhalla import api  # noqa: E402
+
+ROUTE = {"locations": [{"lat": 36.72, "lng": -4.42}, {"lat": 36.73, "lng": -4.41}]}
+PAIR = {"origin": ROUTE["locations"][0], "destination": ROUTE["locations"][1], "geometry": True}
+
+
+async def _invalid(*args, **kwargs):
+    raise ValueError("Truncated polyline")
+
+
+@pytest.fixture
+def client() -> TestClient:
+    # Sin el lifespan: las llamadas a Valhalla se sustituyen en cada prueba
+    return TestClient(api.create_app())
+
+
+def test_route_value_error_is_422(client, monkeypatch):
+    monkeypatch.setattr(api, "get_route", _invalid)
+    response = client.post("/route", json=ROUTE)
+    assert response.status_code == 422
+    assert response.json()["detail"] == "Truncated polyline"
+
+
+def test_travel_time_value_error_is_422(client, monkeypatch):
+    monkeypatch.setattr(api, "get_pair_cost", _invalid)
+    response = client.post("/travel-time", json=PAIR)
+    assert response.status_code == 422
+
+
+def test_route_needs_two_locations(client):
+    response = client.post("/route", json={"locations": ROUTE["locations"][:1]})
+    assert response.status_code == 422
+
+
+def test_matrix_location_limit(client):
+    locations = [{"lat": 36.7, "lng": -4.4}] * (api.settings.api_matrix_max_locations + 1)
+    assert client.post("/matrix", json={"locations": locations}).status_code == 422
+
+
+def test_metrics_label_by_route_template(client, monkeypatch):
+    monkeypatch.setattr(api, "get_route", _invalid)
+    client.post("/route", json=ROUTE)
+    client.get("/unknown/path")
+    text = client.get("/metrics").text
+    assert 'path="/route"' in text
+    assert 'path="other"' in text
+    assert "/unknown/path" not in text
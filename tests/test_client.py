@@ -0,0 +1,68 @@
+import asyncio
+import gc
+
+import httpx
+import pytest
+
+from valhalla.client import ValhallaClient
+from valhalla.settings import Settings
+from valhalla.upstream import is_retryable
+
+
+def _status_error(status: int) -> httpx.HTTPStatusError:
+    request = httpx.Request("POST", "http://a.test/route")
+    response = httpx.Response(status, request=request)
+    return httpx.HTTPStatusError("", request=request, response=response)
+
+
+@pytest.mark.parametrize("status", [429, 500, 502, 503, 504])
+def test_node_errors_are_retryable(status):
+    assert is_retryable(_status_error(status))
+
+
+@pytest.mark.parametrize("status", [400, 404, 422])
+def test_request_errors_are_not_retryable(status):
+    assert not is_retryable(_status_error(status))
+
+
+def test_hedge_loser_error_is_retrieved():
+    settings = Settings(
+        VALHALLA_URL="http://a.test,http://b.test",
+        VALHALLA_RETRIES=0,
+        VALHALLA_HEDGED_ENDPOINTS=["/hedged"],
+        VALHALLA_HEDGE_MIN_SAMPLES=1,
+        VALHALLA_HEDGE_MIN_DELAY=0.01,
+        VALHALLA_BREAKER_FAILURES=100,
+    )
+    errors: list[dict] = []
+
+    async def main() -> list[bytes]:
+        asyncio.get_running_loop().set_exception_handler(
+            lambda loop, context: errors.append(context)
+        )
+        released: asyncio.Event | None = None
+
+        async def handler(request: httpx.Request) -> httpx.Response:
+            nonlocal released
+            if request.content != b"{}":
+                if released is None:
+                    # La primera copia falla justo cuando la segunda responde
+                    released = asyncio.Event()
+                    await released.wait()
+                    raise httpx.ConnectError("refused", request=request)
+                released.set()
+                released = None
+            return httpx.Response(200, content=b"{}")
+
+        bodies = []
+        async with ValhallaClient(settings, transport=httpx.MockTransport(handler)) as client:
+            # Una llamada previa para tener la latencia del endpoint
+            await client.post_raw("/hedged", {})
+            # El orden en que se miran las dos copias terminadas varía entre llamadas
+            for _ in range(20):
+                bodies.append(await client.post_raw("/hedged", {"id": 1}))
+                gc.collect()
+        return bodies
+
+    assert asyncio.run(main()) == [b"{}"] * 20
+    assert not errors
@@ -0,0 +1,52 @@
+import numpy as np
+import polyline
+
+from valhalla.entities import Leg, LegShape, Summary
+
+
+def _summary() -> Summary:
+    return Summary(
+        has_time_restrictions=False,
+        has_toll=False,
+        has_highway=False,
+        has_ferry=False,
+        min_lat=36.7,
+        min_lon=-4.5,
+        max_lat=36.8,
+        max_lon=-4.4,
+        time=60.0,
+        length=1.0,
+        cost=60.0,
+    )
+
+
+def _shape(points: list[tuple[float, float]]) -> str:
+    return polyline.encode(points, precision=6)
+
+
+def test_coordinates_are_decoded_once():
+    leg = LegShape(summary=_summary(), shape=_shape([(36.7, -4.4), (36.8, -4.5)]))
+    assert leg.coordinates is leg.coordinates
+    np.testing.assert_allclose(leg.coordinates, [[36.7, -4.4], [36.8, -4.5]])
+    assert not leg.coordinates.flags.writeable
+    assert leg.line.coords[0] == (-4.4, 36.7)
+
+
+def test_copy_with_other_shape_decodes_it():
+    leg = Leg(maneuvers=[], summary=_summary(), shape=_shape([(36.7, -4.4), (36.8, -4.5)]))
+    assert len(leg.coordinates) == 2 and leg.line.length > 0
+
+    points = [(36.7, -4.4), (36.75, -4.45), (36.8, -4.5)]
+    copy = leg.model_copy(update={"shape": _shape(points)})
+    np.testing.assert_allclose(copy.coordinates, points)
+    assert len(copy.line.coords) == 3
+    assert len(leg.coordinates) == 2
+
+    same = leg.model_copy(update={"maneuvers": []})
+    assert same.coordinates is leg.coordinates
+
+
+def test_cache_is_not_serialized():
+    leg = LegShape(summary=_summary(), shape=_shape([(36.7, -4.4), (36.8, -4.5)]))
+    leg.coordinates
+    assert set(leg.model_dump()) == {"summary", "shape"}
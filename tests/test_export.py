@@ -0,0 +1,101 @@
+import io
+import json
+
+import pytest
+
+pytest.importorskip("pyarrow")
+
+from stub_server import route_response  # noqa: E402
+from valhalla import cli  # noqa: E402
+from valhalla.cli import Checkpoint, run_batch  # noqa: E402
+from valhalla.export import TripWriter, read_trip_tables  # noqa: E402
+from valhalla.parsing import parse_trip  # noqa: E402
+
+
+def _locations(i: int) -> list[dict]:
+    return [{"lat": 36.7 + i * 0.01, "lng": -4.4}, {"lat": 36.72, "lng": -4.42 - i * 0.01}]
+
+
+def _trip(i: int):
+    payload = {"locations": [{"lat": c["lat"], "lon": c["lng"]} for c in _locations(i)]}
+    return parse_trip(json.dumps(route_response(payload)).encode())
+
+
+def _trip_ids(path) -> list[int]:
+    tables = read_trip_tables(str(path), tables=["trips"])
+    return sorted(tables["trips"].column("trip_id").to_pylist()) if tables else []
+
+
+@pytest.mark.parametrize("format", ["parquet", "arrow"])
+def test_commit_makes_parts_readable(tmp_path, format):
+    writer = TripWriter(str(tmp_path), format)
+    for i in range(3):
+        writer.write(_trip(i))
+    writer.commit()
+    assert _trip_ids(tmp_path) == [0, 1, 2]
+
+    # Sin commit las rutas siguen en una parte .tmp que no se lee
+    writer.write(_trip(3))
+    writer.flush()
+    assert _trip_ids(tmp_path) == [0, 1, 2]
+
+    writer.close()
+    assert _trip_ids(tmp_path) == [0, 1, 2, 3]
+    assert sorted(p.name for p in (tmp_path / "trips").iterdir()) == [
+        f"part-00000.{format}",
+        f"part-00001.{format}",
+    ]
+    tables = read_trip_tables(str(tmp_path))
+    assert tables["vertices"].num_rows == 8
+    assert tables["maneuvers"].column("travel_mode").to_pylist() == ["drive"] * 4
+
+
+def test_resume_after_crash_has_no_duplicate_trips(stub, tmp_path, monkeypatch):
+    monkeypatch.setattr(cli, "READ_CHUNK", 2)
+    jobs = [json.dumps({"type": "route", "locations": _locations(i)}) + "\n" for i in range(10)]
+    checkpoint_path = str(tmp_path / "jobs.ckpt")
+    trips_dir = tmp_path / "trips"
+
+    checkpoint = Checkpoint(checkpoint_path)
+    trips = TripWriter(str(trips_dir))
+
+    def crash(*args, **kwargs) -> None:
+        return None
+
+    def source():
+        for i, job in enumerate(jobs):
+            if i == 7:
+                # Un kill no guarda nada más: ni checkpoint ni partes
+                checkpoint.save = crash
+                trips.commit = crash
+                raise RuntimeError("killed")
+            yield job
+
+    with pytest.raises(RuntimeError, match="killed"):
+        stub.run(
+            run_batch(
+                source(),
+                io.StringIO(),
+                concurrency=1,
+                checkpoint=checkpoint,
+                checkpoint_every=2,
+                trips=trips,
+            )
+        )
+    resumed = Checkpoint(checkpoint_path)
+    assert 0 < resumed.watermark < 7
+    assert _trip_ids(trips_dir) == list(range(resumed.watermark))
+
+    trips = TripWriter(str(trips_dir))
+    stub.run(
+        run_batch(
+            iter(jobs),
+            io.StringIO(),
+            concurrency=1,
+            checkpoint=resumed,
+            checkpoint_every=2,
+            trips=trips,
+        )
+    )
+    trips.close()
+    assert _trip_ids(trips_dir) == list(range(10))
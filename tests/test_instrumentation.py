@@ -0,0 +1,23 @@
+from valhalla.instrumentation import Instrumentation
+
+
+def test_disabled_records_nothing():
+    metrics = Instrumentation(enabled=False)
+    metrics.count("/route", "retry")
+    with metrics.phase("/route", "parse"):
+        pass
+    assert metrics.new_trace() is None
+    assert not metrics.counters
+    assert not metrics.phases
+
+
+def test_enabled_counts_events():
+    metrics = Instrumentation(enabled=True)
+    metrics.count("/route", "retry")
+    metrics.count("/route", "retry", 2)
+    with metrics.phase("/route", "parse"):
+        pass
+    assert metrics.counters == {("/route", "retry"): 3}
+    assert metrics.phases[("/route", "parse")].count == 1
+    rendered = metrics.render_prometheus()
+    assert 'valhalla_call_events_total{endpoint="/route",event="retry"} 3' in rendered
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from valhalla.entities import TracePoint
+from valhalla.matching import join_legs, match_trace, stream_trace_route
+
+
+def _trace(n: int) -> list[TracePoint]:
+    return [TracePoint(lat=36.7 + i * 0.001, lng=-4.4 - i * 0.001, time=i) for i in range(n)]
+
+
+async def _collect(points, **kwargs):
+    return [leg async for leg in stream_trace_route(points, **kwargs)]
+
+
+@pytest.mark.parametrize("overlap", [3, 4, 7])
+@pytest.mark.parametrize("concurrency", [1, 3])
+def test_stitched_legs_cover_every_point(stub, overlap, concurrency):
+    points = _trace(25)
+    legs = stub.run(_collect(points, chunk_size=8, overlap=overlap, concurrency=concurrency))
+
+    for a, b in zip(legs, legs[1:]):
+        np.testing.assert_array_equal(a.coordinates[-1], b.coordinates[0])
+    coords = join_legs(legs).coordinates
+    expected = np.array([(p.lat, p.lng) for p in points])
+    np.testing.assert_allclose(coords, expected, atol=1e-6)
+
+
+def test_overlap_below_three_is_rejected(stub):
+    with pytest.raises(ValueError, match="between 3 and 7"):
+        stub.run(_collect(_trace(25), chunk_size=8, overlap=2))
+    assert not stub.calls
+
+
+def test_chunk_requests_share_overlap(stub):
+    stub.run(_collect(_trace(25), chunk_size=8, overlap=4))
+    shapes = [[p["lat"] for p in payload["shape"]] for _, payload in stub.calls]
+    assert [len(s) for s in shapes] == [8, 8, 8, 8, 8, 5]
+    for previous, current in zip(shapes, shapes[1:]):
+        assert previous[-4:] == current[:4]
+
+
+def test_join_legs_drops_inner_arrivals(stub):
+    legs = stub.run(_collect(_trace(25), chunk_size=8, overlap=4))
+    leg = join_legs(legs)
+    assert [m.type for m in leg.maneuvers].count(4) == 1
+    assert leg.maneuvers[-1].type == 4
+    assert leg.maneuvers[-1].end_shape_index == 24
+    assert leg.summary.length == pytest.approx(sum(part.summary.length for part in legs))
+
+
+def test_match_trace_short_trace(stub):
+    assert stub.run(match_trace(_trace(1))) is None
+    trip = stub.run(match_trace(_trace(2)))
+    assert [loc.original_index for loc in trip.locations] == [0, 1]
@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+
+from valhalla.entities import Coordinate
+from valhalla.matrix import MatrixBuilder
+
+
+def _locations(n: int, step: float) -> list[Coordinate]:
+    return [Coordinate(lat=36.7 + i * step, lng=-4.4) for i in range(n)]
+
+
+def _blocks(stub) -> int:
+    return sum(path == "/sources_to_targets" for path, _ in stub.calls)
+
+
+def test_in_memory_build(stub):
+    matrices = stub.run(MatrixBuilder(_locations(5, 0.01), block_size=2).build())
+    time = matrices["time"]
+    assert time.shape == (5, 5)
+    assert np.all(np.diag(time) == 0)
+    assert np.isfinite(time).all()
+    assert _blocks(stub) == 9
+
+
+def test_resume_requests_only_pending_blocks(stub, tmp_path):
+    locations = _locations(7, 0.01)
+    expected = stub.run(MatrixBuilder(locations, block_size=2).build())["time"]
+    stub.calls.clear()
+
+    def stop(finished, total, timing):
+        if finished == 5:
+            raise KeyboardInterrupt
+
+    builder = MatrixBuilder(locations, block_size=2, path=tmp_path, progress=stop)
+    with pytest.raises(KeyboardInterrupt):
+        stub.run(builder.build())
+    stub.calls.clear()
+
+    resumed = MatrixBuilder(locations, block_size=2, path=tmp_path)
+    assert resumed.remaining_blocks == 16 - 5
+    matrices = stub.run(resumed.build())
+    assert _blocks(stub) == 11
+    np.testing.assert_allclose(matrices["time"], expected)
+
+
+def test_other_locations_discard_previous_files(stub, tmp_path):
+    stub.run(MatrixBuilder(_locations(3, 0.01), block_size=2, path=tmp_path).build())
+    stub.calls.clear()
+
+    other = _locations(3, 0.03)
+    builder = MatrixBuilder(other, block_size=2, path=tmp_path)
+    assert builder.remaining_blocks == 4
+    matrices = stub.run(builder.build())
+    expected = stub.run(MatrixBuilder(other, block_size=2).build())["time"]
+    np.testing.assert_allclose(matrices["time"], expected)
+
+
+def test_other_block_size_discards_previous_files(stub, tmp_path):
+    stub.run(MatrixBuilder(_locations(4, 0.01), block_size=2, path=tmp_path).build())
+    builder = MatrixBuilder(_locations(4, 0.01), block_size=3, path=tmp_path)
+    assert builder.remaining_blocks == 4
+
+
+def test_added_metric_is_filled(stub, tmp_path):
+    locations = _locations(7, 0.01)
+    stub.run(MatrixBuilder(locations, block_size=3, path=tmp_path).build())
+
+    builder = MatrixBuilder(locations, metrics=("time", "distance"), block_size=3, path=tmp_path)
+    assert builder.remaining_blocks == 9
+    matrices = stub.run(builder.build())
+    assert not np.isnan(matrices["distance"]).any()
+    assert not np.isnan(matrices["time"]).any()
+
+    again = MatrixBuilder(locations, metrics=("distance",), block_size=3, path=tmp_path)
+    assert again.remaining_blocks == 0